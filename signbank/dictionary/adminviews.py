@@ -1,20 +1,48 @@
 from django.views.generic.list import ListView
 from django.views.generic.detail import DetailView
-from django.db.models import Q
-from django.http import HttpResponse
+from django.db.models import Q, Count
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.shortcuts import render_to_response, get_object_or_404
+from django.template import RequestContext
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.urlresolvers import reverse
 from django.core.exceptions import PermissionDenied
-import datetime
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+import hashlib
 import csv
 import re
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 
 from signbank.dictionary.models import *
 from signbank.dictionary.forms import *
+from signbank.dictionary.definitionsearch import matching_terms, order_by_relevance, add_definition_snippets
+from signbank.dictionary.indexes import tag_index, dictionary_order, phonology_index, gloss_completions
+from signbank.dictionary.facets import facet_counts
+from signbank.dictionary import neighbours
+from signbank.dictionary.duplicates import duplicate_keywords, REASONS
+from signbank.dictionary.ecv import build_ecv
 from signbank.feedback.models import *
 from signbank.video.forms import VideoUploadForGlossForm
 from tagging.models import Tag, TaggedItem
 
+# most glosses offered by the typeahead and the seconds a browser may
+# reuse its answer without asking again
+GLOSS_COMPLETION_LIMIT = 20
+GLOSS_COMPLETION_MAX_AGE = 60
+
+# glosses read per query by the CSV export, below the limit on
+# parameters in an SQLite query
+CSV_CHUNK_SIZE = 500
+
+
+class EchoBuffer(object):
+    """A file-like object for csv.writer that returns each line
+    written instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
 class GlossListView(ListView):
 
     model = Gloss
@@ -27,9 +55,17 @@ class GlossListView(ListView):
         context = super(GlossListView, self).get_context_data(**kwargs)
         # Add in a QuerySet of all the books
         context['searchform'] = GlossSearchForm(self.request.GET)
-        context['glosscount'] = Gloss.objects.all().count()
+        context['searchform'].add_facet_counts(facet_counts(self.object_list, self.request.GET))
+        context['glosscount'] = dictionary_order.total(True)
         context['add_gloss_form'] = GlossCreateForm()
         context['ADMIN_RESULT_FIELDS'] = settings.ADMIN_RESULT_FIELDS
+
+        # show where the definition search matched
+        defsearch = self.request.GET.get('defsearch', '')
+        if defsearch != '':
+            context['defsearch'] = defsearch
+            add_definition_snippets(context['object_list'], defsearch, self.request.GET.get('defrole', 'all'))
+
         return context
 
 
@@ -50,175 +86,89 @@ class GlossListView(ListView):
             return super(GlossListView, self).render_to_response(context)
 
     def render_to_ecv_export_response(self, context):
-        description  = 'DESCRIPTION'
-        language     = 'LANGUAGE'
-        lang_ref     = 'LANG_REF'
-
-        cv_entry_ml  = 'CV_ENTRY_ML'
-        cve_id       = 'CVE_ID'
-        cve_value    = 'CVE_VALUE'
-
-        topattributes = {'xmlns:xsi':"http://www.w3.org/2001/XMLSchema-instance",
-                         'DATE':str(datetime.date.today())+ 'T'+str(datetime.datetime.now().time()),
-                         'AUTHOR':'',
-                         'VERSION':'0.2',
-                         'xsi:noNamespaceSchemaLocation':"http://www.mpi.nl/tools/elan/EAFv2.8.xsd"}
-        top = ET.Element('CV_RESOURCE', topattributes)
-
-        for lang in settings.ECV_SETTINGS['languages']:
-            ET.SubElement(top, language, lang['attributes'])
-
-        cv_element = ET.SubElement(top, 'CONTROLLED_VOCABULARY', {'CV_ID':settings.ECV_SETTINGS['CV_ID']})
-
-        # description for cv_element
-        for lang in settings.ECV_SETTINGS['languages']:
-            myattributes = {lang_ref: lang['id']}
-            desc_element = ET.SubElement(cv_element, description, myattributes)
-            desc_element.text = lang['description']
-
-        # TODO: instead of Gloss.objects this was Gloss.none_morpheme_objects
-        for gloss in Gloss.objects.filter(excludeFromEcv=False):
-            glossid = str(gloss.pk)
-            myattributes = {cve_id: glossid, 'EXT_REF':'signbank-ecv'}
-            cve_entry_element = ET.SubElement(cv_element, cv_entry_ml, myattributes)
-
-            for lang in settings.ECV_SETTINGS['languages']:
-                langId = lang['id']
-                if len(langId) == 3:
-                    langId = [c[2] for c in settings.LANGUAGE_CODE_MAP if c[3] == langId][0]
-                desc = self.get_ecv_descripion_for_gloss(gloss, langId, settings.ECV_SETTINGS['include_phonology_and_frequencies'])
-                cve_value_element = ET.SubElement(cve_entry_element, cve_value, {description:desc, lang_ref:lang['id']})
-                cve_value_element.text = self.get_value_for_ecv(gloss, lang['annotation_idgloss_fieldname']).strip()
-
-        ET.SubElement(top, 'EXTERNAL_REF', {'EXT_REF_ID':'signbank-ecv', 'TYPE':'resource_url', 'VALUE': settings.URL + "/dictionary/gloss/"})
-
-        xmlstr = minidom.parseString(ET.tostring(top,'utf-8')).toxml()
-        import codecs
-        with codecs.open(settings.ECV_FILE, "w", "utf-8") as f:
-            f.write(xmlstr)
-
-#        tree = ET.ElementTree(top)
-#        tree.write(open(settings.ECV_FILE, 'w'), encoding ="utf-8",xml_declaration=True, method="xml")
 
-        return HttpResponse('OK <a href="' + settings.ECV_URL + '">' + settings.ECV_URL + '</a>')
+        # only rewritten if the glosses or keywords have changed since the last export
+        build_ecv()
 
-    def get_ecv_descripion_for_gloss(self, gloss, lang, include_phonology_and_frequencies=False):
-        desc = ""
-        # TODO: Add support for ECV phonology and frequencies
-        # if include_phonology_and_frequencies:
-        #     description_fields = ['handedness','domhndsh', 'subhndsh', 'handCh', 'locprim', 'relOriMov', 'movDir','movSh', 'tokNo',
-        #                   'tokNoSgnr']
-        #
-        #     for f in description_fields:
-        #         if f in settings.FIELDS['phonology']:
-        #             choice_list = FieldChoice.objects.filter(field__iexact=fieldname_to_category(f))
-        #             machine_value = getattr(gloss,f)
-        #             value = machine_value_to_translated_human_value(machine_value,choice_list,lang)
-        #             if value is None:
-        #                 value = ' '
-        #         else:
-        #             value = self.get_value_for_ecv(gloss,f)
-        #
-        #         if f == 'handedness':
-        #             desc = value
-        #         elif f == 'domhndsh':
-        #             desc = desc+ ', ('+ value
-        #         elif f == 'subhndsh':
-        #             desc = desc+','+value
-        #         elif f == 'handCh':
-        #             desc = desc+'; '+value+')'
-        #         elif f == 'tokNo':
-        #             desc = desc+' ['+value
-        #         elif f == 'tokNoSgnr':
-        #             desc = desc+'/'+value+']'
-        #         else:
-        #             desc = desc+', '+value
-
-        if desc:
-            desc += ", "
-
-        trans = [t.translation.text for t in gloss.translation_set.all()]
-        desc += ", ".join(
-            # The next line was adapted from an older version of this code,
-            # that happened to do nothing. I left this for future usage.
-            #map(lambda t: str(t.encode('ascii','xmlcharrefreplace')) if isinstance(t, unicode) else t, trans)
-            trans
-        )
-
-        return desc
-
-    def get_value_for_ecv(self, gloss, fieldname):
-        try:
-            value = getattr(gloss, 'get_'+fieldname+'_display')()
-
-        except AttributeError:
-            value = getattr(gloss,fieldname)
-
-        # This was disabled with the move to python 3... might not be needed anymore
-        # if isinstance(value,unicode):
-        #     value = str(value.encode('ascii','xmlcharrefreplace'))
-
-        if value is None:
-           value = " "
-        elif not isinstance(value,str):
-            value = str(value)
-
-        if value == '-':
-            value = ' '
-        return value
+        return HttpResponse('OK <a href="' + settings.ECV_URL + '">' + settings.ECV_URL + '</a>')
 
     def render_to_csv_response(self, context):
 
         if not self.request.user.has_perm('dictionary.export_csv'):
             raise PermissionDenied
 
-        # Create the HttpResponse object with the appropriate CSV header.
-        response = HttpResponse(content_type='text/csv')
+        # the rows are generated as the response is sent so that the
+        # whole export is never held in memory
+        response = StreamingHttpResponse(self.csv_rows(), content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="dictionary-export.csv"'
 
+        return response
+
+    def csv_rows(self):
+        """Generate the lines of the CSV export, reading the glosses with
+        their keywords, tags and notes a chunk at a time"""
 
-        fields = [f.name for f in Gloss._meta.fields]
+        advanced = self.request.user.has_perm('dictionary.view_advanced_properties')
+        unpublished = self.request.user.has_perm('dictionary.can_view_unpub_defs')
 
+        # leave out the internal search key columns
+        fields = [f.name for f in Gloss._meta.fields if f.editable]
+
+        writer = csv.writer(EchoBuffer())
+        qs = self.get_queryset()
 
-        writer = csv.writer(response)
         header = [Gloss._meta.get_field(f).verbose_name for f in fields]
         header.append("Keywords")
         header.append("Tags")
-        if self.request.user.has_perm('dictionary.view_advanced_properties'):
-            # Find out how many extra rows there are for notes
-            note_count = 0
-            for gloss in self.get_queryset():
-                new_max = gloss.definition_set.count()
-                if new_max > note_count:
-                    note_count = new_max
+        if advanced:
+            # the most notes of any exported gloss gives the number of note columns
+            most = Gloss.objects.filter(pk__in=qs.order_by().values('pk')).annotate(n=Count('definition')) \
+                                .order_by('-n').values_list('n', flat=True)[:1]
+            note_count = most[0] if most else 0
             # Add headers for them
             for _ in range(note_count):
                 header.append("Note ID")
                 header.append("Note Published")
                 header.append("Note Role")
                 header.append("Note Text")
-        writer.writerow(header)
-
-
-        for gloss in self.get_queryset():
-            row = []
-            for f in fields:
-                row.append(getattr(gloss, f))
-
-            # get translations
-            trans = [t.translation.text for t in gloss.translation_set.all()]
-            row.append(", ".join(trans))
-
-            # get tags
-            tags = [t.name for t in gloss.tags.all()]
-            row.append(", ".join(tags))
-
-            # Add definitions/notes
-            if self.request.user.has_perm('dictionary.view_advanced_properties'):
+        yield writer.writerow(header)
+
+        ctype = ContentType.objects.get_for_model(Gloss)
+        # the ordering may be on an annotation (the relevance of a definition
+        # search) which has to be selected with the ids
+        ids = [row[0] for row in qs.values_list('pk', *qs.query.aggregates.keys())]
+        for start in range(0, len(ids), CSV_CHUNK_SIZE):
+            chunk = ids[start:start + CSV_CHUNK_SIZE]
+            glosses = Gloss.objects.in_bulk(chunk)
+
+            keywords = dict()
+            for gloss_id, text in Translation.objects.filter(gloss__in=chunk).values_list('gloss', 'translation__text'):
+                keywords.setdefault(gloss_id, []).append(text)
+
+            tags = dict()
+            for gloss_id, name in TaggedItem.objects.filter(content_type=ctype, object_id__in=chunk) \
+                                                    .order_by('tag__name').values_list('object_id', 'tag__name'):
+                tags.setdefault(gloss_id, []).append(name)
+
+            notes = dict()
+            if advanced:
+                for defi in Definition.objects.filter(gloss__in=chunk):
+                    notes.setdefault(defi.gloss_id, []).append(defi)
+
+            for pk in chunk:
+                gloss = glosses[pk]
+                row = []
+                for f in fields:
+                    row.append(getattr(gloss, f))
+
+                row.append(", ".join(keywords.get(pk, [])))
+                row.append(", ".join(tags.get(pk, [])))
+
+                # Add definitions/notes
                 count = 0
-                for defi in gloss.definition_set.all():
+                for defi in notes.get(pk, []):
                     count += 1
-                    if defi.published or self.request.user.has_perm('dictionary.can_view_unpub_defs'):
+                    if defi.published or unpublished:
                         row.append(str(count))
                         if defi.published:
                             row.append("Published")
@@ -228,24 +178,23 @@ class GlossListView(ListView):
                         row.append(string.replace(rd, ';', ','))
                         row.append(string.replace(defi.text, ';', ','))
 
-            # Make it safe for non-ascii
-            safe_row = [];
-            for column in row:
-                if type(column) is unicode:
-                    col = column.encode('utf8').decode('ascii', 'ignore')
-                else:
-                    col = str(column)
-                safe_row.append(col)
-
-            writer.writerow(safe_row)
+                # Make it safe for non-ascii
+                safe_row = [];
+                for column in row:
+                    if type(column) is unicode:
+                        col = column.encode('utf8').decode('ascii', 'ignore')
+                    else:
+                        col = str(column)
+                    safe_row.append(col)
 
-        return response
+                yield writer.writerow(safe_row)
 
 
     def get_queryset(self):
 
-        # get query terms from self.request
-        qs = Gloss.objects.all()
+        # get query terms from self.request, the display video is
+        # used for the thumbnail in each row
+        qs = Gloss.objects.all().select_related('display_video')
 
         #print "QS:", len(qs)
 
@@ -254,18 +203,26 @@ class GlossListView(ListView):
 
         if get.has_key('search') and get['search'] != '':
             val = get['search']
-            query = Q(idgloss__istartswith=val) | \
-                    Q(annotation_idgloss__istartswith=val)
+            key = normalise_search_key(val)
+            if key:
+                query = Q(idgloss_search__startswith=key) | \
+                        Q(annotation_idgloss_search__startswith=key)
 
-            if re.match('^\d+$', val):
-                query = query | Q(sn__exact=val)
+                if re.match('^\d+$', val):
+                    query = query | Q(sn__exact=val)
 
-            qs = qs.filter(query)
+                qs = qs.filter(query)
+            else:
+                # nothing but punctuation, an empty key would match everything
+                qs = qs.none()
             #print "A: ", len(qs)
 
         if get.has_key('keyword') and get['keyword'] != '':
-            val = get['keyword']
-            qs = qs.filter(translation__translation__text__istartswith=val)
+            key = normalise_search_key(get['keyword'])
+            if key:
+                qs = qs.filter(translation__translation__text_search__startswith=key)
+            else:
+                qs = qs.none()
 
 
         if get.has_key('inWeb') and get['inWeb'] != 'unspecified':
@@ -285,73 +242,14 @@ class GlossListView(ListView):
             qs = qs.filter(definition__published=val)
 
 
-        ## phonology field filters
-        if get.has_key('domhndsh') and get['domhndsh'] != '':
-            val = get['domhndsh']
-            qs = qs.filter(domhndsh__exact=val)
-
-            #print "C :", len(qs)
-
-        if get.has_key('subhndsh') and get['subhndsh'] != '':
-            val = get['subhndsh']
-            qs = qs.filter(subhndsh__exact=val)
-            #print "D :", len(qs)
-
-        if get.has_key('final_domhndsh') and get['final_domhndsh'] != '':
-            val = get['final_domhndsh']
-            qs = qs.filter(final_domhndsh__exact=val)
-            #print "E :", len(qs)
-
-        if get.has_key('final_subhndsh') and get['final_subhndsh'] != '':
-            val = get['final_subhndsh']
-            qs = qs.filter(final_subhndsh__exact=val)
-           # print "F :", len(qs)
-
-        if get.has_key('locprim') and get['locprim'] != '':
-            val = get['locprim']
-            qs = qs.filter(locprim__exact=val)
-            #print "G :", len(qs)
-
-        if get.has_key('locsecond') and get['locsecond'] != '':
-            val = get['locsecond']
-            qs = qs.filter(locsecond__exact=val)
-
-            #print "H :", len(qs)
-
-        if get.has_key('final_loc') and get['final_loc'] != '':
-            val = get['final_loc']
-            qs = qs.filter(final_loc__exact=val)
-
-
-
-        if get.has_key('initial_relative_orientation') and get['initial_relative_orientation'] != '':
-            val = get['initial_relative_orientation']
-            qs = qs.filter(initial_relative_orientation__exact=val)
-
-        if get.has_key('final_relative_orientation') and get['final_relative_orientation'] != '':
-            val = get['final_relative_orientation']
-            qs = qs.filter(final_relative_orientation__exact=val)
-
-        if get.has_key('initial_palm_orientation') and get['initial_palm_orientation'] != '':
-            val = get['initial_palm_orientation']
-            qs = qs.filter(initial_palm_orientation__exact=val)
-
-        if get.has_key('final_palm_orientation') and get['final_palm_orientation'] != '':
-            val = get['final_palm_orientation']
-            qs = qs.filter(final_palm_orientation__exact=val)
-
-        if get.has_key('initial_secondary_loc') and get['initial_secondary_loc'] != '':
-            val = get['initial_secondary_loc']
-            qs = qs.filter(initial_secondary_loc__exact=val)
-
-        if get.has_key('final_secondary_loc') and get['final_secondary_loc'] != '':
-            val = get['final_secondary_loc']
-            qs = qs.filter(final_secondary_loc__exact=val)
-
-           # print "G :", len(qs)
-        # end of phonology filters
+        ## phonology field filters, answered from the in-memory phonology index
+        filters = dict([(field, get[field]) for field in phonology_index.fields
+                        if get.has_key(field) and get[field] != ''])
+        if filters:
+            qs = phonology_index.filter(qs, filters)
 
 
+        terms = None
         if get.has_key('defsearch') and get['defsearch'] != '':
 
             val = get['defsearch']
@@ -361,10 +259,10 @@ class GlossListView(ListView):
             else:
                 role = 'all'
 
-            if role == 'all':
-                qs = qs.filter(definition__text__icontains=val)
-            else:
-                qs = qs.filter(definition__text__icontains=val, definition__role__exact=role)
+            # look up the words in the definition index, the glosses are
+            # ranked by how often the words occur below
+            terms = matching_terms(val, role)
+            qs = qs.filter(pk__in=terms.values('gloss'))
 
 
 
@@ -381,42 +279,22 @@ class GlossListView(ListView):
 
             #print "I :", len(qs)
 
+        # tag filters are answered from the in-memory tag index, tags
+        # is an implicit AND and nottags an implicit OR
         if get.has_key('tags') and get['tags'] != '':
-            vals = get.getlist('tags')
-
-            tags = []
-            for t in vals:
-                tags.extend(Tag.objects.filter(name=t))
-
-
-            # search is an implicit AND so intersection
-            tqs = TaggedItem.objects.get_intersection_by_model(Gloss, tags)
-
-            # intersection
-            qs = qs & tqs
+            qs = tag_index.filter(qs, tags=get.getlist('tags'))
 
             #print "J :", len(qs)
 
-        qs = qs.distinct()
-
         if get.has_key('nottags') and get['nottags'] != '':
-            vals = get.getlist('nottags')
-
-           # print "NOT TAGS: ", vals
-
-            tags = []
-            for t in vals:
-                tags.extend(Tag.objects.filter(name=t))
-
-            # search is an implicit OR so union
-            tqs = TaggedItem.objects.get_union_by_model(Gloss, tags)
-
-           # print "NOT", tags, len(tqs)
-            # exclude all of tqs from qs
-            qs = [q for q in qs if q not in tqs]
+            qs = tag_index.filter(qs, nottags=get.getlist('nottags'))
 
            # print "K :", len(qs)
 
+        qs = qs.distinct()
+
+        if terms is not None:
+            qs = order_by_relevance(qs, terms).select_related('display_video')
 
        # print "Final :", len(qs)
         return qs
@@ -442,23 +320,128 @@ class GlossDetailView(DetailView):
         context['interpform'] = InterpreterFeedbackForm()
         context['SIGN_NAVIGATION']  = settings.SIGN_NAVIGATION
         if settings.SIGN_NAVIGATION:
-            context['glosscount'] = Gloss.objects.count()
-            context['glossposn'] =  Gloss.objects.filter(sn__lt=context['gloss'].sn).count()+1
+            (context['glossposn'], context['glosscount']) = dictionary_order.position(context['gloss'], True)
+        context['neighbours'] = similar_glosses(context['gloss'])
         return context
 
 
-def gloss_ajax_complete(request, prefix):
-    """Return a list of glosses matching the search term
-    as a JSON structure suitable for typeahead."""
+def similar_glosses(gloss, count=neighbours.DEFAULT_COUNT):
+    """Return [(gloss, score)] for the signs that look most like gloss"""
+
+    found = neighbours.neighbours(gloss.pk, count)
+    glosses = Gloss.objects.in_bulk([pk for pk, score in found])
+    return [(glosses[pk], score) for pk, score in found if pk in glosses]
+
 
+def gloss_neighbours_json(request, glossid):
+    """Return the signs that look most like a gloss as JSON"""
 
-    query = Q(idgloss__istartswith=prefix) | \
-            Q(annotation_idgloss__istartswith=prefix) | \
-            Q(sn__startswith=prefix)
-    qs = Gloss.objects.filter(query)
+    gloss = get_object_or_404(Gloss, pk=glossid)
+    try:
+        count = min(int(request.GET.get('count', neighbours.DEFAULT_COUNT)), 100)
+    except ValueError:
+        count = neighbours.DEFAULT_COUNT
 
     result = []
-    for g in qs:
-        result.append({'idgloss': g.idgloss, 'annotation_idgloss': g.annotation_idgloss, 'sn': g.sn, 'pk': "%s (%s)" % (g.idgloss, g.pk)})
+    for other, score in similar_glosses(gloss, count):
+        result.append({'pk': other.pk, 'idgloss': other.idgloss, 'annotation_idgloss': other.annotation_idgloss,
+                       'sn': other.sn, 'score': score,
+                       'url': reverse('dictionary:admin_gloss_view', kwargs={'pk': other.pk})})
 
     return HttpResponse(json.dumps(result), {'content-type': 'application/json'})
+
+
+def minimal_pairs_view(request):
+    """The minimal pairs found by the find_minimal_pairs command, filtered
+    by parameter and by whether both signs are in the web dictionary"""
+
+    pairs = MinimalPair.objects.all().select_related('source', 'target')
+
+    parameter = request.GET.get('parameter', '')
+    if parameter in phonology_index.fields:
+        pairs = pairs.filter(parameter=parameter)
+
+    inweb = request.GET.get('inWeb', 'unspecified')
+    if inweb == 'yes':
+        pairs = pairs.filter(source__inWeb=True, target__inWeb=True)
+    elif inweb == 'no':
+        pairs = pairs.filter(Q(source__inWeb=False) | Q(target__inWeb=False))
+
+    paginator = Paginator(pairs, 100)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    # the two values that differ, for display
+    for pair in page.object_list:
+        choices = dict(Gloss._meta.get_field(pair.parameter).flatchoices)
+        pair.values = [choices.get(getattr(g, pair.parameter), getattr(g, pair.parameter))
+                       for g in (pair.source, pair.target)]
+        pair.label = Gloss._meta.get_field(pair.parameter).verbose_name
+
+    counts = dict(MinimalPair.objects.order_by().values_list('parameter').annotate(n=Count('pk')))
+    parameters = [(field, Gloss._meta.get_field(field).verbose_name, counts.get(field, 0))
+                  for field in phonology_index.fields]
+
+    return render_to_response("dictionary/minimal_pairs.html",
+                              {'paginator': paginator,
+                               'page': page,
+                               'parameters': parameters,
+                               'parameter': parameter,
+                               'inWeb': inweb},
+                              context_instance=RequestContext(request))
+
+
+def duplicates_view(request):
+    """The possible duplicate glosses found by the find_duplicates command,
+    filtered by the block they were found in, and the keywords that differ
+    only in case or punctuation"""
+
+    pairs = DuplicateGloss.objects.all().select_related('source', 'target')
+
+    reason = request.GET.get('reason', '')
+    if reason in REASONS:
+        pairs = pairs.filter(reasons__contains=reason)
+
+    paginator = Paginator(pairs, 100)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    return render_to_response("dictionary/duplicates.html",
+                              {'paginator': paginator,
+                               'page': page,
+                               'reasons': REASONS,
+                               'reason': reason,
+                               'keywords': duplicate_keywords()},
+                              context_instance=RequestContext(request))
+
+
+def gloss_completion_etag(request, prefix):
+    """The ETag of a typeahead response, changing with the prefix and
+    whenever a gloss name or sign number changes"""
+
+    key = u"%s:%s" % (gloss_completions.current_generation(), prefix)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+@condition(etag_func=gloss_completion_etag)
+def gloss_ajax_complete(request, prefix):
+    """Return a list of glosses matching the search term
+    as a JSON structure suitable for typeahead, exact matches
+    first and at most GLOSS_COMPLETION_LIMIT of them."""
+
+    result = []
+    for pk, idgloss, annotation_idgloss, sn in gloss_completions.complete(prefix, GLOSS_COMPLETION_LIMIT):
+        result.append({'idgloss': idgloss, 'annotation_idgloss': annotation_idgloss, 'sn': sn, 'pk': "%s (%s)" % (idgloss, pk)})
+
+    response = HttpResponse(json.dumps(result), {'content-type': 'application/json'})
+    # browsers may reuse the answer for a prefix, revalidating with the etag
+    patch_cache_control(response, private=True, max_age=GLOSS_COMPLETION_MAX_AGE)
+    return response
@@ -0,0 +1,142 @@
+"""Word search over definitions and notes using the DefinitionTerm index.
+
+The matching and ranking are done in the database: a word of the query
+matches the terms it is a prefix of, or only the same term if it is
+shorter than MIN_PREFIX_LENGTH since a letter or two would match most
+of the index."""
+
+from django.db.models import Q, Sum
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+import re
+
+from signbank.dictionary.models import Definition, DefinitionTerm, normalise_search_key, search_words
+
+# words shorter than this only match a term exactly
+MIN_PREFIX_LENGTH = 3
+
+
+def word_filter(word):
+    """The filter on DefinitionTerm for the terms matching a query word"""
+
+    if len(word) < MIN_PREFIX_LENGTH:
+        return Q(term__exact=word)
+    return Q(term__startswith=word)
+
+
+def word_matches(word, term):
+    """True if a query word matches a (normalised) term"""
+
+    if len(word) < MIN_PREFIX_LENGTH:
+        return term == word
+    return term.startswith(word)
+
+
+def matching_terms(query, role='all', published=None):
+    """A DefinitionTerm queryset of the terms matching the words in query
+    in the definitions that contain all of the words.  Restricted to
+    definitions with the given role unless role is 'all' and to published
+    or unpublished definitions if published is not None."""
+
+    words = search_words(query)
+    if not words:
+        return DefinitionTerm.objects.none()
+
+    terms = DefinitionTerm.objects.all()
+    if role != 'all':
+        terms = terms.filter(role__exact=role)
+    if published is not None:
+        terms = terms.filter(published__exact=published)
+
+    # each word narrows the definitions with a subquery
+    definitions = Definition.objects.all()
+    match = None
+    for word in words:
+        definitions = definitions.filter(pk__in=terms.filter(word_filter(word)).values('definition'))
+        if match is None:
+            match = word_filter(word)
+        else:
+            match = match | word_filter(word)
+
+    return terms.filter(match, definition__in=definitions)
+
+
+def search_definitions(query, role='all', published=None):
+    """Find glosses with a definition containing all the words in query,
+    see matching_terms.
+
+    Returns a dictionary mapping gloss id to a relevance score, the
+    number of occurrences of the query words in matching definitions."""
+
+    terms = matching_terms(query, role, published)
+    return dict(terms.order_by().values_list('gloss').annotate(score=Sum('frequency')))
+
+
+def order_by_relevance(qs, terms):
+    """Restrict a Gloss queryset to the glosses of terms (from
+    matching_terms) ordered by their relevance, the sum of the term
+    frequencies, highest first and then by idgloss.
+
+    The ranking is done over the glosses of qs by id, so that joins in qs
+    (eg. to regions) don't count a term more than once."""
+
+    ranked = qs.model.objects.filter(pk__in=qs.values('pk'), definitionterm__in=terms)
+    return ranked.annotate(relevance=Sum('definitionterm__frequency')).order_by('-relevance', 'idgloss')
+
+
+def highlight_snippet(text, query, width=120):
+    """Return an extract of text around the first word matching query
+    with all matching words wrapped in <strong>, or None if no
+    word matches. The result is HTML safe."""
+
+    words = search_words(query)
+    hits = [m for m in re.finditer(r'\w+', text, re.UNICODE)
+            if any([word_matches(w, normalise_search_key(m.group())) for w in words])]
+    if not hits:
+        return None
+
+    start = max(0, hits[0].start() - width // 3)
+    # don't start in the middle of a word
+    if start > 0:
+        space = text.find(' ', start)
+        if space != -1 and space < hits[0].start():
+            start = space + 1
+    end = min(len(text), start + width)
+
+    parts = []
+    if start > 0:
+        parts.append('&hellip;')
+    position = start
+    for m in hits:
+        if m.start() < start:
+            continue
+        if m.end() > end:
+            break
+        parts.append(escape(text[position:m.start()]))
+        parts.append('<strong>%s</strong>' % escape(m.group()))
+        position = m.end()
+    parts.append(escape(text[position:end]))
+    if end < len(text):
+        parts.append('&hellip;')
+
+    return mark_safe(''.join(parts))
+
+
+def add_definition_snippets(glosses, query, role='all'):
+    """Set the attribute definition_snippet on each gloss to a highlighted
+    extract of its first definition that matches query"""
+
+    glosses = list(glosses)
+    defs = Definition.objects.filter(gloss__in=[g.pk for g in glosses])
+    if role != 'all':
+        defs = defs.filter(role__exact=role)
+
+    snippets = dict()
+    for defn in defs:
+        if defn.gloss_id not in snippets:
+            snippet = highlight_snippet(defn.text, query)
+            if snippet:
+                snippets[defn.gloss_id] = snippet
+
+    for gloss in glosses:
+        gloss.definition_snippet = snippets.get(gloss.pk)
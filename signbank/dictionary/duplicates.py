@@ -0,0 +1,155 @@
+"""Near-duplicate glosses and keywords.
+
+Duplicate entries creep in through ingest_csv, add_gloss and keyword
+edits: idglosses that differ only in case, punctuation or a trailing
+number, glosses with the same keywords and phonology.  Rather than
+comparing every pair of glosses, each gloss is put into three blocks:
+
+ - its normalised idgloss with any trailing digits removed
+ - the set of its normalised keywords
+ - its phonology, if at least MINIMUM_VALUES fields are filled in
+
+and only glosses sharing a block are compared.  Blocks with more than
+MAX_BLOCK glosses (a very common keyword set, say) say nothing useful
+about any one pair and are skipped.  Each candidate pair is scored by a
+weighted sum of the similarity of the names, the overlap of the keywords
+and the agreement of the phonology, and pairs scoring MINIMUM_SCORE or
+more are kept.  Glosses already related to each other (homophones,
+variants...) are not reported.
+
+Keywords that differ only by case, whitespace or punctuation share a
+text_search key and are found with one grouped query.
+"""
+
+from django.db import transaction
+from django.db.models import Count
+
+import difflib
+import re
+
+from signbank.dictionary.models import Gloss, Keyword, Translation, Relation, DuplicateGloss, normalise_search_key
+from signbank.dictionary.indexes import phonology_index
+from signbank.dictionary.minimalpairs import MINIMUM_VALUES
+
+NAME_WEIGHT = 0.5
+KEYWORD_WEIGHT = 0.25
+PHONOLOGY_WEIGHT = 0.25
+
+MINIMUM_SCORE = 0.5
+MAX_BLOCK = 50
+
+REASONS = ('name', 'keywords', 'phonology')
+
+
+def name_key(idgloss):
+    """The normalised idgloss without any trailing number, so that
+    'HOUSE', 'house2' and 'HOUSE (2)' have the same key"""
+
+    key = normalise_search_key(idgloss)
+    return re.sub(r'[\d\s]+$', '', key) or key
+
+
+def keyword_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return float(len(a & b)) / len(a | b)
+
+
+def phonology_similarity(a, b):
+    """The fraction of the fields set in either gloss that agree"""
+
+    if a is None or b is None:
+        return 0.0
+    used = [(x, y) for x, y in zip(a, b) if x is not None or y is not None]
+    if not used:
+        return 0.0
+    return float(len([1 for x, y in used if x == y])) / len(used)
+
+
+def score(a, b):
+    """Score two glosses, each (name key, keyword set, phonology values)"""
+
+    if a[0] == b[0]:
+        name = 1.0
+    else:
+        name = difflib.SequenceMatcher(None, a[0], b[0]).ratio()
+    return NAME_WEIGHT * name + \
+           KEYWORD_WEIGHT * keyword_similarity(a[1], b[1]) + \
+           PHONOLOGY_WEIGHT * phonology_similarity(a[2], b[2])
+
+
+def find_duplicates(glosses, related=()):
+    """Given a dictionary of gloss id -> (name key, keyword set, phonology
+    values or None), return a list of (source id, target id, score, reasons)
+    with source < target, best first.  Pairs in related are left out."""
+
+    blocks = dict()
+    for gloss_id, (name, keywords, phonology) in glosses.items():
+        if name:
+            blocks.setdefault(('name', name), []).append(gloss_id)
+        if keywords:
+            blocks.setdefault(('keywords', keywords), []).append(gloss_id)
+        if phonology is not None:
+            blocks.setdefault(('phonology', phonology), []).append(gloss_id)
+
+    candidates = dict()
+    for (reason, key), ids in blocks.items():
+        if len(ids) < 2 or len(ids) > MAX_BLOCK:
+            continue
+        ids.sort()
+        for i, a in enumerate(ids):
+            for b in ids[i+1:]:
+                candidates.setdefault((a, b), set()).add(reason)
+
+    related = set(related)
+    found = []
+    for (a, b), reasons in candidates.items():
+        if (a, b) in related or (b, a) in related:
+            continue
+        s = score(glosses[a], glosses[b])
+        if s >= MINIMUM_SCORE:
+            found.append((a, b, s, ",".join([r for r in REASONS if r in reasons])))
+    found.sort(key=lambda (a, b, s, reasons): (-s, a, b))
+    return found
+
+
+def gloss_records():
+    """Read the name key, keywords and phonology of every gloss"""
+
+    fields = phonology_index.fields
+    glosses = dict()
+    for row in Gloss.objects.values_list('pk', 'idgloss', *fields).iterator():
+        values = phonology_index.values(row[2:])
+        if len([v for v in values if v is not None]) < MINIMUM_VALUES:
+            values = None
+        glosses[row[0]] = (name_key(row[1]), set(), values)
+
+    for gloss_id, key in Translation.objects.values_list('gloss', 'translation__text_search').iterator():
+        if key and gloss_id in glosses:
+            glosses[gloss_id][1].add(key)
+
+    return dict([(pk, (name, frozenset(keywords), values)) for pk, (name, keywords, values) in glosses.items()])
+
+
+def update_duplicates():
+    """Recompute the DuplicateGloss table, returns the number of pairs"""
+
+    related = Relation.objects.values_list('source', 'target')
+    pairs = find_duplicates(gloss_records(), related)
+    with transaction.atomic():
+        DuplicateGloss.objects.all().delete()
+        DuplicateGloss.objects.bulk_create([DuplicateGloss(source_id=a, target_id=b, score=s, reasons=reasons)
+                                            for a, b, s, reasons in pairs],
+                                           batch_size=500)
+    return len(pairs)
+
+
+def duplicate_keywords():
+    """Return a list of lists of the keywords that share a search key"""
+
+    counts = Keyword.objects.exclude(text_search='').order_by().values_list('text_search').annotate(n=Count('pk'))
+    keys = [key for key, n in counts.filter(n__gt=1)]
+    groups = dict()
+    for key, text in Keyword.objects.filter(text_search__in=keys).values_list('text_search', 'text'):
+        groups.setdefault(key, []).append(text)
+    return [sorted(groups[key]) for key in sorted(groups.keys())]
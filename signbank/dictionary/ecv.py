@@ -0,0 +1,141 @@
+"""The ELAN controlled vocabulary (ECV) file of the glosses.
+
+The ECV lists every gloss not excluded from it with its annotation id
+gloss in each of the ECV_SETTINGS languages and its keywords as the
+description (ECV_SETTINGS['include_phonology_and_frequencies'] is not used,
+the export this replaced never put phonology in the description).  The XML is written entry by entry straight to a temporary
+file beside ECV_FILE and renamed over it, so a reader never sees a half
+written file and the document is never held in memory.
+
+A SHA-1 hash of the content (the gloss values, keywords and settings
+that go into the file) is kept next to the file in ECV_FILE.sha1.  The
+file is only rewritten when the hash changes, so asking for an update
+when nothing has changed just reads the values back from the database.
+"""
+
+from django.conf import settings
+
+import datetime
+import hashlib
+import os
+import tempfile
+from xml.sax.saxutils import XMLGenerator
+
+from signbank.dictionary.models import Gloss, Translation
+
+
+def hash_path():
+    return settings.ECV_FILE + '.sha1'
+
+
+def ecv_entries():
+    """Generate (gloss id, [value in each language], [keywords]) for the
+    glosses in the ECV in id order, the keywords are read alongside the
+    glosses in a single query rather than one query per gloss"""
+
+    fields = [lang['annotation_idgloss_fieldname'] for lang in settings.ECV_SETTINGS['languages']]
+    choices = [dict(Gloss._meta.get_field(f).flatchoices) for f in fields]
+
+    glosses = Gloss.objects.filter(excludeFromEcv=False).order_by('pk').values_list('pk', *fields)
+    translations = Translation.objects.filter(gloss__excludeFromEcv=False).order_by('gloss', 'index') \
+                                      .values_list('gloss', 'translation__text').iterator()
+
+    pending = next(translations, None)
+    for row in glosses.iterator():
+        keywords = []
+        while pending is not None and pending[0] <= row[0]:
+            if pending[0] == row[0]:
+                keywords.append(pending[1])
+            pending = next(translations, None)
+
+        values = []
+        for value, display in zip(row[1:], choices):
+            value = display.get(value, value)
+            if value is None or value == '-':
+                value = u''
+            values.append(unicode(value).strip())
+        yield row[0], values, keywords
+
+
+def content_hash():
+    """The hash of everything that goes into the ECV file apart from its date"""
+
+    sha = hashlib.sha1(repr((settings.ECV_SETTINGS, settings.URL)))
+    for entry in ecv_entries():
+        sha.update(repr(entry))
+    return sha.hexdigest()
+
+
+def write_ecv(out):
+    """Write the ECV document to the file object out"""
+
+    languages = settings.ECV_SETTINGS['languages']
+    now = datetime.datetime.now()
+
+    xml = XMLGenerator(out, 'utf-8')
+    xml.startDocument()
+    xml.startElement('CV_RESOURCE', {'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance",
+                                     'DATE': str(now.date()) + 'T' + str(now.time()),
+                                     'AUTHOR': '',
+                                     'VERSION': '0.2',
+                                     'xsi:noNamespaceSchemaLocation': "http://www.mpi.nl/tools/elan/EAFv2.8.xsd"})
+    for lang in languages:
+        xml.startElement('LANGUAGE', lang['attributes'])
+        xml.endElement('LANGUAGE')
+
+    xml.startElement('CONTROLLED_VOCABULARY', {'CV_ID': settings.ECV_SETTINGS['CV_ID']})
+    for lang in languages:
+        xml.startElement('DESCRIPTION', {'LANG_REF': lang['id']})
+        xml.characters(lang['description'])
+        xml.endElement('DESCRIPTION')
+
+    for gloss_id, values, keywords in ecv_entries():
+        xml.ignorableWhitespace('\n')
+        xml.startElement('CV_ENTRY_ML', {'CVE_ID': str(gloss_id), 'EXT_REF': 'signbank-ecv'})
+        description = ", ".join(keywords)
+        for lang, value in zip(languages, values):
+            xml.startElement('CVE_VALUE', {'DESCRIPTION': description, 'LANG_REF': lang['id']})
+            xml.characters(value)
+            xml.endElement('CVE_VALUE')
+        xml.endElement('CV_ENTRY_ML')
+    xml.ignorableWhitespace('\n')
+    xml.endElement('CONTROLLED_VOCABULARY')
+
+    xml.startElement('EXTERNAL_REF', {'EXT_REF_ID': 'signbank-ecv', 'TYPE': 'resource_url',
+                                      'VALUE': settings.URL + "/dictionary/gloss/"})
+    xml.endElement('EXTERNAL_REF')
+    xml.endElement('CV_RESOURCE')
+    xml.endDocument()
+
+
+def replace_file(path, write):
+    """Call write with a temporary file in the directory of path and
+    then rename it over path"""
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    (fd, tmp) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as out:
+            write(out)
+        os.chmod(tmp, 0644)
+        os.rename(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+def build_ecv(force=False):
+    """Rewrite ECV_FILE if the glosses or keywords in it have changed since
+    it was last written (or force is True), returns True if it was written"""
+
+    digest = content_hash()
+    if not force and os.path.exists(settings.ECV_FILE) and os.path.exists(hash_path()):
+        with open(hash_path()) as f:
+            if f.read().strip() == digest:
+                return False
+
+    replace_file(settings.ECV_FILE, write_ecv)
+    replace_file(hash_path(), lambda out: out.write(digest + "\n"))
+    return True
@@ -0,0 +1,130 @@
+"""Facet counts for the admin gloss list.
+
+For the glosses matching the current search, count how many have each
+value of the search form's choice fields so that editors can see what a
+further filter would give them.  The ids of the current results are read
+once into a bitset and ANDed with the bitsets of the phonology and tag
+indexes and of a membership index of dialects, languages and videos kept
+here, so that apart from a count of the published results no grouped
+query has to repeat the search.
+
+Counts are cached by the filter signature of the request and invalidated
+whenever the glosses or anything counted here changes.
+"""
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils.encoding import force_bytes
+
+import hashlib
+
+from signbank.dictionary.models import Gloss, Translation, Definition, Region
+from signbank.dictionary import generations
+from signbank.dictionary.indexes import LookupIndex, phonology_index, tag_index, bitset_count
+from tagging.models import TaggedItem
+from signbank.log import debug
+
+GENERATION_KEY = 'dictionary:facet-generation'
+
+# request parameters that don't change the set of results
+IGNORED_PARAMETERS = ('page', 'paginate_by', 'submit', 'format', 'export_ecv')
+
+
+def signature(get):
+    """The filter signature of a request's GET parameters"""
+
+    items = []
+    for key in sorted(get.keys()):
+        if key not in IGNORED_PARAMETERS:
+            items.append(u"%s=%s" % (key, u",".join(sorted(get.getlist(key)))))
+    return u"&".join(items)
+
+
+class MembershipIndex(LookupIndex):
+    """Bitsets of the glosses in each dialect and language and of the
+    glosses that have a video"""
+
+    generation_key = 'dictionary:membership-index'
+
+    def build(self):
+        from signbank.video.models import GlossVideo
+
+        data = {'dialect': dict(), 'language': dict(), 'hasvideo': 0}
+        for name, through, column in (('dialect', Gloss.dialect.through, 'dialect_id'),
+                                      ('language', Gloss.language.through, 'language_id')):
+            bits = data[name]
+            for gloss_id, value in through.objects.values_list('gloss_id', column):
+                key = unicode(value)
+                bits[key] = bits.get(key, 0) | (1 << gloss_id)
+
+        for gloss_id in GlossVideo.objects.filter(gloss__isnull=False).values_list('gloss_id', flat=True).distinct():
+            data['hasvideo'] |= 1 << gloss_id
+
+        debug("built membership index: %d dialects, %d languages" % (len(data['dialect']), len(data['language'])))
+        return data
+
+
+membership_index = MembershipIndex()
+
+
+def value_counts(bits, valuebits):
+    """Count the glosses in bits for each value in valuebits, a dictionary
+    of value to bitset"""
+
+    return dict([(value, bitset_count(bits & b)) for value, b in valuebits.items()])
+
+
+def compute_facets(qs):
+    """Return a dictionary of field name to a dictionary of value (as a
+    string) to the number of glosses in qs with that value"""
+
+    bits = 0
+    for pk in qs.order_by().values_list('pk', flat=True).distinct():
+        bits |= 1 << pk
+    total = bitset_count(bits)
+    published = qs.order_by().filter(inWeb__exact=True).count()
+
+    facets = dict()
+    phonology = phonology_index.get()['bits']
+    for field in phonology_index.fields:
+        facets[field] = value_counts(bits, phonology[field])
+
+    facets['tags'] = facets['nottags'] = value_counts(bits, tag_index.get())
+
+    membership = membership_index.get()
+    facets['dialect'] = value_counts(bits, membership['dialect'])
+    facets['language'] = value_counts(bits, membership['language'])
+
+    withvideo = bitset_count(bits & membership['hasvideo'])
+    facets['hasvideo'] = {'yes': withvideo, 'no': total - withvideo}
+    facets['inWeb'] = {'yes': published, 'no': total - published}
+
+    return facets
+
+
+def facet_counts(qs, get):
+    """Return the facet counts for the glosses in qs, the results of a
+    search with GET parameters get, from the cache if possible"""
+
+    current = (generations.current(GENERATION_KEY), membership_index.current_generation())
+    key = 'dictionary:facets:%s' % hashlib.md5(force_bytes(u"%s|%s|%s" % (current + (signature(get),)))).hexdigest()
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(qs)
+        cache.set(key, facets)
+    return facets
+
+
+def invalidate(*args, **kwargs):
+    generations.bump(GENERATION_KEY)
+
+
+for model in (Gloss, Translation, Definition, TaggedItem):
+    post_save.connect(invalidate, sender=model, dispatch_uid='facets_save_%s' % model.__name__)
+    post_delete.connect(invalidate, sender=model, dispatch_uid='facets_delete_%s' % model.__name__)
+
+# dialects are added through Region, video changes are connected in signbank.video.models
+post_save.connect(membership_index.invalidate, sender=Region, dispatch_uid='membership_index_save_Region')
+post_delete.connect(membership_index.invalidate, sender=Region, dispatch_uid='membership_index_delete_Region')
+post_delete.connect(membership_index.invalidate, sender=Gloss, dispatch_uid='membership_index_delete_Gloss')
+m2m_changed.connect(membership_index.invalidate, sender=Gloss.language.through, dispatch_uid='membership_index_language')
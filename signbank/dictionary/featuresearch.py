@@ -0,0 +1,147 @@
+"""Keyset pagination for the sign feature search.
+
+The feature search shows one gloss per page with links to the pages
+around it.  Rather than counting and offsetting into the full result set
+on every page, each page link carries the id of the gloss it shows (the
+cursor) and the neighbouring pages are found by seeking from the current
+gloss in (idgloss, pk) order with a LIMIT, so a page deep in the results
+costs the same as the first.
+
+The number of results and the id of the last one are cached for each
+combination of filters and invalidated whenever a gloss, keyword or
+translation changes.
+"""
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.utils.encoding import force_bytes
+
+import hashlib
+
+from signbank.dictionary.models import Gloss, Keyword, Translation, normalise_search_key
+from signbank.dictionary import generations
+from signbank.dictionary.indexes import phonology_index
+
+GENERATION_KEY = 'dictionary:feature-search-generation'
+
+# the order of results, pk breaks ties so that the order is total
+ORDERING = ('idgloss', 'pk')
+
+
+def feature_queryset(staff, term='', handshape='', location=''):
+    """The glosses matching the feature search filters, staff see every
+    gloss with a translation, others only published glosses"""
+
+    # semi-joins on translation rather than distinct() so that the
+    # database can walk the idgloss index and stop at the LIMIT
+    if staff:
+        glosses = Gloss.objects.filter(pk__in=Translation.objects.values('gloss'))
+    else:
+        glosses = Gloss.objects.filter(inWeb__exact=True)
+
+    if term != '':
+        key = normalise_search_key(term)
+        if key:
+            matches = Translation.objects.filter(translation__text_search__startswith=key)
+            glosses = glosses.filter(pk__in=matches.values('gloss'))
+        else:
+            # nothing but punctuation, don't match everything
+            glosses = glosses.none()
+
+    filters = dict()
+    if location != '' and location != "-1":
+        filters['locprim'] = location
+    if handshape != '' and handshape != "notset":
+        filters['domhndsh'] = handshape
+    glosses = phonology_index.filter(glosses, filters)
+
+    return glosses.order_by(*ORDERING)
+
+
+def summary(glosses, signature):
+    """Return (count, last gloss id) for the results, cached under
+    the filter signature"""
+
+    key = 'dictionary:feature-search:%s' % hashlib.md5(force_bytes(u"%s|%s" % (generations.current(GENERATION_KEY), signature))).hexdigest()
+    found = cache.get(key)
+    if found is None:
+        count = glosses.count()
+        last = None
+        if count:
+            last = glosses.order_by('-idgloss', '-pk').values_list('pk', flat=True)[0]
+        found = (count, last)
+        cache.set(key, found)
+    return found
+
+
+def after(glosses, gloss):
+    return glosses.filter(Q(idgloss__gt=gloss.idgloss) | Q(idgloss=gloss.idgloss, pk__gt=gloss.pk))
+
+
+def before(glosses, gloss):
+    return glosses.filter(Q(idgloss__lt=gloss.idgloss) | Q(idgloss=gloss.idgloss, pk__lt=gloss.pk)).order_by('-idgloss', '-pk')
+
+
+def result_page(glosses, signature, number=1, cursor=None, span=4):
+    """Find the page of results to show, one gloss per page.
+
+    number is the page number asked for and cursor the id of the gloss on
+    that page if the link carried one.  Without a valid cursor (eg. a
+    bookmarked URL from before cursors or a gloss edited since) the page is
+    found by offset instead.
+
+    Returns a dictionary with the gloss shown (or None), the page number,
+    the result count and page_range, a list of (page number, cursor) pairs
+    for the page links with ('...', None) for gaps."""
+
+    (count, last) = summary(glosses, signature)
+    if count == 0:
+        return {'gloss': None, 'number': 1, 'count': 0, 'page_range': []}
+
+    number = max(1, min(number, count))
+
+    gloss = None
+    if cursor is not None:
+        gloss = glosses.filter(pk=cursor).first()
+    if gloss is None:
+        gloss = glosses[number-1:number].first()
+    if gloss is None:
+        # results changed under us, start again
+        number = 1
+        gloss = glosses.first()
+
+    following = list(after(glosses, gloss).values_list('pk', flat=True)[:span])
+    preceding = list(before(glosses, gloss).values_list('pk', flat=True)[:span])
+
+    # the first page needs no cursor, offset 0 is cheap
+    pages = [(1, None), (count, last)]
+    pages += [(number - i - 1, pk) for i, pk in enumerate(preceding)]
+    pages += [(number + i + 1, pk) for i, pk in enumerate(following)]
+    pages.append((number, gloss.pk))
+    cursors = dict([(p, pk) for p, pk in pages if 1 <= p <= count])
+
+    first_page = max(1, number - span)
+    last_page = min(count, number + span)
+
+    page_range = []
+    if first_page > 1:
+        page_range.append((1, cursors[1]))
+        if first_page > 2:
+            page_range.append(('...', None))
+    page_range += [(p, cursors.get(p)) for p in range(first_page, last_page + 1)]
+    if last_page < count:
+        if last_page < count - 1:
+            page_range.append(('...', None))
+        page_range.append((count, cursors[count]))
+
+    return {'gloss': gloss, 'number': number, 'count': count, 'page_range': page_range}
+
+
+def invalidate(sender, instance, **kwargs):
+    generations.bump(GENERATION_KEY)
+
+
+for model in (Gloss, Keyword, Translation):
+    post_save.connect(invalidate, sender=model, dispatch_uid='feature_search_save_%s' % model.__name__)
+    post_delete.connect(invalidate, sender=model, dispatch_uid='feature_search_delete_%s' % model.__name__)
@@ -79,6 +79,22 @@ class GlossSearchForm(forms.ModelForm):
         widgets = {
                    'inWeb': forms.Select(choices=YESNOCHOICES),
                    }
+
+    def add_facet_counts(self, facets):
+        """Show the number of matching glosses next to each choice, facets
+        maps field names to a dictionary of value (as a string) to count"""
+
+        for name, counts in facets.items():
+            if name not in self.fields:
+                continue
+            widget = self.fields[name].widget
+            choices = []
+            for value, label in widget.choices:
+                key = unicode(value)
+                if key in counts or key not in ('', 'notset', '-1', 'unspecified', 'None'):
+                    label = u"%s (%d)" % (label, counts.get(key, 0))
+                choices.append((value, label))
+            widget.choices = choices
     
 
 class DefinitionForm(forms.ModelForm):
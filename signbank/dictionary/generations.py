@@ -0,0 +1,55 @@
+"""Generation numbers shared by every process.
+
+The in-memory indexes and the cached pages, counts and snapshots each
+have a generation number.  A change to the data bumps the generation and
+anything built from an older generation is rebuilt.  The numbers are
+kept in the Generation table so that a change made in one web worker or
+management command is seen by all of them, while what is built from
+them can stay in each process's own memory or cache.
+
+A bump is a single UPDATE ... SET value = value + 1 read back in the same
+transaction.  The row stays locked until the transaction ends, so two
+processes bumping at once always get different numbers and a process
+can tell from the number whether anyone else bumped in between.
+
+A generation that has no row yet is 0 and its row starts from a random
+number, so that a row that is lost (eg. rolled back) can't come back to
+a value something was already built at.
+"""
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+import random
+
+from signbank.dictionary.models import Generation
+
+
+def current(key):
+    """The current generation of key"""
+
+    return current_many([key])[key]
+
+
+def current_many(keys):
+    """A dictionary of the current generation of each of keys, read with
+    a single query"""
+
+    generations = dict(Generation.objects.filter(key__in=keys).values_list('key', 'value'))
+    for key in keys:
+        generations.setdefault(key, 0)
+    return generations
+
+
+def bump(key):
+    """Move key on to a new generation, returns the new generation"""
+
+    with transaction.atomic():
+        if Generation.objects.filter(key=key).update(value=F('value') + 1) == 0:
+            try:
+                with transaction.atomic():
+                    Generation.objects.create(key=key, value=random.randint(1, 1 << 30))
+            except IntegrityError:
+                # another process added it first
+                Generation.objects.filter(key=key).update(value=F('value') + 1)
+        return Generation.objects.filter(key=key).values_list('value', flat=True)[0]
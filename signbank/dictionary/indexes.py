@@ -0,0 +1,791 @@
+"""In-memory lookup indexes over the dictionary tables.
+
+The public search pages ask the same few questions of the database on
+every keystroke.  The indexes here keep a compact copy of the data needed
+to answer them in the web process and are rebuilt lazily whenever the
+underlying rows change.
+
+Each index keeps a generation number in the Generation table (see
+generations), model signals bump the generation and the next lookup in
+any process rebuilds the index.
+"""
+
+from django.db import DatabaseError
+from django.db.models.signals import post_save, post_delete
+
+import bisect
+import heapq
+import math
+import threading
+from collections import namedtuple
+
+from signbank.dictionary.models import Keyword, Translation, Gloss, normalise_search_key
+from signbank.dictionary import generations
+from django.contrib.contenttypes.models import ContentType
+from tagging.models import Tag, TaggedItem
+from signbank.log import debug
+
+
+class LookupIndex(object):
+    """Base class for an index that is built on first use and rebuilt
+    whenever its generation number changes.
+
+    Subclasses set generation_key and implement build() which returns
+    the data structure that get() hands out."""
+
+    generation_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._data = None
+
+    def current_generation(self):
+        return generations.current(self.generation_key)
+
+    def invalidate(self, *args, **kwargs):
+        """Mark the index as stale, the signature allows this to be
+        connected directly as a signal handler"""
+
+        generations.bump(self.generation_key)
+
+    def get(self):
+        """Return the index data, rebuilding it if it is out of date"""
+
+        generation = self.current_generation()
+        if self._data is None or self._generation != generation:
+            with self._lock:
+                if self._data is None or self._generation != generation:
+                    self._data = self.build()
+                    self._generation = generation
+        return self._data
+
+    def build(self):
+        raise NotImplementedError
+
+
+# an entry in the keyword index, shaped like a Keyword so that it
+# can be used directly in templates
+KeywordEntry = namedtuple('KeywordEntry', ['pk', 'text', 'inWeb', 'safe'])
+
+
+class KeywordMatches(object):
+    """The result of a prefix lookup, a lazy sequence of KeywordEntry
+    records that supports len() and slicing without building a list
+    so that it can be handed straight to a Paginator.
+
+    Entries are in dictionary order, so an exact match (ignoring case)
+    always comes first."""
+
+    def __init__(self, entries, lo, hi):
+        self.entries = entries
+        self.lo = lo
+        self.hi = hi
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def count(self):
+        return len(self)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.entries[self.lo + start:self.lo + stop:step]
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError(key)
+        return self.entries[self.lo + key]
+
+    def __iter__(self):
+        return iter(self.entries[self.lo:self.hi])
+
+
+class KeywordPrefixIndex(LookupIndex):
+    """Sorted arrays of keywords supporting prefix search on the
+    normalised form of the keyword (ignoring case, accents and punctuation).
+
+    Three arrays are kept, one of every keyword that has a translation
+    (what staff see), one of public keywords (with a translation to a gloss
+    in the web dictionary) and one of public keywords that are not crude
+    (for anonymous users when ANON_SAFE_SEARCH is on)."""
+
+    generation_key = 'dictionary:keyword-prefix-index'
+
+    def build(self):
+        rows = Keyword.objects.filter(translation__isnull=False).distinct().values_list('pk', 'text', 'is_public', 'is_public_safe')
+        rows = sorted((normalise_search_key(text), text, pk, public, safe) for pk, text, public, safe in rows)
+
+        result = {'staff': ([], []), 'public': ([], []), 'safe': ([], [])}
+        for key, text, pk, public, safe in rows:
+            entry = KeywordEntry(pk, text, public, safe)
+            for name, include in (('staff', True), ('public', public), ('safe', safe)):
+                if include:
+                    result[name][0].append(key)
+                    result[name][1].append(entry)
+
+        debug("built keyword prefix index: %d keywords, %d public" % (len(result['staff'][0]), len(result['public'][0])))
+
+        return result
+
+    def search(self, prefix, staff=False, safe=False, limit=None):
+        """Return the keywords starting with prefix (compared by normalised
+        form) as a KeywordMatches sequence, at most limit entries if given.
+        Staff see all keywords, others only public ones and only safe
+        ones if safe is True."""
+
+        if staff:
+            (keys, entries) = self.get()['staff']
+        elif safe:
+            (keys, entries) = self.get()['safe']
+        else:
+            (keys, entries) = self.get()['public']
+
+        key = normalise_search_key(prefix)
+        if prefix and not key:
+            # nothing but punctuation, don't match everything
+            return KeywordMatches(entries, 0, 0)
+        prefix = key
+
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + u'\uffff', lo)
+
+        if limit is not None:
+            hi = min(hi, lo + limit)
+
+        return KeywordMatches(entries, lo, hi)
+
+
+keyword_index = KeywordPrefixIndex()
+
+
+def trigrams(key):
+    """Return the set of letter trigrams in a normalised key, padded so
+    that the start and end of the word count for more"""
+
+    padded = '  ' + key + ' '
+    return frozenset([padded[i:i+3] for i in range(len(padded) - 2)])
+
+
+def edit_distance(a, b, limit):
+    """Return the Levenshtein distance between a and b, giving up
+    and returning limit+1 as soon as it must be more than limit"""
+
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = range(len(b) + 1)
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return min(previous[-1], limit + 1)
+
+
+class TrigramTable(object):
+    """An inverted index from letter trigrams to keyword entries
+    used to find keywords that are spelled like a query."""
+
+    def __init__(self, keys, entries):
+        self.keys = keys
+        self.entries = entries
+        self.grams = [trigrams(key) for key in keys]
+        self.postings = dict()
+        for i, grams in enumerate(self.grams):
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(i)
+
+    def similar(self, query, limit=5, threshold=0.3, max_distance=3, candidates=30, accept=None):
+        """Return up to limit entries similar to query.
+
+        Candidates are keywords with a trigram Jaccard similarity of at
+        least threshold, the best of these are then ranked by edit
+        distance (at most max_distance).  If accept is given it is
+        called with each entry and only those it returns True for are
+        considered."""
+
+        key = normalise_search_key(query)
+        qgrams = trigrams(key)
+
+        # any keyword with similarity >= threshold shares at least
+        # `need` trigrams with the query, so it must appear in the
+        # postings of one of the len-need+1 rarest query trigrams
+        need = max(1, int(math.ceil(threshold * len(qgrams))))
+        rarest = sorted(qgrams, key=lambda g: len(self.postings.get(g, ())))
+        found = set()
+        for gram in rarest[:len(rarest) - need + 1]:
+            found.update(self.postings.get(gram, ()))
+
+        scored = []
+        for i in found:
+            grams = self.grams[i]
+            overlap = len(qgrams & grams)
+            similarity = overlap / float(len(qgrams) + len(grams) - overlap)
+            if similarity >= threshold and (accept is None or accept(self.entries[i])):
+                scored.append((similarity, i))
+
+        best = heapq.nlargest(candidates, scored)
+
+        ranked = []
+        for similarity, i in best:
+            distance = edit_distance(key, self.keys[i], max_distance)
+            if distance <= max_distance:
+                ranked.append((distance, -similarity, self.keys[i], i))
+        ranked.sort()
+
+        return [self.entries[i] for (distance, similarity, k, i) in ranked[:limit]]
+
+
+class KeywordTrigramIndex(LookupIndex):
+    """Trigram index over the keywords for 'did you mean' suggestions,
+    built from the keyword prefix index and rebuilt along with it."""
+
+    generation_key = KeywordPrefixIndex.generation_key
+
+    def build(self):
+        (keys, entries) = keyword_index.get()['staff']
+        return TrigramTable(keys, entries)
+
+    def suggest(self, query, staff=False, safe=False, limit=5):
+        """Return up to limit keywords that look like a misspelling of query,
+        staff, public and safe as for KeywordPrefixIndex.search"""
+
+        if staff:
+            accept = None
+        elif safe:
+            accept = lambda entry: entry.safe
+        else:
+            accept = lambda entry: entry.inWeb
+
+        return self.get().similar(query, limit=limit, accept=accept)
+
+
+keyword_trigram_index = KeywordTrigramIndex()
+
+
+def bitset_ids(bits):
+    """Return the sorted list of positions of the set bits in a bitset"""
+
+    ids = []
+    position = 0
+    while bits:
+        # work through the bitset a machine word at a time
+        chunk = bits & 0xffffffff
+        while chunk:
+            low = chunk & -chunk
+            ids.append(position + low.bit_length() - 1)
+            chunk ^= low
+        bits >>= 32
+        position += 32
+    return ids
+
+
+def bitset_count(bits):
+    """Return the number of set bits in a bitset"""
+
+    return bin(bits).count('1')
+
+
+class TagIndex(LookupIndex):
+    """The glosses carrying each tag, as a bitset per tag name with
+    bit n set if the gloss with id n has the tag.
+
+    Tag filters (AND of some tags, NOT any of some others) are answered
+    by combining bitsets in memory and the result is handed back to the
+    database as a pk__in list so that ordering and pagination stay in SQL."""
+
+    generation_key = 'dictionary:tag-index'
+
+    def build(self):
+        ctype = ContentType.objects.get_for_model(Gloss)
+        tags = dict()
+        for name, gloss_id in TaggedItem.objects.filter(content_type=ctype).values_list('tag__name', 'object_id'):
+            tags[name] = tags.get(name, 0) | (1 << gloss_id)
+
+        debug("built tag index: %d tags" % len(tags))
+        return tags
+
+    def bitset(self, name):
+        """Return the bitset of glosses with the tag name"""
+
+        return self.get().get(name, 0)
+
+    def intersection(self, names):
+        """Return the bitset of glosses that have all the tags in names"""
+
+        names = list(names)
+        if not names:
+            return 0
+        bits = self.bitset(names[0])
+        for name in names[1:]:
+            bits &= self.bitset(name)
+        return bits
+
+    def union(self, names):
+        """Return the bitset of glosses that have any of the tags in names"""
+
+        bits = 0
+        for name in names:
+            bits |= self.bitset(name)
+        return bits
+
+    def gloss_ids(self, name):
+        """Return a sorted list of the ids of glosses with the tag name"""
+
+        return bitset_ids(self.bitset(name))
+
+    def counts(self):
+        """Return a dictionary of tag name to the number of glosses with that tag"""
+
+        return dict([(name, bitset_count(bits)) for name, bits in self.get().items() if bits])
+
+    def filter(self, qs, tags=None, nottags=None):
+        """Restrict a Gloss queryset to glosses with all of tags
+        and none of nottags, either may be None or empty"""
+
+        if tags:
+            qs = qs.filter(pk__in=bitset_ids(self.intersection(tags)))
+        if nottags:
+            excluded = bitset_ids(self.union(nottags))
+            if excluded:
+                qs = qs.exclude(pk__in=excluded)
+        return qs
+
+
+tag_index = TagIndex()
+
+
+class PhonologyIndex(LookupIndex):
+    """The glosses with each value of the phonology choice fields, as a
+    bitset per (field, value) with bit n set if gloss n has that value.
+    Values are kept as strings so that request parameters can be used
+    directly.
+
+    A combination of phonology filters is answered by ANDing bitsets and
+    handed back to the database as a pk__in list.  Saving a gloss updates
+    its bits in place rather than rebuilding the whole index."""
+
+    generation_key = 'dictionary:phonology-index'
+
+    fields = ('domhndsh', 'subhndsh', 'final_domhndsh', 'final_subhndsh',
+              'locprim', 'locsecond', 'final_loc',
+              'initial_relative_orientation', 'final_relative_orientation',
+              'initial_palm_orientation', 'final_palm_orientation',
+              'initial_secondary_loc', 'final_secondary_loc')
+
+    def build(self):
+        data = {'bits': dict([(field, dict()) for field in self.fields]),
+                'glosses': dict()}
+        for row in Gloss.objects.values_list('pk', *self.fields).iterator():
+            self.add(data, row[0], self.values(row[1:]))
+
+        debug("built phonology index: %d glosses" % len(data['glosses']))
+        return data
+
+    def values(self, row):
+        """The values of a row as strings, None stays None"""
+
+        return tuple([value is not None and unicode(value) or None for value in row])
+
+    def add(self, data, gloss_id, values):
+        data['glosses'][gloss_id] = values
+        bit = 1 << gloss_id
+        for field, value in zip(self.fields, values):
+            if value is not None:
+                bits = data['bits'][field]
+                bits[value] = bits.get(value, 0) | bit
+
+    def remove(self, data, gloss_id):
+        values = data['glosses'].pop(gloss_id, None)
+        if values is None:
+            return
+        mask = ~(1 << gloss_id)
+        for field, value in zip(self.fields, values):
+            if value is not None:
+                bits = data['bits'][field]
+                bits[value] = bits.get(value, 0) & mask
+
+    def changed(self, sender, instance, **kwargs):
+        """Signal handler for saved and deleted glosses, updates the bits
+        of the gloss if any of its phonology values have changed"""
+
+        deleted = kwargs.get('signal') is post_delete
+        values = self.values([getattr(instance, field) for field in self.fields])
+        with self._lock:
+            data = self._data
+            if data is not None and not deleted and data['glosses'].get(instance.pk) == values:
+                return
+
+            generation = generations.bump(self.generation_key)
+
+            if data is not None and self._generation == generation - 1:
+                self.remove(data, instance.pk)
+                if not deleted:
+                    self.add(data, instance.pk, values)
+                self._generation = generation
+
+    def bitset(self, field, value):
+        """Return the bitset of glosses with value in field"""
+
+        return self.get()['bits'][field].get(unicode(value), 0)
+
+    def match(self, filters):
+        """Return the bitset of glosses matching all the filters, a
+        dictionary of field name to value"""
+
+        bits = None
+        for field, value in filters.items():
+            if bits is None:
+                bits = self.bitset(field, value)
+            else:
+                bits &= self.bitset(field, value)
+        return bits
+
+    def filter(self, qs, filters):
+        """Restrict a Gloss queryset to glosses matching all the filters"""
+
+        if not filters:
+            return qs
+        return qs.filter(pk__in=bitset_ids(self.match(filters)))
+
+
+phonology_index = PhonologyIndex()
+
+
+class DictionaryOrder(object):
+    """Glosses in sign number order, kept as sorted arrays of sign
+    numbers with the matching gloss ids, one for staff (all glosses with
+    a sign number) and one for the public (those also in the web
+    dictionary).  Totals count all glosses, with or without a number,
+    as Gloss.objects.count() does."""
+
+    def __init__(self, rows):
+        # gloss id -> (sn, inWeb) for every gloss
+        self.glosses = dict()
+        self.arrays = {True: ([], []), False: ([], [])}
+        self.totals = {True: 0, False: 0}
+        for pk, sn, inWeb in sorted(rows, key=lambda row: row[1]):
+            self.add(pk, sn, inWeb)
+
+    def add(self, pk, sn, inWeb):
+        inWeb = bool(inWeb)
+        self.glosses[pk] = (sn, inWeb)
+        for staff in (True, False):
+            if staff or inWeb:
+                self.totals[staff] += 1
+                if sn is not None:
+                    (sns, pks) = self.arrays[staff]
+                    i = bisect.bisect_left(sns, sn)
+                    sns.insert(i, sn)
+                    pks.insert(i, pk)
+
+    def remove(self, pk):
+        if pk not in self.glosses:
+            return
+        (sn, inWeb) = self.glosses.pop(pk)
+        for staff in (True, False):
+            if staff or inWeb:
+                self.totals[staff] -= 1
+                if sn is not None:
+                    (sns, pks) = self.arrays[staff]
+                    i = bisect.bisect_left(sns, sn)
+                    while pks[i] != pk:
+                        i += 1
+                    del sns[i]
+                    del pks[i]
+
+    def position(self, sn, staff=False):
+        """Return the 1-based position of sign number sn in dictionary order"""
+
+        return bisect.bisect_left(self.arrays[staff][0], sn) + 1
+
+    def total(self, staff=False):
+        """Return the number of glosses visible to staff or the public"""
+
+        return self.totals[staff]
+
+    def neighbours(self, sn, staff=False):
+        """Return the ids of the glosses before and after sign number sn
+        in dictionary order, either may be None"""
+
+        (sns, pks) = self.arrays[staff]
+        i = bisect.bisect_left(sns, sn)
+        j = bisect.bisect_right(sns, sn)
+        prev = pks[i - 1] if i > 0 else None
+        next = pks[j] if j < len(pks) else None
+        return (prev, next)
+
+
+class DictionaryOrderIndex(LookupIndex):
+    """Dictionary order of the glosses for sign numbering and next/previous
+    navigation without counting queries.
+
+    A change to the sign number or publication of a gloss is applied to
+    the arrays in place if this process holds the latest generation and
+    only triggers a full rebuild in other processes."""
+
+    generation_key = 'dictionary:order-index'
+
+    def build(self):
+        rows = Gloss.objects.values_list('pk', 'sn', 'inWeb')
+        order = DictionaryOrder(rows)
+        debug("built dictionary order index: %d glosses" % order.total(True))
+        return order
+
+    def changed(self, sender, instance, **kwargs):
+        """Signal handler for saved and deleted glosses, updates the index
+        if the sign number or publication status has changed"""
+
+        deleted = kwargs.get('signal') is post_delete
+        with self._lock:
+            order = self._data
+            if order is not None and not deleted and order.glosses.get(instance.pk) == (instance.sn, bool(instance.inWeb)):
+                return
+
+            generation = generations.bump(self.generation_key)
+
+            if order is not None and self._generation == generation - 1:
+                order.remove(instance.pk)
+                if not deleted:
+                    order.add(instance.pk, instance.sn, instance.inWeb)
+                self._generation = generation
+
+    def position(self, gloss, staff=False):
+        """Return (position, total) of gloss in dictionary order, (0, 0)
+        if it has no sign number"""
+
+        if gloss.sn is None:
+            return (0, 0)
+        order = self.get()
+        return (order.position(gloss.sn, staff), order.total(staff))
+
+    def total(self, staff=False):
+        return self.get().total(staff)
+
+    def neighbours(self, gloss, staff=False):
+        """Return the ids of the previous and next glosses in dictionary order"""
+
+        if gloss.sn is None:
+            return (None, None)
+        return self.get().neighbours(gloss.sn, staff)
+
+
+dictionary_order = DictionaryOrderIndex()
+
+
+class KeywordUrlIndex(LookupIndex):
+    """The keyword page URL (keyword text and match number n as in
+    /dictionary/words/<keyword>-<n>.html) of every translation and the
+    canonical keyword and n for every gloss, kept for staff (counting all
+    translations) and for the public (counting only public ones) so that
+    links can be generated without queries.
+
+    Numbering follows Keyword.match_request, translations of a keyword
+    in the default Translation ordering (gloss name, then index)."""
+
+    generation_key = 'dictionary:keyword-url-index'
+
+    def build(self):
+        rows = Translation.objects.order_by('translation', 'gloss', 'index', 'pk').values_list('pk', 'translation', 'translation__text',
+                                                                                             'gloss', 'index', 'is_public')
+
+        result = dict()
+        for staff in (True, False):
+            result[staff] = {'translations': dict(), 'glosses': dict()}
+
+        # the first translation of each gloss (by index) gives its keyword
+        first = dict()
+        for (pk, kwid, text, gloss, index, public) in rows:
+            if gloss not in first or (index, pk) < first[gloss][:2]:
+                first[gloss] = (index, pk, kwid)
+        first_keyword = dict([(gloss, kwid) for gloss, (index, pk, kwid) in first.items()])
+
+        counts = {True: dict(), False: dict()}
+        for (pk, kwid, text, gloss, index, public) in rows:
+            for staff in (True, False):
+                if staff or public:
+                    n = counts[staff].get(kwid, 0) + 1
+                    counts[staff][kwid] = n
+                    result[staff]['translations'][pk] = (text, n)
+                    if first_keyword[gloss] == kwid and gloss not in result[staff]['glosses']:
+                        result[staff]['glosses'][gloss] = (text, n)
+
+        debug("built keyword url index: %d translations" % len(result[True]['translations']))
+        return result
+
+    def translation_url(self, translation_id, staff=True):
+        """Return the keyword page URL for a translation or None if it
+        is not visible"""
+
+        found = self.get()[staff]['translations'].get(translation_id)
+        if found is None:
+            return None
+        return u"/dictionary/words/%s-%d.html" % found
+
+    def keyword_and_index(self, gloss_id, staff=False):
+        """Return (keyword, n) such that the nth match for keyword is
+        this gloss, or None if there is none"""
+
+        return self.get()[staff]['glosses'].get(gloss_id)
+
+
+keyword_urls = KeywordUrlIndex()
+
+
+class GlossCompletionIndex(LookupIndex):
+    """Sorted arrays for gloss typeahead: the normalised idgloss and
+    annotation idgloss of every gloss, and every sign number as a string,
+    each with the matching gloss ids.
+
+    complete() ranks exact matches first, then names starting with the
+    prefix and then sign numbers starting with it, and stops at the
+    limit so a one letter prefix costs no more than a long one.  Saving
+    a gloss updates its entries in place."""
+
+    generation_key = 'dictionary:gloss-completion-index'
+
+    def build(self):
+        data = {'names': ([], []), 'sns': ([], []), 'glosses': dict()}
+        for pk, idgloss, annotation, sn in Gloss.objects.values_list('pk', 'idgloss', 'annotation_idgloss', 'sn'):
+            self.add(data, pk, (idgloss, annotation, sn))
+        debug("built gloss completion index: %d glosses" % len(data['glosses']))
+        return data
+
+    def keys(self, values):
+        """The name and sign number keys of a gloss"""
+
+        (idgloss, annotation, sn) = values
+        names = set([normalise_search_key(idgloss), normalise_search_key(annotation)]) - set([''])
+        sns = [unicode(sn)] if sn is not None else []
+        return [('names', key) for key in names] + [('sns', key) for key in sns]
+
+    def add(self, data, pk, values):
+        data['glosses'][pk] = values
+        for array, key in self.keys(values):
+            (keys, pks) = data[array]
+            i = bisect.bisect_left(keys, key)
+            keys.insert(i, key)
+            pks.insert(i, pk)
+
+    def remove(self, data, pk):
+        if pk not in data['glosses']:
+            return
+        for array, key in self.keys(data['glosses'].pop(pk)):
+            (keys, pks) = data[array]
+            i = bisect.bisect_left(keys, key)
+            while pks[i] != pk:
+                i += 1
+            del keys[i]
+            del pks[i]
+
+    def changed(self, sender, instance, **kwargs):
+        """Signal handler for saved and deleted glosses, updates the entries
+        of the gloss if its id gloss, annotation id gloss or sign number
+        has changed"""
+
+        deleted = kwargs.get('signal') is post_delete
+        values = (instance.idgloss, instance.annotation_idgloss, instance.sn)
+        with self._lock:
+            data = self._data
+            if data is not None and not deleted and data['glosses'].get(instance.pk) == values:
+                return
+
+            generation = generations.bump(self.generation_key)
+
+            if data is not None and self._generation == generation - 1:
+                self.remove(data, instance.pk)
+                if not deleted:
+                    self.add(data, instance.pk, values)
+                self._generation = generation
+
+    def complete(self, prefix, limit=20):
+        """Return [(gloss id, idgloss, annotation idgloss, sn)] for up to
+        limit glosses matching prefix, best first"""
+
+        data = self.get()
+        found = []
+
+        def take(array, key, exact):
+            (keys, pks) = data[array]
+            i = bisect.bisect_left(keys, key)
+            while i < len(keys) and len(found) < limit and keys[i].startswith(key):
+                if keys[i] == key or not exact:
+                    if pks[i] not in found:
+                        found.append(pks[i])
+                elif exact:
+                    break
+                i += 1
+
+        key = normalise_search_key(prefix)
+        sn = prefix.strip()
+        if key:
+            take('names', key, True)
+        if sn:
+            take('sns', sn, True)
+        if key:
+            take('names', key, False)
+        if sn:
+            take('sns', sn, False)
+
+        return [(pk,) + data['glosses'][pk] for pk in found]
+
+
+gloss_completions = GlossCompletionIndex()
+
+
+def warm_indexes():
+    """Build the indexes ahead of the first request, called at startup"""
+
+    try:
+        keyword_index.get()
+        keyword_trigram_index.get()
+        tag_index.get()
+        dictionary_order.get()
+        phonology_index.get()
+        keyword_urls.get()
+        gloss_completions.get()
+    except DatabaseError:
+        # the tables may not exist yet (eg. before syncdb), indexes
+        # will be built on first use instead
+        pass
+
+
+# keep the keyword index up to date, a change to inWeb or the tags on a
+# gloss can move keywords in or out of the public and safe lists
+for model in (Keyword, Translation, Gloss, TaggedItem):
+    post_save.connect(keyword_index.invalidate, sender=model, dispatch_uid='keyword_index_save_%s' % model.__name__)
+    post_delete.connect(keyword_index.invalidate, sender=model, dispatch_uid='keyword_index_delete_%s' % model.__name__)
+
+# tagging and untagging a gloss saves or deletes a TaggedItem, deleting a
+# tag or a gloss can leave stale ids in the index so rebuild then too
+post_save.connect(tag_index.invalidate, sender=TaggedItem, dispatch_uid='tag_index_save_TaggedItem')
+for model in (TaggedItem, Tag, Gloss):
+    post_delete.connect(tag_index.invalidate, sender=model, dispatch_uid='tag_index_delete_%s' % model.__name__)
+
+post_save.connect(dictionary_order.changed, sender=Gloss, dispatch_uid='dictionary_order_save')
+post_delete.connect(dictionary_order.changed, sender=Gloss, dispatch_uid='dictionary_order_delete')
+
+post_save.connect(phonology_index.changed, sender=Gloss, dispatch_uid='phonology_index_save')
+post_delete.connect(phonology_index.changed, sender=Gloss, dispatch_uid='phonology_index_delete')
+
+# keyword text, the set of translations and publication of glosses all
+# change the numbering of keyword pages
+for model in (Keyword, Translation, Gloss):
+    post_save.connect(keyword_urls.invalidate, sender=model, dispatch_uid='keyword_urls_save_%s' % model.__name__)
+    post_delete.connect(keyword_urls.invalidate, sender=model, dispatch_uid='keyword_urls_delete_%s' % model.__name__)
+
+post_save.connect(gloss_completions.changed, sender=Gloss, dispatch_uid='gloss_completions_save')
+post_delete.connect(gloss_completions.changed, sender=Gloss, dispatch_uid='gloss_completions_delete')
+
+
+# connect the signal handlers of the modules built on these indexes.  They
+# are imported here rather than from models so that they find this module
+# fully loaded whichever of the two is imported first (the wsgi module and
+# some management commands import this one before the models).
+import signbank.dictionary.featuresearch
+import signbank.dictionary.facets
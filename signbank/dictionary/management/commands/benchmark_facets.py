@@ -0,0 +1,85 @@
+"""Measure the time to compute the gloss list facet counts"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from signbank.dictionary.models import Gloss, Dialect, Language, handshapeChoices, locationChoices
+from signbank.dictionary.indexes import phonology_index, tag_index
+from signbank.dictionary.facets import compute_facets, membership_index
+import random
+import time
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+
+    help = 'time facet counts over synthetic glosses, which are removed again afterwards'
+    args = '[glosses] [repeats]'
+
+    def handle(self, *args, **options):
+
+        try:
+            size = int(args[0]) if len(args) > 0 else 20000
+            repeats = int(args[1]) if len(args) > 1 else 20
+        except ValueError:
+            raise CommandError("Usage: benchmark_facets %s" % self.args)
+
+        try:
+            with transaction.atomic():
+                self.run(size, repeats)
+                raise Rollback
+        except Rollback:
+            pass
+
+        # the indexes were built from the synthetic glosses
+        phonology_index.invalidate()
+        tag_index.invalidate()
+        membership_index.invalidate()
+
+    def run(self, size, repeats):
+
+        rnd = random.Random(1)
+        handshapes = [value for value, label in handshapeChoices if value != 'notset']
+        locations = [value for value, label in locationChoices if value != -1]
+
+        language = Language.objects.create(name='Benchmark', description='')
+        dialects = [Dialect.objects.create(language=language, name='Dialect %d' % i, description='') for i in range(10)]
+
+        # bulk_create skips the save signals, the indexes are rebuilt below
+        glosses = []
+        for i in range(size):
+            glosses.append(Gloss(idgloss='BENCHMARK-%06d' % i, inWeb=rnd.random() < 0.7,
+                                 domhndsh=rnd.choice(handshapes), subhndsh=rnd.choice(handshapes),
+                                 final_domhndsh=rnd.choice(handshapes), locprim=rnd.choice(locations),
+                                 final_loc=rnd.choice(locations)))
+        Gloss.objects.bulk_create(glosses, batch_size=500)
+
+        ids = list(Gloss.objects.filter(idgloss__startswith='BENCHMARK-').values_list('pk', flat=True))
+        through = Gloss.dialect.through
+        through.objects.bulk_create([through(gloss_id=pk, dialect=rnd.choice(dialects)) for pk in ids], batch_size=500)
+
+        phonology_index.invalidate()
+        tag_index.invalidate()
+        membership_index.invalidate()
+        start = time.time()
+        phonology_index.get()
+        tag_index.get()
+        membership_index.get()
+        print "Built indexes over %d glosses in %.1f ms" % (Gloss.objects.count(), (time.time() - start) * 1000)
+
+        filters = [('no filter', Gloss.objects.all()),
+                   ('published', Gloss.objects.filter(inWeb=True)),
+                   ('handshape', phonology_index.filter(Gloss.objects.all(), {'domhndsh': handshapes[0]})),
+                   ('handshape and location', phonology_index.filter(Gloss.objects.filter(inWeb=True),
+                                                                     {'domhndsh': handshapes[1], 'locprim': locations[0]})),
+                   ]
+        for label, qs in filters:
+            timings = []
+            for i in range(repeats):
+                start = time.time()
+                compute_facets(qs)
+                timings.append((time.time() - start) * 1000)
+            timings.sort()
+            print "%s: median %.1f ms, max %.1f ms" % (label, timings[len(timings) // 2], timings[-1])
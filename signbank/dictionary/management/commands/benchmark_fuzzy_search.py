@@ -0,0 +1,67 @@
+"""Measure the latency of 'did you mean' keyword suggestions"""
+
+from django.core.management.base import BaseCommand, CommandError
+from signbank.dictionary.indexes import TrigramTable, KeywordEntry
+from signbank.dictionary.models import normalise_search_key
+import random
+import string
+import time
+
+
+def random_word(rnd):
+    """Make up a word-like string of 3 to 12 letters"""
+
+    return ''.join([rnd.choice(string.ascii_lowercase) for i in range(rnd.randint(3, 12))])
+
+
+def misspell(rnd, word):
+    """Apply one random edit (delete, insert or substitute) to word"""
+
+    i = rnd.randrange(len(word))
+    edit = rnd.choice(['delete', 'insert', 'substitute'])
+    if edit == 'delete':
+        return word[:i] + word[i+1:]
+    elif edit == 'insert':
+        return word[:i] + rnd.choice(string.ascii_lowercase) + word[i:]
+    else:
+        return word[:i] + rnd.choice(string.ascii_lowercase) + word[i+1:]
+
+
+class Command(BaseCommand):
+
+    help = 'time fuzzy keyword suggestions over a synthetic vocabulary'
+    args = '[vocabulary size] [queries]'
+
+    def handle(self, *args, **options):
+
+        try:
+            size = int(args[0]) if len(args) > 0 else 50000
+            queries = int(args[1]) if len(args) > 1 else 1000
+        except ValueError:
+            raise CommandError("Usage: benchmark_fuzzy_search %s" % self.args)
+
+        rnd = random.Random(1)
+        words = sorted(set([random_word(rnd) for i in range(size)]))
+        entries = [KeywordEntry(i, w, True, True) for i, w in enumerate(words)]
+        keys = [normalise_search_key(w) for w in words]
+
+        start = time.time()
+        table = TrigramTable(keys, entries)
+        print "Built index of %d keywords in %.1f ms" % (len(words), (time.time() - start) * 1000)
+
+        timings = []
+        hits = 0
+        for i in range(queries):
+            target = rnd.choice(words)
+            query = misspell(rnd, target)
+            start = time.time()
+            found = table.similar(query)
+            timings.append((time.time() - start) * 1000)
+            if target in [e.text for e in found]:
+                hits += 1
+
+        timings.sort()
+        print "Queries: %d, intended word suggested: %.1f%%" % (queries, 100.0 * hits / queries)
+        for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            print "%s latency: %.2f ms" % (label, timings[min(len(timings) - 1, int(fraction * len(timings)))])
+        print "max latency: %.2f ms" % timings[-1]
@@ -0,0 +1,20 @@
+"""Write the ELAN controlled vocabulary file if the glosses have changed"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from signbank.dictionary.ecv import build_ecv
+import time
+
+
+class Command(BaseCommand):
+
+    help = 'rewrite ECV_FILE if the glosses or keywords have changed since it was written, "force" always rewrites it'
+    args = '[force]'
+
+    def handle(self, *args, **options):
+
+        start = time.time()
+        if build_ecv(force='force' in args):
+            print "Wrote %s in %.1f s" % (settings.ECV_FILE, time.time() - start)
+        else:
+            print "%s is up to date" % settings.ECV_FILE
@@ -0,0 +1,22 @@
+"""Build the package snapshot served to the mobile apps"""
+
+from django.core.management.base import BaseCommand, CommandError
+from signbank.dictionary import packages
+import time
+
+
+class Command(BaseCommand):
+
+    help = 'build the package snapshot for the mobile apps if it is out of date, "force" always builds it'
+    args = '[force]'
+
+    def handle(self, *args, **options):
+
+        current = packages.current_snapshot()
+        if 'force' not in args and current is not None and current['generation'] == packages.current_generation():
+            print "Package snapshot %s is up to date" % current['etag']
+            return
+
+        start = time.time()
+        current = packages.build_snapshot()
+        print "Built package snapshot %s in %.1f s" % (current['etag'], time.time() - start)
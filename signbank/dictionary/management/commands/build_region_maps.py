@@ -0,0 +1,45 @@
+"""Render the composite regional map for every set of dialects in use"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from signbank.dictionary.models import Region
+from signbank.dictionary import regional
+
+import os
+
+
+class Command(BaseCommand):
+
+    help = 'composite the map images for each distinct set of gloss regions, "force" re-renders existing maps'
+    args = '[force]'
+
+    def handle(self, *args, **options):
+
+        if regional.Image is None:
+            raise CommandError("PIL is needed to composite the map images")
+
+        # the regions of each gloss in their default order
+        sets = dict()
+        for region in Region.objects.all().select_related('dialect__language').iterator():
+            sets.setdefault(region.gloss_id, []).append(region)
+
+        # one composite for each distinct set
+        distinct = dict()
+        for regions in sets.values():
+            distinct[regional.composite_name(regions)] = regions
+
+        made = failed = 0
+        for path, regions in sorted(distinct.items()):
+            if 'force' not in args and os.path.exists(os.path.join(settings.MEDIA_ROOT, path)):
+                continue
+            try:
+                regional.render_composite(regional.map_image_for_regions(regions), path)
+                made += 1
+            except (IOError, OSError, ValueError), e:
+                print "Failed %s: %s" % (path, e)
+                failed += 1
+
+        print "Dialect sets:", len(distinct)
+        print "Maps rendered:", made
+        if failed:
+            print "Failed:", failed
@@ -0,0 +1,18 @@
+"""Find glosses and keywords that may be duplicates and store them for the staff report"""
+
+from django.core.management.base import BaseCommand, CommandError
+from signbank.dictionary.duplicates import update_duplicates, duplicate_keywords
+import time
+
+
+class Command(BaseCommand):
+
+    help = 'recompute the table of glosses that may be duplicates of each other'
+    args = ''
+
+    def handle(self, *args, **options):
+
+        start = time.time()
+        total = update_duplicates()
+        print "Possible duplicate glosses: %d pairs in %.1f s" % (total, time.time() - start)
+        print "Keywords differing only in case or punctuation: %d groups" % len(duplicate_keywords())
@@ -0,0 +1,21 @@
+"""Find the minimal pairs of the lexicon and store them for the staff report"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from signbank.dictionary.models import MinimalPair
+from signbank.dictionary.minimalpairs import update_minimal_pairs
+import time
+
+
+class Command(BaseCommand):
+
+    help = 'recompute the table of glosses that differ in exactly one phonology field'
+    args = ''
+
+    def handle(self, *args, **options):
+
+        start = time.time()
+        total = update_minimal_pairs()
+        print "Minimal pairs found: %d in %.1f s" % (total, time.time() - start)
+        for parameter, n in MinimalPair.objects.order_by('parameter').values_list('parameter').annotate(n=Count('pk')):
+            print "  %s: %d" % (parameter, n)
@@ -12,7 +12,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
 
-        for gloss in Gloss.objects.all():
+        for gloss in Gloss.objects.all().select_related('display_video'):
             print gloss.id, gloss.get_video_url()
             
             
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""Fill in the normalised search keys for keywords and glosses and
+the word index of definitions"""
+
+from django.core.management.base import BaseCommand, CommandError
+from signbank.dictionary.models import Keyword, Gloss, Definition, normalise_search_key, update_definition_terms
+
+
+class Command(BaseCommand):
+
+    help = 'recompute the normalised search keys for all keywords and glosses and reindex all definitions'
+    args = ''
+
+    def handle(self, *args, **options):
+
+        # use update() rather than save() so that we only write the key
+        # columns and don't fire the save signals for every row
+        changed = 0
+        for (pk, text, key) in Keyword.objects.values_list('pk', 'text', 'text_search').iterator():
+            newkey = normalise_search_key(text)[:100]
+            if newkey != key:
+                Keyword.objects.filter(pk=pk).update(text_search=newkey)
+                changed += 1
+        print "Keywords updated:", changed
+
+        changed = 0
+        for (pk, idgloss, annotation_idgloss, key, annotation_key) in Gloss.objects.values_list('pk', 'idgloss', 'annotation_idgloss',
+                                                                                               'idgloss_search', 'annotation_idgloss_search').iterator():
+            newkey = normalise_search_key(idgloss)[:50]
+            new_annotation_key = normalise_search_key(annotation_idgloss)[:30]
+            if newkey != key or new_annotation_key != annotation_key:
+                Gloss.objects.filter(pk=pk).update(idgloss_search=newkey, annotation_idgloss_search=new_annotation_key)
+                changed += 1
+        print "Glosses updated:", changed
+
+        count = 0
+        for defn in Definition.objects.all().iterator():
+            update_definition_terms(Definition, defn)
+            count += 1
+        print "Definitions indexed:", count
@@ -0,0 +1,66 @@
+"""Minimal pairs: glosses whose phonology differs in exactly one field.
+
+Rather than comparing every pair of glosses, for each parameter the
+glosses are grouped by the values of all the other phonology fields.
+Glosses in the same group agree everywhere but the parameter, so every
+two of them with different (set) values of the parameter are a minimal
+pair.  One pass over the glosses per parameter finds them all.
+
+Glosses with fewer than MINIMUM_VALUES phonology fields filled in are
+left out, otherwise the many glosses with no phonology yet would all be
+minimal pairs of each other.
+"""
+
+from django.db import transaction
+
+from signbank.dictionary.models import Gloss, MinimalPair
+from signbank.dictionary.indexes import phonology_index
+
+MINIMUM_VALUES = 3
+
+
+def find_minimal_pairs(rows, fields):
+    """Given rows of (gloss id, value, value...) in fields order, return
+    a list of (source id, target id, parameter) with source < target"""
+
+    rows = [row for row in rows if len([v for v in row[1:] if v is not None]) >= MINIMUM_VALUES]
+
+    pairs = []
+    for position, parameter in enumerate(fields):
+        # the other fields' values -> parameter value -> gloss ids
+        groups = dict()
+        for row in rows:
+            values = row[1:]
+            value = values[position]
+            if value is None:
+                continue
+            key = values[:position] + values[position+1:]
+            groups.setdefault(key, dict()).setdefault(value, []).append(row[0])
+
+        for byvalue in groups.values():
+            if len(byvalue) < 2:
+                continue
+            values = sorted(byvalue.keys())
+            for i, value in enumerate(values):
+                for other in values[i+1:]:
+                    for a in byvalue[value]:
+                        for b in byvalue[other]:
+                            pairs.append((min(a, b), max(a, b), parameter))
+    return pairs
+
+
+def update_minimal_pairs():
+    """Recompute the MinimalPair table from the current phonology,
+    returns the number of pairs"""
+
+    fields = phonology_index.fields
+    rows = []
+    for row in Gloss.objects.values_list('pk', *fields).iterator():
+        rows.append((row[0],) + phonology_index.values(row[1:]))
+
+    pairs = find_minimal_pairs(rows, fields)
+    with transaction.atomic():
+        MinimalPair.objects.all().delete()
+        MinimalPair.objects.bulk_create([MinimalPair(source_id=a, target_id=b, parameter=p) for a, b, p in pairs],
+                                        batch_size=500)
+    return len(pairs)
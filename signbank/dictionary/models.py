@@ -8,18 +8,49 @@ manageable.
 
 from django.db.models import Q
 from django.db import models
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
 from django.http import Http404
+from django.utils.encoding import force_text
 import tagging
+import tagging.models
 
 import sys, os
 import json
+import re
+import unicodedata
 
 #from signbank.video.models import GlossVideo
 
 #from models_legacy import Sign
 
 
+def normalise_search_key(text):
+    """Return the form of some text that we store and compare for searching:
+    lower case, accents and other combining marks removed (via NFKD),
+    punctuation removed and runs of whitespace collapsed to a single space.
+    So 'Caf\xe9' and 'cafe' have the same key."""
+
+    if text is None:
+        return ''
+
+    text = unicodedata.normalize('NFKD', force_text(text).lower())
+    text = ''.join([c for c in text if unicodedata.category(c)[0] not in ('M', 'P')])
+    return ' '.join(text.split())
+
+
+def search_words(text):
+    """Split some text into words and return the normalised form of
+    each, as used for the definition index"""
+
+    if text is None:
+        return []
+
+    words = [normalise_search_key(w) for w in re.findall(r'\w+', force_text(text), re.UNICODE)]
+    return [w[:50] for w in words if w]
+
+
 class Translation(models.Model):
     """An English translations of Auslan glosses"""
 
@@ -27,19 +58,21 @@ class Translation(models.Model):
     translation = models.ForeignKey("Keyword")
     index = models.IntegerField("Index")
 
+    # visibility of this translation in the public dictionary, copied from the
+    # gloss by update_visibility: is_public if the gloss is in the web dictionary
+    # and is_public_safe if it is also not tagged as crude (for safe search)
+    is_public = models.BooleanField(default=False, db_index=True, editable=False)
+    is_public_safe = models.BooleanField(default=False, db_index=True, editable=False)
+
     def __str__(self):
         return str(self.gloss)+"-"+str(self.translation)
 
     def get_absolute_url(self):
         """Return a URL for a view of this translation."""
 
-        alltrans = self.translation.translation_set.all()
-        idx = 0
-        for tr in alltrans:
-            if tr == self:
-                return "/dictionary/words/"+str(self.translation)+"-"+str(idx+1)+".html"
-            idx += 1
-        return "/dictionary/"
+        from signbank.dictionary.indexes import keyword_urls
+
+        return keyword_urls.translation_url(self.pk) or "/dictionary/"
 
 
     class Meta:
@@ -58,12 +91,19 @@ class Keyword(models.Model):
         return self.text
 
     text = models.CharField(max_length=100, unique=True)
+    # normalised form of text used for searching, maintained by a pre_save signal
+    text_search = models.CharField(max_length=100, db_index=True, blank=True, editable=False)
+
+    # True if any translation of this keyword is public (or public and safe),
+    # maintained by update_visibility
+    is_public = models.BooleanField(default=False, db_index=True, editable=False)
+    is_public_safe = models.BooleanField(default=False, db_index=True, editable=False)
 
     def inWeb(self):
         """Return True if some gloss associated with this
         keyword is in the web version of the dictionary"""
 
-        return len(self.translation_set.filter(gloss__inWeb__exact=True)) != 0
+        return self.is_public
 
     class Meta:
         ordering = ['text']
@@ -79,20 +119,17 @@ class Keyword(models.Model):
         Returns a tuple (translation, count) where count is the total number
         of matches."""
 
+        # remove crude signs for non-authenticated users if ANON_SAFE_SEARCH is on
+        safe = (not request.user.is_authenticated()) and settings.ANON_SAFE_SEARCH
+
         if request.user.has_perm('dictionary.search_gloss'):
             alltrans = self.translation_set.all()
+        elif safe:
+            alltrans = self.translation_set.filter(is_public_safe=True)
         else:
-            alltrans = self.translation_set.filter(gloss__inWeb__exact=True)
-
-        # remove crude signs for non-authenticated users if ANON_SAFE_SEARCH is on
-        try:
-            crudetag = tagging.models.Tag.objects.get(name='lexis:crude')
-        except:
-            crudetag = None
+            alltrans = self.translation_set.filter(is_public=True)
 
-        safe = (not request.user.is_authenticated()) and settings.ANON_SAFE_SEARCH
-        if safe and crudetag:
-            alltrans = [tr for tr in alltrans if not crudetag in tagging.models.Tag.objects.get_for_object(tr.gloss)]
+        alltrans = list(alltrans)
 
         # if there are no translations, generate a 404
         if len(alltrans) == 0:
@@ -108,6 +145,45 @@ class Keyword(models.Model):
         return (trans, len(alltrans))
 
 
+def resolve_videos(glosses):
+    """Find the video to display for each of a list of glosses in two queries,
+    following the homophone relation to sense 1 for glosses with a sense > 1
+    as Gloss.get_video_gloss does.
+
+    Returns a dictionary of gloss id to GlossVideo (or None)."""
+
+    from signbank.video.models import GlossVideo
+
+    glosses = list(glosses)
+    video_gloss = dict([(g.pk, g.pk) for g in glosses])
+
+    senses = [g.pk for g in glosses if g.sense > 1]
+    if senses:
+        homophones = Relation.objects.filter(role='homophone', source__in=senses, target__sense__exact=1)
+        for (source, target) in homophones.order_by('pk').values_list('source', 'target'):
+            if video_gloss[source] == source:
+                video_gloss[source] = target
+
+    videos = dict()
+    for video in GlossVideo.objects.filter(gloss__in=set(video_gloss.values()), version__exact=0):
+        videos[video.gloss_id] = video
+
+    return dict([(pk, videos.get(vg)) for pk, vg in video_gloss.items()])
+
+
+def update_display_videos(gloss_ids):
+    """Recompute Gloss.display_video for some glosses and for the
+    homophones (sense > 1) that share their video"""
+
+    gloss_ids = set(gloss_ids)
+    gloss_ids.update(Relation.objects.filter(role='homophone', target__in=gloss_ids, source__sense__gt=1).values_list('source', flat=True))
+
+    glosses = Gloss.objects.filter(pk__in=gloss_ids).only('pk', 'sense', 'display_video')
+    for pk, video in resolve_videos(glosses).items():
+        video_id = video.pk if video else None
+        Gloss.objects.filter(pk=pk).exclude(display_video=video_id).update(display_video=video_id)
+
+
 defn_role_choices = settings.DEFINITION_ROLE_CHOICES
 
 
@@ -131,6 +207,35 @@ class Definition(models.Model):
         list_filter = ['role']
         search_fields = ['gloss__idgloss']
 
+    def terms(self):
+        """Return a dictionary of the normalised words in the text
+        of this definition and the number of times each occurs"""
+
+        result = dict()
+        for term in search_words(self.text):
+            result[term] = result.get(term, 0) + 1
+        return result
+
+
+class DefinitionTerm(models.Model):
+    """A word occurring in a definition, these rows make up an inverted
+    index used to search definitions by word.  The gloss, role and published
+    flag are copied from the definition so that searches need no join.
+    Maintained by the Definition post_save signal."""
+
+    definition = models.ForeignKey(Definition)
+    gloss = models.ForeignKey("Gloss")
+    term = models.CharField(max_length=50, db_index=True)
+    frequency = models.IntegerField(default=1)
+    role = models.CharField(max_length=20)
+    published = models.BooleanField(default=True)
+
+    class Meta:
+        index_together = [['term', 'role', 'published']]
+
+    def __str__(self):
+        return "%s/%s" % (self.definition_id, self.term)
+
 class Language(models.Model):
     """A sign language name"""
 
@@ -325,6 +430,16 @@ have the same 'Annotation Idgloss' that means they differ in form in only
 minor or insignificant ways that can be ignored.""")
     # the idgloss used in transcription, may be shared between many signs
 
+    # normalised forms of idgloss and annotation_idgloss used for searching,
+    # maintained by a pre_save signal
+    idgloss_search = models.CharField(max_length=50, db_index=True, blank=True, editable=False)
+    annotation_idgloss_search = models.CharField(max_length=30, db_index=True, blank=True, editable=False)
+
+    # the current (version 0) video shown for this gloss, which is that of the
+    # sense 1 homophone for senses > 1, maintained by update_display_videos
+    display_video = models.ForeignKey('video.GlossVideo', null=True, blank=True, editable=False,
+                                      on_delete=models.SET_NULL, related_name='+')
+
 
     # languages that this gloss is part of
     language = models.ManyToManyField(Language)
@@ -406,36 +521,45 @@ minor or insignificant ways that can be ignored.""")
         return [(field.name, field.value_to_string(self)) for field in Gloss._meta.fields]
 
 
-    def get_fields_dict(self):
+    def get_fields_dict(self, media=None, keywords=None):
+        """Return a dictionary of the API_FIELDS of this gloss, its keywords
+        and links to the video and thumbnail.  media is a dictionary of
+        path to MediaFile, as returned by manifest.lookup_all(), and keywords
+        a list of the keyword texts of this gloss, to avoid queries per
+        gloss when exporting many glosses."""
+
+        from signbank.video import manifest
+
         fields = {}
-        for field in Gloss._meta.fields:
-            if field.name in settings.API_FIELDS:
-                category = fieldname_to_category(field.name)
-                if category != field.name:
-                    if not category in fields:
-                        fields[category] = {}
-                    fields[category][field.verbose_name.title()] = field.value_to_string(self)
-                else:
-                    fields[field.verbose_name.title()] = field.value_to_string(self)
+        for field, category, label in api_schema():
+            if category is not None:
+                if not category in fields:
+                    fields[category] = {}
+                fields[category][label] = field.value_to_string(self)
+            else:
+                fields[label] = field.value_to_string(self)
 
         # Get all the keywords associated with this sign
-        translation_set = self.translation_set.select_related('translation').all()
-        allkwds = ", ".join([x.translation.text for x in translation_set])
-        fields[Translation.__name__ + "s"] = allkwds
+        if keywords is None:
+            translation_set = self.translation_set.select_related('translation').all()
+            keywords = [x.translation.text for x in translation_set]
+        fields[Translation.__name__ + "s"] = ", ".join(keywords)
 
         fields["Link"] = settings.URL + '/dictionary/gloss/' + str(self.pk)
 
         video = self.get_video()
         if video:
-            videopath = video.videofile.path
-            if os.path.exists(videopath):
-                fields["VideoLink"] = settings.URL + self.get_video_url()
-                fields["VideoUpdated"] = os.path.getmtime(videopath)
-            imagepath, ext = os.path.splitext(videopath)
-            imagepath = imagepath + ".jpg"
-            if os.path.exists(os.path.join(settings.MEDIA_ROOT, imagepath)):
-                fields["ThumbnailLink"] = settings.URL + self.get_thumbnail_url()
-                fields["ThumnailUpdated"] = os.path.getmtime(imagepath)
+            name = video.videofile.name
+            if media is not None and name in media:
+                info = media[name]
+            else:
+                info = manifest.lookup([name])[name]
+            if info.exists:
+                fields["VideoLink"] = settings.URL + video.get_absolute_url()
+                fields["VideoUpdated"] = info.mtime
+            if info.poster:
+                fields["ThumbnailLink"] = settings.URL + video.poster_url(False)
+                fields["ThumnailUpdated"] = info.poster_mtime
 
         return fields
 
@@ -443,9 +567,14 @@ minor or insignificant ways that can be ignored.""")
         """Return a gloss navigation structure that can be used to
         generate next/previous links from within a template page"""
 
+        from signbank.dictionary.indexes import dictionary_order
+
+        (prev, next) = dictionary_order.neighbours(self, is_staff)
+        glosses = Gloss.objects.in_bulk([pk for pk in (prev, next) if pk is not None])
+
         result = dict()
-        result['next'] = self.next_dictionary_gloss(is_staff)
-        result['prev'] = self.prev_dictionary_gloss(is_staff)
+        result['next'] = glosses.get(next)
+        result['prev'] = glosses.get(prev)
         return result
 
     def admin_next_gloss(self):
@@ -461,29 +590,13 @@ minor or insignificant ways that can be ignored.""")
 
     def next_dictionary_gloss(self, staff=False):
         """Find the next gloss in dictionary order"""
-        if self.sn == None:
-            return None
-        elif staff:
-            set =  Gloss.objects.filter(sn__gt=self.sn).order_by('sn')
-        else:
-            set = Gloss.objects.filter(sn__gt=self.sn, inWeb__exact=True).order_by('sn')
-        if set:
-            return set[0]
-        else:
-            return None
+
+        return self.navigation(staff)['next']
 
     def prev_dictionary_gloss(self, staff=False):
         """Find the previous gloss in dictionary order"""
-        if self.sn == None:
-            return None
-        elif staff:
-            set = Gloss.objects.filter(sn__lt=self.sn).order_by('-sn')
-        else:
-            set = Gloss.objects.filter(sn__lt=self.sn, inWeb__exact=True).order_by('-sn')
-        if set:
-            return set[0]
-        else:
-            return None
+
+        return self.navigation(staff)['prev']
 
     def get_keyword_and_index(self, request_or_staff=False):
         """
@@ -495,21 +608,17 @@ minor or insignificant ways that can be ignored.""")
                             - request object - determine results by user permissions
         """
 
+        from signbank.dictionary.indexes import keyword_urls
+
         show_all_results = request_or_staff
         if request_or_staff is not True and request_or_staff is not False:
           show_all_results = request_or_staff.user.has_perm('dictionary.search_gloss')
 
-        # Get an arbitary keyword from the list of keywords for this gloss
-        keyword = str(self.translation_set.first().translation)
-
-        # Get the list of results for that keyword
-        keywords = Keyword.objects.filter(text=keyword).first().translation_set.filter()
-        if not show_all_results:
-            keywords = keywords.filter(gloss__inWeb__exact=True)
-
-        for index, value in enumerate(keywords.values('gloss')):
-            if value['gloss'] == self.id:
-                return (keyword, index + 1)
+        # the keyword of the first translation of this gloss and the
+        # position of this gloss in the results for that keyword
+        found = keyword_urls.keyword_and_index(self.id, show_all_results)
+        if found is not None:
+            return found
 
         return ("UNKNOWN-OR-MISSING-GLOSS", 0)
 
@@ -547,15 +656,12 @@ minor or insignificant ways that can be ignored.""")
         return self
 
     def get_video(self):
-        """Return the video object for this gloss or None if no video available"""
-
-        video_with_gloss = self.get_video_gloss()
+        """Return the video object for this gloss or None if no video available,
+        use select_related('display_video') to fetch it with the gloss"""
 
-        try:
-            video = video_with_gloss.glossvideo_set.get(version__exact=0)
-            return video
-        except:
+        if self.display_video_id is None:
             return None
+        return self.display_video
 
     def count_videos(self):
         """Return a count of the number of videos we have
@@ -577,6 +683,18 @@ minor or insignificant ways that can be ignored.""")
         else:
             return ""
 
+    def get_existing_video_url(self):
+        """return the url of the video for this gloss if the video file
+        is present on disk according to the media manifest, otherwise None"""
+
+        from signbank.video import manifest
+
+        video = self.get_video()
+        if video != None and manifest.exists(video.videofile.name):
+            return video.get_absolute_url()
+        else:
+            return None
+
     def get_thumbnail_url(self):
         """return  the url of the thumbnail for this gloss which may be that of a homophone"""
 
@@ -710,54 +828,286 @@ class Relation(models.Model):
         ordering = ['source']
 
 
+class MinimalPair(models.Model):
+    """Two glosses whose phonology differs only in one field, the
+    parameter.  The table is filled by the find_minimal_pairs command,
+    source is always the gloss with the lower id."""
+
+    source = models.ForeignKey(Gloss, related_name="minimal_pair_sources")
+    target = models.ForeignKey(Gloss, related_name="minimal_pair_targets")
+    parameter = models.CharField(max_length=50, db_index=True)
+
+    class Meta:
+        ordering = ['parameter', 'source']
+
+    def __unicode__(self):
+        return u"%s / %s (%s)" % (self.source, self.target, self.parameter)
+
+
+GLOSS_CHANGE_CHOICES = (('created', 'Created'),
+                        ('updated', 'Updated'),
+                        ('keywords', 'Keywords'),
+                        ('definition', 'Definition'),
+                        ('region', 'Region'),
+                        ('relation', 'Relation'),
+                        ('tags', 'Tags'),
+                        ('video', 'Video'),
+                        ('deleted', 'Deleted'),
+                        )
+
+class GlossChange(models.Model):
+    """An entry in the append-only log of changes to glosses, used to send
+    the mobile apps just the glosses changed since their last update.
+    The gloss is recorded by id so that entries outlive deleted glosses."""
+
+    gloss_id = models.IntegerField(db_index=True)
+    change = models.CharField(max_length=20, choices=GLOSS_CHANGE_CHOICES)
+    time = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['time', 'pk']
+
+    def __unicode__(self):
+        return u"%s %s at %s" % (self.gloss_id, self.change, self.time)
+
+
+def log_gloss_change(gloss, change):
+    """Record a change of the given type to a gloss (or gloss id)"""
+
+    GlossChange.objects.create(gloss_id=getattr(gloss, 'pk', gloss), change=change)
+
+
+
+class DuplicateGloss(models.Model):
+    """Two glosses that may be duplicate entries for the same sign, with
+    the score of their similarity and the blocks (name, keywords,
+    phonology) they were found in.  The table is filled by the
+    find_duplicates command, source is always the gloss with the lower id."""
+
+    source = models.ForeignKey(Gloss, related_name="duplicate_sources")
+    target = models.ForeignKey(Gloss, related_name="duplicate_targets")
+    score = models.FloatField(db_index=True)
+    reasons = models.CharField(max_length=50)
+
+    class Meta:
+        ordering = ['-score', 'source']
+
+    def __unicode__(self):
+        return u"%s / %s (%.2f)" % (self.source, self.target, self.score)
+
+
+class Generation(models.Model):
+    """A generation number of the in-memory indexes or of something cached,
+    bumped whenever the data it was built from changes.  Kept in the
+    database so that every process sees the same numbers, maintained by
+    signbank.dictionary.generations"""
+
+    key = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField()
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.key, self.value)
+
+
+
+FIELD_CATEGORIES = {'domhndsh': 'Handshape', 'subhndsh': 'Handshape', 'final_domdndsh': 'Handshape', 'final_subhndsh': 'Handshape',
+                    'locprim': 'Location', 'locPrimLH': 'Location', 'final_loc': 'Location', 'loc_second': 'Location',
+                    'initial_secondary_loc': 'Location', 'final_secondary_loc': 'Location',
+                    'handCh': 'handshapeChange',
+                    'oriCh': 'oriChange',
+                    'movSh': 'MovementShape',
+                    'movDir': 'MovementDir',
+                    'movMan': 'MovementMan',
+                    'contType': 'ContactType',
+                    'namEnt': 'NamedEntity',
+                    'iconType': 'iconicity',
+                    'mrpType': 'MorphemeType',
+                    'domFlex': 'DominantHandFlexion',
+                    'domSF': 'DominantHandSelectedFingers',
+                    'wordClass': 'WordClass', 'wordClass2': 'WordClass',
+                    'hasComponentOfType': 'MorphologyType',
+                    'hasMorphemeOfType': 'MorphemeType',
+                    'hsFingSel': 'FingerSelection', 'hsFingSel2': 'FingerSelection', 'hsFingUnsel': 'FingerSelection',
+                    'hsFingConf': 'JointConfiguration', 'hsFingConf2': 'JointConfiguration',
+                    'hsNumSel': 'Quantity',
+                    'hsAperture': 'Aperture',
+                    'hsThumb': 'Thumb',
+                    'hsSpread': 'Spreading',
+                    }
 
 def fieldname_to_category(fieldname):
 
-    if fieldname in ['domhndsh','subhndsh','final_domdndsh','final_subhndsh']:
-        field_category = 'Handshape'
-    elif fieldname in ['locprim','locPrimLH','final_loc','loc_second','initial_secondary_loc','final_secondary_loc']:
-        field_category = 'Location'
-    elif fieldname == 'handCh':
-        field_category = 'handshapeChange'
-    elif fieldname == 'oriCh':
-        field_category = 'oriChange'
-    elif fieldname == 'movSh':
-        field_category = 'MovementShape'
-    elif fieldname == 'movDir':
-        field_category = 'MovementDir'
-    elif fieldname == 'movMan':
-        field_category = 'MovementMan'
-    elif fieldname == 'contType':
-        field_category = 'ContactType'
-    elif fieldname == 'namEnt':
-        field_category = 'NamedEntity'
-    elif fieldname == 'iconType':
-        field_category = 'iconicity'
-    elif fieldname == 'mrpType':
-        field_category = 'MorphemeType'
-    elif fieldname == 'domFlex':
-        field_category = 'DominantHandFlexion'
-    elif fieldname == 'domSF':
-        field_category = 'DominantHandSelectedFingers'
-    elif fieldname in ['wordClass', 'wordClass2']:
-        field_category = 'WordClass'
-    elif fieldname == 'hasComponentOfType':
-        field_category = 'MorphologyType'
-    elif fieldname == 'hasMorphemeOfType':
-        field_category = 'MorphemeType'
-    elif fieldname in ['hsFingSel', 'hsFingSel2', 'hsFingUnsel']:
-        field_category = 'FingerSelection'
-    elif fieldname in ['hsFingConf', 'hsFingConf2']:
-        field_category = 'JointConfiguration'
-    elif fieldname == 'hsNumSel':
-        field_category = 'Quantity'
-    elif fieldname == 'hsAperture':
-        field_category = 'Aperture'
-    elif fieldname == 'hsThumb':
-        field_category = 'Thumb'
-    elif fieldname == 'hsSpread':
-        field_category = 'Spreading'
-    else:
-        field_category = fieldname
-
-    return field_category
+    return FIELD_CATEGORIES.get(fieldname, fieldname)
+
+
+# API_FIELDS -> [(field, category or None, label)], see api_schema
+_api_schemas = dict()
+
+def api_schema():
+    """The Gloss fields in settings.API_FIELDS with the category each is
+    grouped under in get_fields_dict (None if it is not grouped) and its
+    label, worked out once for each value of the setting"""
+
+    key = tuple(settings.API_FIELDS)
+    if key not in _api_schemas:
+        schema = []
+        for field in Gloss._meta.fields:
+            if field.name in settings.API_FIELDS:
+                category = fieldname_to_category(field.name)
+                schema.append((field, category if category != field.name else None, field.verbose_name.title()))
+        _api_schemas[key] = schema
+    return _api_schemas[key]
+
+
+def update_keyword_search_key(sender, instance, **kwargs):
+    """Set the normalised search key on a keyword before it is saved"""
+
+    instance.text_search = normalise_search_key(instance.text)[:100]
+
+def update_gloss_search_keys(sender, instance, **kwargs):
+    """Set the normalised search keys on a gloss before it is saved"""
+
+    instance.idgloss_search = normalise_search_key(instance.idgloss)[:50]
+    instance.annotation_idgloss_search = normalise_search_key(instance.annotation_idgloss)[:30]
+
+# glosses with this tag are hidden from anonymous users by ANON_SAFE_SEARCH
+CRUDE_TAG = 'lexis:crude'
+
+def is_crude(gloss_id):
+    """Return True if the gloss with this id is tagged as crude"""
+
+    return tagging.models.TaggedItem.objects.filter(tag__name=CRUDE_TAG,
+                                                    content_type=ContentType.objects.get_for_model(Gloss),
+                                                    object_id=gloss_id).exists()
+
+def update_keyword_visibility(keyword_ids):
+    """Recompute the public visibility flags of some keywords
+    from the flags on their translations"""
+
+    for kwid in set(keyword_ids):
+        translations = Translation.objects.filter(translation=kwid)
+        Keyword.objects.filter(pk=kwid).update(is_public=translations.filter(is_public=True).exists(),
+                                               is_public_safe=translations.filter(is_public_safe=True).exists())
+
+def update_visibility(gloss):
+    """Recompute the public visibility flags on the translations
+    of a gloss and on their keywords"""
+
+    public = bool(gloss.inWeb)
+    safe = public and not is_crude(gloss.pk)
+
+    translations = Translation.objects.filter(gloss=gloss)
+    translations.update(is_public=public, is_public_safe=safe)
+    update_keyword_visibility(translations.values_list('translation', flat=True))
+
+def update_gloss_visibility(sender, instance, **kwargs):
+    """Signal handler to update visibility flags when a gloss is saved"""
+
+    update_visibility(instance)
+
+def update_translation_visibility(sender, instance, **kwargs):
+    """Set the visibility flags on a translation before it is saved"""
+
+    public = bool(Gloss.objects.filter(pk=instance.gloss_id).values_list('inWeb', flat=True)[0])
+    instance.is_public = public
+    instance.is_public_safe = public and not is_crude(instance.gloss_id)
+
+def update_translation_keyword_visibility(sender, instance, **kwargs):
+    """Update the flags on the keyword when a translation is saved or deleted"""
+
+    update_keyword_visibility([instance.translation_id])
+
+def update_tagged_visibility(sender, instance, **kwargs):
+    """Update visibility when a gloss is tagged or untagged, the crude tag
+    affects safe search"""
+
+    if instance.content_type_id == ContentType.objects.get_for_model(Gloss).id:
+        try:
+            update_visibility(Gloss.objects.get(pk=instance.object_id))
+        except Gloss.DoesNotExist:
+            pass
+
+def update_gloss_display_video(sender, instance, **kwargs):
+    """A change of sense can change which video a gloss displays"""
+
+    update_display_videos([instance.pk])
+
+def update_relation_display_video(sender, instance, **kwargs):
+    """Adding or removing a homophone relation can change the video of the source"""
+
+    if instance.role == 'homophone':
+        update_display_videos([instance.source_id])
+
+def update_definition_terms(sender, instance, **kwargs):
+    """Rebuild the index terms of a definition after it is saved"""
+
+    DefinitionTerm.objects.filter(definition=instance).delete()
+    DefinitionTerm.objects.bulk_create([DefinitionTerm(definition=instance, gloss_id=instance.gloss_id,
+                                                       term=term, frequency=frequency,
+                                                       role=instance.role, published=instance.published)
+                                        for term, frequency in instance.terms().items()])
+
+pre_save.connect(update_keyword_search_key, sender=Keyword, dispatch_uid='keyword_search_key')
+pre_save.connect(update_gloss_search_keys, sender=Gloss, dispatch_uid='gloss_search_keys')
+post_save.connect(update_definition_terms, sender=Definition, dispatch_uid='definition_terms')
+post_save.connect(update_gloss_visibility, sender=Gloss, dispatch_uid='gloss_visibility')
+pre_save.connect(update_translation_visibility, sender=Translation, dispatch_uid='translation_visibility')
+post_save.connect(update_translation_keyword_visibility, sender=Translation, dispatch_uid='translation_keyword_visibility_save')
+post_delete.connect(update_translation_keyword_visibility, sender=Translation, dispatch_uid='translation_keyword_visibility_delete')
+post_save.connect(update_tagged_visibility, sender=tagging.models.TaggedItem, dispatch_uid='tagged_visibility_save')
+post_delete.connect(update_tagged_visibility, sender=tagging.models.TaggedItem, dispatch_uid='tagged_visibility_delete')
+post_save.connect(update_gloss_display_video, sender=Gloss, dispatch_uid='gloss_display_video')
+post_save.connect(update_relation_display_video, sender=Relation, dispatch_uid='relation_display_video_save')
+post_delete.connect(update_relation_display_video, sender=Relation, dispatch_uid='relation_display_video_delete')
+
+
+def log_gloss_saved(sender, instance, created, **kwargs):
+    log_gloss_change(instance, created and 'created' or 'updated')
+
+def log_gloss_deleted(sender, instance, **kwargs):
+    log_gloss_change(instance, 'deleted')
+
+# the gloss field and type of change logged for a change to a related model
+GLOSS_CHANGE_MODELS = {Translation: ('gloss_id', 'keywords'),
+                       Definition: ('gloss_id', 'definition'),
+                       Region: ('gloss_id', 'region'),
+                       Relation: ('source_id', 'relation'),
+                       }
+
+def log_related_change(sender, instance, **kwargs):
+    """Log a change to a translation, definition, region or relation
+    against its gloss"""
+
+    (field, change) = GLOSS_CHANGE_MODELS[sender]
+    if getattr(instance, field) is not None:
+        log_gloss_change(getattr(instance, field), change)
+
+def log_keyword_change(sender, instance, created, **kwargs):
+    """A changed keyword changes every gloss that has it"""
+
+    if not created:
+        gloss_ids = set(Translation.objects.filter(translation=instance).values_list('gloss_id', flat=True))
+        GlossChange.objects.bulk_create([GlossChange(gloss_id=gloss_id, change='keywords') for gloss_id in gloss_ids])
+
+def log_tag_change(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Gloss).id:
+        log_gloss_change(instance.object_id, 'tags')
+
+# glosses and the things that make them up change in many places (the
+# admin, the editing views, ingest_csv) so every save is logged here
+post_save.connect(log_gloss_saved, sender=Gloss, dispatch_uid='gloss_change_saved')
+post_delete.connect(log_gloss_deleted, sender=Gloss, dispatch_uid='gloss_change_deleted')
+for model in GLOSS_CHANGE_MODELS:
+    post_save.connect(log_related_change, sender=model, dispatch_uid='gloss_change_save_%s' % model.__name__)
+    post_delete.connect(log_related_change, sender=model, dispatch_uid='gloss_change_delete_%s' % model.__name__)
+post_save.connect(log_keyword_change, sender=Keyword, dispatch_uid='gloss_change_keyword')
+post_save.connect(log_tag_change, sender=tagging.models.TaggedItem, dispatch_uid='gloss_change_tag_save')
+post_delete.connect(log_tag_change, sender=tagging.models.TaggedItem, dispatch_uid='gloss_change_tag_delete')
+
+
+# connect the signal handlers that keep the search indexes and caches up to
+# date, the modules built on the indexes are imported at the end of indexes
+import signbank.dictionary.indexes
+import signbank.dictionary.pagecache
+import signbank.dictionary.regional
+import signbank.dictionary.packages
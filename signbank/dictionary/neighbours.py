@@ -0,0 +1,155 @@
+"""Phonologically similar signs, "signs that look like this".
+
+Two signs are scored by a weighted match over the phonology fields: the
+same handshape scores 4 and a handshape from the same family (eg. 5.1
+Spread and 5.3 Flat) scores 2, the same primary location scores 3, the
+same orientation 2 and the same secondary location 1.  Missing values
+score nothing.
+
+The scores of one gloss against every other are computed together from
+the bitsets of the phonology index.  Each (field, value) bitset of the
+gloss's own values is added, with its weight, into a bit-sliced counter:
+plane i is a bitset holding bit i of every gloss's score, so adding a
+bitset is a ripple carry of a few long integer operations however many
+glosses there are.  The top scores are then read off the planes from the
+most significant down.
+
+Computing the list of one gloss takes under a millisecond, less than a
+round trip to a cache, so lists are not stored but computed from the
+in-memory index as they are asked for.  An edit to a gloss is therefore
+reflected in every list straight away.
+"""
+
+import threading
+
+from signbank.dictionary.indexes import phonology_index, bitset_count
+
+# field, weight for the same value, weight for the same handshape family
+WEIGHTS = (('domhndsh', 4, 2), ('subhndsh', 4, 2),
+           ('final_domhndsh', 4, 2), ('final_subhndsh', 4, 2),
+           ('locprim', 3, 0), ('final_loc', 3, 0), ('locsecond', 1, 0),
+           ('initial_palm_orientation', 2, 0), ('final_palm_orientation', 2, 0),
+           ('initial_relative_orientation', 2, 0), ('final_relative_orientation', 2, 0),
+           ('initial_secondary_loc', 1, 0), ('final_secondary_loc', 1, 0))
+
+DEFAULT_COUNT = 10
+
+_lock = threading.Lock()
+_table = {'generation': None}
+
+
+def family(handshape):
+    """The family of a handshape code, the part before the dot"""
+
+    return handshape.split('.')[0]
+
+
+def feature_table():
+    """The phonology bitsets with the handshape family bitsets added,
+    rebuilt when the phonology index changes"""
+
+    generation = phonology_index.current_generation()
+    data = phonology_index.get()
+    with _lock:
+        if _table['generation'] != generation or _table.get('data') is not data:
+            families = dict()
+            for field, weight, family_weight in WEIGHTS:
+                if family_weight:
+                    bits = dict()
+                    for value, valuebits in data['bits'][field].items():
+                        bits[family(value)] = bits.get(family(value), 0) | valuebits
+                    families[field] = bits
+            _table.update(generation=generation, data=data, families=families)
+        return dict(_table)
+
+
+def add_weighted(planes, bits, weight):
+    """Add weight to the counter of every gloss in bits"""
+
+    j = 0
+    while weight:
+        if weight & 1:
+            carry = bits
+            i = j
+            while carry:
+                while i >= len(planes):
+                    planes.append(0)
+                planes[i], carry = planes[i] ^ carry, planes[i] & carry
+                i += 1
+        weight >>= 1
+        j += 1
+
+
+def score_planes(values, table):
+    """Return the bit-sliced scores of every gloss against a gloss with
+    these phonology values (in phonology_index.fields order)"""
+
+    data = table['data']
+    planes = []
+    current = dict(zip(phonology_index.fields, values))
+    for field, weight, family_weight in WEIGHTS:
+        value = current.get(field)
+        if value is None:
+            continue
+        exact = data['bits'][field].get(value, 0)
+        if family_weight:
+            add_weighted(planes, table['families'][field].get(family(value), 0), family_weight)
+            add_weighted(planes, exact, weight - family_weight)
+        else:
+            add_weighted(planes, exact, weight)
+    return planes
+
+
+def score_of(planes, gloss_id):
+    return sum([((plane >> gloss_id) & 1) << i for i, plane in enumerate(planes)])
+
+
+def top_scores(planes, exclude, count):
+    """Return [(gloss id, score)] for the count highest scoring glosses
+    other than exclude, best first then by id, ignoring zero scores"""
+
+    candidates = 0
+    for plane in planes:
+        candidates |= plane
+    candidates &= ~(1 << exclude)
+
+    # walk down the planes keeping the glosses that must be in the result
+    # (chosen) and those tied on the bits seen so far (candidates)
+    chosen = []
+    remaining = count
+    for i in reversed(range(len(planes))):
+        high = candidates & planes[i]
+        n = bitset_count(high)
+        if n >= remaining:
+            candidates = high
+        else:
+            chosen.append(high)
+            remaining -= n
+            candidates &= ~planes[i]
+
+    ids = []
+    for bits in chosen:
+        while bits:
+            low = bits & -bits
+            ids.append(low.bit_length() - 1)
+            bits ^= low
+    # the remaining places go to the lowest ids of those tied at the threshold
+    while candidates and remaining:
+        low = candidates & -candidates
+        ids.append(low.bit_length() - 1)
+        candidates ^= low
+        remaining -= 1
+
+    found = [(gloss_id, score_of(planes, gloss_id)) for gloss_id in ids]
+    found.sort(key=lambda (gloss_id, score): (-score, gloss_id))
+    return found
+
+
+def neighbours(gloss_id, count=DEFAULT_COUNT):
+    """Return [(gloss id, score)] of the glosses that look most like this one"""
+
+    table = feature_table()
+    values = table['data']['glosses'].get(gloss_id)
+    if values is None:
+        return []
+    return top_scores(score_planes(values, table), gloss_id, count)
@@ -0,0 +1,234 @@
+"""Prebuilt snapshots of the package downloaded by the mobile apps.
+
+Building the package means reading every gloss, its keywords and its
+video details, far too much work to repeat on every app sync.  Instead
+the package is built into SIGNBANK_PACKAGES_FOLDER as a snapshot, named
+by the SHA-1 hash of its content, and served from there.  The hash is
+also the ETag of the download so an app that already has the current
+snapshot gets a 304 Not Modified.
+
+A generation number shared by every process is bumped whenever a gloss,
+keyword or video changes.  When a request finds the snapshot is from an
+older generation it is still served and a new one is built in a background
+thread (or straight away if PACKAGE_BUILD_IN_BACKGROUND is False).  The
+build_package command builds it ahead of time, eg. after a deploy.
+
+An app that already has the data asks for a patch since its last update.
+The GlossChange log gives the glosses changed since then, and only those
+are sent, with the ids of the deleted ones.
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from zipfile import ZipFile
+
+from signbank.dictionary.models import Gloss, Keyword, Translation, GlossChange
+from signbank.dictionary import generations
+from signbank.log import debug
+
+GENERATION_KEY = 'dictionary:package-generation'
+SNAPSHOT_PREFIX = 'signbank_package'
+
+# a patch with more changed glosses than this has all of them instead
+MAX_PATCH_GLOSSES = 500
+
+_lock = threading.Lock()
+_builder = {'thread': None}
+_glosses = {'etag': None, 'glosses': None}
+
+
+def current_generation():
+    return generations.current(GENERATION_KEY)
+
+
+def invalidate(*args, **kwargs):
+    """Mark the snapshot as out of date, can be connected as a signal handler"""
+
+    generations.bump(GENERATION_KEY)
+
+
+def pointer_path():
+    """The file recording the current snapshot"""
+
+    return os.path.join(settings.SIGNBANK_PACKAGES_FOLDER, SNAPSHOT_PREFIX + '.json')
+
+
+def package_data(glosses, since_timestamp=0):
+    """The contents of a package, the glosses with the links to videos and
+    images updated since since_timestamp"""
+
+    video_urls = {}
+    image_urls = {}
+    for gloss_id, details in glosses.items():
+        if "VideoUpdated" in details and details["VideoUpdated"] > since_timestamp:
+            video_urls[gloss_id] = details["VideoLink"]
+        if "ThumnailUpdated" in details and details["ThumnailUpdated"] > since_timestamp:
+            image_urls[gloss_id] = details["ThumbnailLink"]
+
+    return {'video_urls': video_urls,
+            'image_urls': image_urls,
+            'glosses': glosses}
+
+
+def current_snapshot():
+    """Return the record of the current snapshot, a dictionary with keys
+    generation, etag, file (the path of the zip) and built (a timestamp),
+    or None if there isn't one"""
+
+    try:
+        with open(pointer_path()) as f:
+            snapshot = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not os.path.exists(snapshot['file']):
+        return None
+    return snapshot
+
+
+def build_snapshot():
+    """Build a snapshot of the package from the current data, returns its record"""
+
+    import signbank.tools
+
+    # read the generation first so that a change made during the build
+    # leaves the snapshot out of date
+    generation = current_generation()
+    data = package_data(signbank.tools.get_gloss_data())
+    etag = hashlib.sha1(json.dumps(data, sort_keys=True)).hexdigest()
+
+    folder = settings.SIGNBANK_PACKAGES_FOLDER
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    # files are written under a temporary name and renamed into place
+    # so that a half written file is never served
+    path = os.path.join(folder, '%s.%s.zip' % (SNAPSHOT_PREFIX, etag))
+    if not os.path.exists(path):
+        (fd, tmp) = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        os.close(fd)
+        signbank.tools.create_zip_with_json_files(data, tmp)
+        os.chmod(tmp, 0644)
+        os.rename(tmp, path)
+
+    snapshot = {'generation': generation, 'etag': etag, 'file': path, 'built': int(time.time())}
+    (fd, tmp) = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    os.rename(tmp, pointer_path())
+
+    # remove older snapshots, keeping the one before this for requests
+    # that read the previous record and haven't opened the file yet
+    older = [os.path.join(folder, name) for name in os.listdir(folder)
+             if name.startswith(SNAPSHOT_PREFIX + '.') and name.endswith('.zip')]
+    older = [p for p in older if p != path]
+    older.sort(key=os.path.getmtime)
+    for old in older[:-1]:
+        try:
+            os.unlink(old)
+        except OSError:
+            pass
+
+    debug("built package snapshot %s: %d glosses" % (etag, len(data['glosses'])))
+    return snapshot
+
+
+def build_in_background():
+    """Start a thread to build a new snapshot unless one is running"""
+
+    def run():
+        try:
+            build_snapshot()
+        finally:
+            # the thread has its own database connection
+            connection.close()
+
+    with _lock:
+        thread = _builder['thread']
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=run, name='package-snapshot')
+        thread.daemon = True
+        _builder['thread'] = thread
+        thread.start()
+
+
+def snapshot():
+    """Return the record of the snapshot to serve, building one if there is
+    none and starting a rebuild if it is out of date"""
+
+    current = current_snapshot()
+    if current is None:
+        with _lock:
+            current = current_snapshot() or build_snapshot()
+    elif current['generation'] != current_generation():
+        if settings.PACKAGE_BUILD_IN_BACKGROUND:
+            build_in_background()
+        else:
+            current = build_snapshot()
+    return current
+
+
+def snapshot_glosses(current):
+    """Read the gloss data back out of a snapshot, the last one read
+    is kept in memory"""
+
+    if _glosses['etag'] != current['etag']:
+        with ZipFile(current['file']) as archive:
+            glosses = json.loads(archive.read('glosses.json'))
+        # json keys are strings, the gloss ids are ints everywhere else
+        glosses = dict([(int(pk), details) for pk, details in glosses.items()])
+        _glosses.update(etag=current['etag'], glosses=glosses)
+    return _glosses['glosses']
+
+
+def last_change():
+    """The id of the latest change log entry, 0 if there is none"""
+
+    found = GlossChange.objects.order_by('-pk').values_list('pk', flat=True)[:1]
+    return found[0] if found else 0
+
+
+def changed_since(since_timestamp):
+    """Return the set of ids of glosses changed after since_timestamp,
+    or None if the change log doesn't go back that far"""
+
+    since = datetime.datetime.fromtimestamp(since_timestamp, timezone.utc)
+    first = GlossChange.objects.values_list('time', flat=True)[:1]
+    if not first or first[0] > since:
+        return None
+    return set(GlossChange.objects.filter(time__gt=since).values_list('gloss_id', flat=True))
+
+
+def patch_data(current, since_timestamp):
+    """The contents of a patch for an app last updated at since_timestamp:
+    the glosses changed since then, the ids of those deleted and links to
+    the videos and images updated since then"""
+
+    import signbank.tools
+
+    glosses = snapshot_glosses(current)
+    data = package_data(glosses, since_timestamp)
+    data['deleted'] = []
+
+    changed = changed_since(since_timestamp)
+    if changed is not None and len(changed) <= MAX_PATCH_GLOSSES:
+        data['glosses'] = signbank.tools.get_gloss_data(changed) if changed else {}
+        data['deleted'] = sorted(changed - set(data['glosses'].keys()))
+    return data
+
+
+# anything that goes into the package makes the snapshot out of date,
+# video changes are connected in signbank.video.models
+for model in (Gloss, Translation, Keyword):
+    post_save.connect(invalidate, sender=model, dispatch_uid='package_save_%s' % model.__name__)
+    post_delete.connect(invalidate, sender=model, dispatch_uid='package_delete_%s' % model.__name__)
@@ -0,0 +1,183 @@
+"""Cache of the rendered public word, regional and gloss pages.
+
+These pages are the same for every anonymous visitor but take a dozen
+or more queries to build.  The rendered HTML is stored in the Django
+cache keyed by the request path and the django_mobile flavour.  Only
+pages for anonymous visitors are cached, a logged in user's pages show
+their name and a menu that depends on their permissions (and for staff
+the edit forms).
+
+Each cached page also depends on generation numbers for the keyword or
+gloss it shows and a global generation.  Signals on the models shown in
+these pages bump the generation of the affected keywords and glosses so
+that stale pages are never served, changes that can affect every page
+(sign numbering, publication, regional template pages) bump the global
+generation.
+
+The CSRF token of any form in a page is stored as a placeholder and
+filled in for each visitor when the page is served from the cache.
+"""
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.encoding import force_bytes
+
+import django_mobile
+import hashlib
+from functools import wraps
+
+from signbank.dictionary.models import Gloss, Keyword, Translation, Region, Definition, Relation
+from signbank.dictionary import generations
+from signbank.pages.models import Page
+from tagging.models import TaggedItem
+from signbank.log import debug
+
+GLOBAL_SCOPE = 'all'
+CSRF_PLACEHOLDER = '@@signbank-csrf-token@@'
+
+
+def _hash(value):
+    return hashlib.md5(force_bytes(value)).hexdigest()
+
+
+def generation_key(scope):
+    """Cache key for the generation number of a scope, eg. keyword:<text>"""
+
+    return 'dictionary:page-generation:%s' % _hash(scope)
+
+
+def bump(*scopes):
+    """Invalidate the cached pages in each scope"""
+
+    for scope in scopes:
+        generations.bump(generation_key(scope))
+
+
+def page_key(request, scope):
+    """The cache key for the page requested, built from everything
+    that the rendered page depends on"""
+
+    scopes = [GLOBAL_SCOPE, scope]
+    current = generations.current_many([generation_key(s) for s in scopes])
+
+    parts = [request.get_full_path(), django_mobile.get_flavour(request)]
+    parts.extend([str(current[generation_key(s)]) for s in scopes])
+
+    return 'dictionary:page:%s' % _hash(u'|'.join(parts))
+
+
+def cache_public_page(argument, prefix):
+    """Decorator for a view that renders a public page for the keyword or
+    gloss named by the view argument `argument`.  The page is cached in the
+    scope prefix:<value> so that bump('prefix:<value>') invalidates it."""
+
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+
+            if request.method != 'GET' or request.user.is_authenticated():
+                return view(request, *args, **kwargs)
+
+            if argument in kwargs:
+                value = kwargs[argument]
+            else:
+                value = args[0]
+
+            key = page_key(request, u'%s:%s' % (prefix, value))
+            cached = cache.get(key)
+            if cached is not None:
+                (content, content_type) = cached
+                if CSRF_PLACEHOLDER in content:
+                    content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+
+            if response.status_code == 200:
+                content = response.content
+                token = request.META.get('CSRF_COOKIE')
+                if token:
+                    content = content.replace(token, CSRF_PLACEHOLDER)
+                cache.set(key, (content, response['Content-Type']), settings.PAGE_CACHE_TIMEOUT)
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def keyword_scopes(gloss_id):
+    """The scopes of the keyword pages that can show this gloss"""
+
+    texts = Translation.objects.filter(gloss=gloss_id).values_list('translation__text', flat=True)
+    return ['keyword:%s' % text for text in texts]
+
+
+def invalidate_gloss(gloss_id):
+    """Invalidate the gloss page and keyword pages of a gloss"""
+
+    idgloss = Gloss.objects.filter(pk=gloss_id).values_list('idgloss', flat=True)
+    scopes = ['idgloss:%s' % i for i in idgloss] + keyword_scopes(gloss_id)
+    debug("invalidating cached pages for gloss %s" % gloss_id)
+    bump(*scopes)
+
+
+def invalidate_all(sender, instance, **kwargs):
+    """A change to a gloss can alter the sign count and navigation on
+    every page, a change to a page can alter any regional template"""
+
+    bump(GLOBAL_SCOPE)
+
+
+def invalidate_gloss_pages(sender, instance, **kwargs):
+    """Signal handler for changes to objects related to a gloss by
+    a gloss foreign key (regions, definitions, videos)"""
+
+    invalidate_gloss(instance.gloss_id)
+
+
+def invalidate_translation_pages(sender, instance, **kwargs):
+    """Changing a translation renumbers the pages of its keyword
+    and changes the keyword list on the gloss pages"""
+
+    # the keyword may already be gone if it is being deleted
+    for text in Keyword.objects.filter(pk=instance.translation_id).values_list('text', flat=True):
+        bump('keyword:%s' % text)
+    invalidate_gloss(instance.gloss_id)
+
+
+def invalidate_keyword_pages(sender, instance, **kwargs):
+    """A keyword has been saved or deleted, the text may have changed so
+    we can't tell which pages are affected"""
+
+    bump(GLOBAL_SCOPE)
+
+
+def invalidate_relation_pages(sender, instance, **kwargs):
+    invalidate_gloss(instance.source_id)
+    invalidate_gloss(instance.target_id)
+
+
+def invalidate_tagged_pages(sender, instance, **kwargs):
+    """Tags such as lexis:crude change which signs anonymous users see"""
+
+    if instance.content_type_id == ContentType.objects.get_for_model(Gloss).id:
+        invalidate_gloss(instance.object_id)
+
+
+for model, handler in ((Gloss, invalidate_all),
+                       (Page, invalidate_all),
+                       (Keyword, invalidate_keyword_pages),
+                       (Translation, invalidate_translation_pages),
+                       (Region, invalidate_gloss_pages),
+                       (Definition, invalidate_gloss_pages),
+                       (Relation, invalidate_relation_pages),
+                       (TaggedItem, invalidate_tagged_pages)):
+    post_save.connect(handler, sender=model, dispatch_uid='page_cache_save_%s' % model.__name__)
+    post_delete.connect(handler, sender=model, dispatch_uid='page_cache_delete_%s' % model.__name__)
@@ -0,0 +1,209 @@
+"""Regional information for a gloss bundled up for the word and quiz views.
+
+The bundle holds the regions of a gloss (with their dialect and language),
+the map images to show for them and the content of the gloss's regional
+template page.  It is built with one query for the regions and one for the
+page and kept in the Django cache until a region of the gloss or the gloss
+itself changes.  Changes to dialects, languages or pages invalidate every
+bundle.  Both are generation numbers (see generations) so a change made
+in one process is seen by the caches of all of them.
+
+The map is a stack of transparent overlays, a base image for each language
+and one for each dialect (traditional or not).  Where PIL is available the
+overlays for each distinct set of dialects are composited into a single
+PNG under REGION_MAP_DIRECTORY in MEDIA_ROOT so that a page needs just
+one map image.  Composites are made when a bundle is first built or in
+bulk with the build_region_maps command, without PIL pages fall back to
+the layered images.  The name of a composite depends on the overlays it
+is made from and when they were last changed, so renaming a dialect or
+replacing its map gives a new composite rather than a stale one.
+"""
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+import hashlib
+import os
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from signbank.dictionary.models import Gloss, Region, Dialect, Language
+from signbank.dictionary import generations
+from signbank.pages.models import Page
+from signbank.log import debug
+
+GENERATION_KEY = 'dictionary:regional-generation'
+
+
+def map_image_for_regions(regions):
+    """Get the right map images for this region set
+    """
+
+    # Add a map for every unique language and dialect we have
+    # regional information on
+    # This may look odd if there is more than one language
+    images = []
+    for region in regions:
+        language_name = region.dialect.language.name.replace(" ", "")
+        dialect_name = region.dialect.name.replace(" ", "")
+        dialect_extension = ""
+        if region.traditional:
+            dialect_extension = "-traditional"
+
+        language_filename = "images/maps/" + language_name + ".png"
+        dialect_filename = "images/maps/" + language_name + "/" + dialect_name + dialect_extension + ".png"
+
+        if language_filename not in images:
+            images.append(language_filename)
+        if dialect_filename not in images:
+            images.append(dialect_filename)
+
+    return images
+
+
+def overlay_version(images):
+    """A short digest of the overlay names and their modification times"""
+
+    digest = hashlib.md5()
+    for image in images:
+        source = finders.find(image)
+        mtime = source and os.path.getmtime(source) or 0
+        digest.update("%s:%d\n" % (image, mtime))
+    return digest.hexdigest()[:8]
+
+
+def composite_name(regions):
+    """The path, relative to MEDIA_ROOT, of the composite map for a set
+    of regions.  The name is made from the sorted dialect ids, with a t
+    suffix for traditional regions since they have their own overlay,
+    and the version of the overlays."""
+
+    parts = sorted(set([(r.dialect_id, r.traditional) for r in regions]))
+    key = "-".join(["%d%s" % (dialect_id, traditional and "t" or "") for dialect_id, traditional in parts])
+    version = overlay_version(map_image_for_regions(regions))
+    return os.path.join(settings.REGION_MAP_DIRECTORY, "%s-%s.png" % (key, version))
+
+
+def render_composite(images, path):
+    """Composite the map images (static file paths, bottom layer first)
+    into a single optimised PNG at path relative to MEDIA_ROOT"""
+
+    canvas = None
+    for image in images:
+        source = finders.find(image)
+        if source is None:
+            raise IOError("map image %s not found" % image)
+        layer = Image.open(source).convert('RGBA')
+        if canvas is None:
+            canvas = Image.new('RGBA', layer.size, (255, 255, 255, 0))
+        elif layer.size != canvas.size:
+            # it wouldn't line up with the base map
+            debug("map image %s is %dx%d not %dx%d, left out" % ((image,) + layer.size + canvas.size))
+            continue
+        canvas.paste(layer, (0, 0), layer)
+
+    target = os.path.join(settings.MEDIA_ROOT, path)
+    if not os.path.isdir(os.path.dirname(target)):
+        os.makedirs(os.path.dirname(target))
+    # write to a temporary file and rename so that a half written
+    # image is never served
+    tmp = "%s.%d.tmp" % (target, os.getpid())
+    canvas.save(tmp, 'PNG', optimize=True)
+    os.rename(tmp, target)
+
+
+def composite_map(regions, create=True):
+    """Return the path of the composite map for these regions (in their
+    default order) relative to MEDIA_ROOT, rendering it if it is not on
+    disk and create is True.  Returns None if there is no composite and
+    it can't be made."""
+
+    if not regions:
+        return None
+
+    path = composite_name(regions)
+    if os.path.exists(os.path.join(settings.MEDIA_ROOT, path)):
+        return path
+    if not create or Image is None:
+        return None
+
+    try:
+        render_composite(map_image_for_regions(regions), path)
+    except (IOError, OSError, ValueError), e:
+        debug("can't make composite map %s: %s" % (path, e))
+        return None
+    return path
+
+
+def gloss_generation_key(gloss_id):
+    return '%s:%s' % (GENERATION_KEY, gloss_id)
+
+
+def bundle_key(gloss_id):
+    keys = [GENERATION_KEY, gloss_generation_key(gloss_id)]
+    current = generations.current_many(keys)
+    return 'dictionary:regional:%s:%s:%s' % (current[keys[0]], current[keys[1]], gloss_id)
+
+
+def build_bundle(gloss):
+    """Build the regional bundle of a gloss, a dictionary with keys
+
+      regions - the regions sorted by dialect name
+      ordered - the regions in their default order (by language then dialect)
+      images - the map images for the regions
+      composite - the composite map image (relative to MEDIA_ROOT) or None
+      template - the content of the regional template page or None"""
+
+    # the default ordering (by language then dialect) gives the order
+    # that the map images are layered in
+    regions = list(Region.objects.filter(gloss=gloss).select_related('dialect__language'))
+
+    template = None
+    if gloss.regional_template:
+        pages = Page.objects.filter(url__exact=gloss.regional_template).values_list('content', flat=True)[:1]
+        if pages:
+            template = pages[0]
+
+    return {'regions': sorted(regions, key=lambda r: r.dialect.name),
+            'ordered': regions,
+            'images': map_image_for_regions(regions),
+            'composite': composite_map(regions),
+            'template': template}
+
+
+def regional_bundle(gloss):
+    """Return the regional bundle of a gloss from the cache, building it if needed"""
+
+    key = bundle_key(gloss.pk)
+    bundle = cache.get(key)
+    if bundle is None:
+        bundle = build_bundle(gloss)
+        cache.set(key, bundle)
+    return bundle
+
+
+def invalidate_region(sender, instance, **kwargs):
+    generations.bump(gloss_generation_key(instance.gloss_id))
+
+
+def invalidate_gloss(sender, instance, **kwargs):
+    # the regional template may have changed
+    generations.bump(gloss_generation_key(instance.pk))
+
+
+def invalidate_all(sender, instance, **kwargs):
+    generations.bump(GENERATION_KEY)
+
+
+for model, handler in ((Region, invalidate_region),
+                       (Gloss, invalidate_gloss),
+                       (Dialect, invalidate_all),
+                       (Language, invalidate_all),
+                       (Page, invalidate_all)):
+    post_save.connect(handler, sender=model, dispatch_uid='regional_bundle_save_%s' % model.__name__)
+    post_delete.connect(handler, sender=model, dispatch_uid='regional_bundle_delete_%s' % model.__name__)
@@ -7,6 +7,7 @@ import json
 
 from tagging.models import Tag, TaggedItem
 from signbank.dictionary.models import Gloss
+from signbank.dictionary.indexes import tag_index
 
 
 def taglist_json(request):
@@ -25,7 +26,7 @@ def taglist(request, tag=None):
     if tag:
         # get the glosses with this tag
         tagobj = get_object_or_404(Tag, name=tag)
-        gloss_list = TaggedItem.objects.get_by_model(Gloss, tagobj)
+        gloss_list = Gloss.objects.filter(pk__in=tag_index.gloss_ids(tagobj.name))
 
         if ':' in tag:
             taginfo = tag.split(':')
@@ -67,19 +68,19 @@ def tag_dict():
     """Generate a dictionary of tags categorised by their
     category (the part before the colon)"""
 
-    tags = Tag.objects.usage_for_model(Gloss, counts=True)
+    counts = tag_index.counts()
     # build a dictionary of tags under their categories
     cats = dict()
-    for tag in tags:
-        if tag.name.find(':') >= 0:
-            (cat, tagname) = tag.name.split(":", 1)
+    for name in sorted(counts.keys()):
+        if name.find(':') >= 0:
+            (cat, tagname) = name.split(":", 1)
         else:
             cat = "None"
-            tagname = tag.name
+            tagname = name
 
         if cats.has_key(cat):
-            cats[cat].append((tagname, tag.count))
+            cats[cat].append((tagname, counts[name]))
         else:
-            cats[cat] = [(tagname, tag.count)]
+            cats[cat] = [(tagname, counts[name])]
 
     return cats
@@ -0,0 +1,850 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.http import QueryDict
+from django.db.models import F
+from django.contrib.auth.models import User, Permission
+from tagging.models import Tag
+
+from signbank.dictionary.models import Gloss, Keyword, Translation, Definition, Language, Dialect, Region, \
+    Relation, MinimalPair, DuplicateGloss, GlossChange, Generation, normalise_search_key
+from signbank.dictionary import pagecache
+from signbank.dictionary.regional import regional_bundle, composite_name, composite_map, Image
+from signbank.dictionary.featuresearch import feature_queryset, result_page
+from signbank.dictionary.facets import facet_counts
+from signbank.dictionary.neighbours import neighbours
+from signbank.dictionary.minimalpairs import find_minimal_pairs, update_minimal_pairs
+from signbank.dictionary.duplicates import name_key, find_duplicates, update_duplicates, duplicate_keywords
+from signbank.dictionary.ecv import build_ecv
+from signbank.dictionary import packages
+from signbank.dictionary.forms import GlossSearchForm
+from signbank.pages.models import Page
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import datetime
+import time
+import unittest
+from zipfile import ZipFile
+from StringIO import StringIO
+from xml.etree import ElementTree
+from signbank.dictionary.definitionsearch import search_definitions, matching_terms, order_by_relevance, highlight_snippet
+from signbank.dictionary.indexes import keyword_index, keyword_trigram_index, tag_index, dictionary_order, phonology_index, \
+    gloss_completions, edit_distance, bitset_ids
+
+
+class KeywordIndexTests(TestCase):
+
+    def setUp(self):
+
+        published = Gloss.objects.create(idgloss='BANK', sn=1, inWeb=True)
+        hidden = Gloss.objects.create(idgloss='BANKRUPT', sn=2, inWeb=False)
+
+        for i, (gloss, text) in enumerate([(published, 'bank'), (published, 'Banks'),
+                                           (hidden, 'bankrupt'), (published, 'ball')]):
+            kwd = Keyword.objects.create(text=text)
+            Translation.objects.create(gloss=gloss, translation=kwd, index=i)
+
+        # a keyword with no translation is never returned
+        Keyword.objects.create(text='bandage')
+
+    def test_prefix_search(self):
+        """Prefix search ignores case and respects publication"""
+
+        self.assertEqual([k.text for k in keyword_index.search('BAN', staff=True)],
+                         ['bank', 'bankrupt', 'Banks'])
+        self.assertEqual([k.text for k in keyword_index.search('ban')],
+                         ['bank', 'Banks'])
+        self.assertEqual(len(keyword_index.search('x')), 0)
+
+    def test_limit(self):
+        """Results can be bounded"""
+
+        self.assertEqual([k.text for k in keyword_index.search('', staff=True, limit=2)],
+                         ['ball', 'bank'])
+
+    def test_rebuilt_on_change(self):
+        """Publishing a gloss updates the public index"""
+
+        self.assertEqual(len(keyword_index.search('bankr')), 0)
+
+        gloss = Gloss.objects.get(idgloss='BANKRUPT')
+        gloss.inWeb = True
+        gloss.save()
+
+        self.assertEqual([k.text for k in keyword_index.search('bankr')], ['bankrupt'])
+
+    def test_lost_generation(self):
+        """An index is rebuilt after a change even if the row of its
+        generation was lost (eg. rolled back)"""
+
+        self.assertEqual(len(keyword_index.search('bankr')), 0)
+        Generation.objects.filter(key=keyword_index.generation_key).delete()
+
+        gloss = Gloss.objects.get(idgloss='BANKRUPT')
+        gloss.inWeb = True
+        gloss.save()
+
+        self.assertEqual([k.text for k in keyword_index.search('bankr')], ['bankrupt'])
+
+    def test_accents_and_punctuation(self):
+        """Accents, case and punctuation don't affect matching"""
+
+        kwd = Keyword.objects.create(text=u'Café')
+        Translation.objects.create(gloss=Gloss.objects.get(idgloss='BANK'), translation=kwd, index=9)
+
+        self.assertEqual(kwd.text_search, u'cafe')
+        self.assertEqual([k.text for k in keyword_index.search('cafe')], [u'Café'])
+        self.assertEqual([k.text for k in keyword_index.search(u'CAFÉ')], [u'Café'])
+        self.assertEqual(len(keyword_index.search('?')), 0)
+
+    def test_suggestions(self):
+        """Misspelled queries get suggestions"""
+
+        self.assertEqual([k.text for k in keyword_trigram_index.suggest('banck', staff=True)][:1], ['bank'])
+        self.assertNotIn('bankrupt', [k.text for k in keyword_trigram_index.suggest('bankrup')])
+        self.assertIn('bankrupt', [k.text for k in keyword_trigram_index.suggest('bankrup', staff=True)])
+
+    def test_urls(self):
+        """Keyword URLs number the translations of a keyword as the keyword page does"""
+
+        hidden = Gloss.objects.get(idgloss='BANKRUPT')
+        published = Gloss.objects.create(idgloss='BANKRUPT-2', sn=3, inWeb=True)
+        Translation.objects.create(gloss=published, translation=Keyword.objects.get(text='bankrupt'), index=1)
+
+        self.assertEqual(published.get_keyword_and_index(True), ('bankrupt', 2))
+        self.assertEqual(published.get_keyword_and_index(False), ('bankrupt', 1))
+        self.assertEqual(hidden.get_keyword_and_index(False), ("UNKNOWN-OR-MISSING-GLOSS", 0))
+        self.assertEqual(published.translation_set.get().get_absolute_url(), '/dictionary/words/bankrupt-2.html')
+
+    def test_edit_distance(self):
+
+        self.assertEqual(edit_distance('bank', 'bank', 2), 0)
+        self.assertEqual(edit_distance('bank', 'bnak', 2), 2)
+        self.assertEqual(edit_distance('bank', 'bankruptcy', 2), 3)
+
+
+class VisibilityTests(TestCase):
+
+    def setUp(self):
+
+        self.gloss = Gloss.objects.create(idgloss='BLOODY', sn=1, inWeb=True)
+        self.keyword = Keyword.objects.create(text='bloody')
+        Translation.objects.create(gloss=self.gloss, translation=self.keyword, index=1)
+
+    def test_flags(self):
+        """Visibility flags follow publication and the crude tag"""
+
+        kwd = Keyword.objects.get(pk=self.keyword.pk)
+        self.assertTrue(kwd.is_public and kwd.is_public_safe)
+
+        Tag.objects.add_tag(self.gloss, 'lexis:crude')
+        kwd = Keyword.objects.get(pk=self.keyword.pk)
+        self.assertTrue(kwd.is_public)
+        self.assertFalse(kwd.is_public_safe)
+        self.assertEqual(len(keyword_index.search('blo')), 1)
+        self.assertEqual(len(keyword_index.search('blo', safe=True)), 0)
+
+        self.gloss.inWeb = False
+        self.gloss.save()
+        kwd = Keyword.objects.get(pk=self.keyword.pk)
+        self.assertFalse(kwd.is_public or kwd.is_public_safe)
+        self.assertEqual(len(keyword_index.search('blo')), 0)
+
+
+class TagIndexTests(TestCase):
+
+    def setUp(self):
+
+        self.a = Gloss.objects.create(idgloss='A', sn=1)
+        self.b = Gloss.objects.create(idgloss='B', sn=2)
+        self.c = Gloss.objects.create(idgloss='C', sn=3)
+        Tag.objects.add_tag(self.a, 'phonology:alternating')
+        Tag.objects.add_tag(self.b, 'phonology:alternating')
+        Tag.objects.add_tag(self.b, 'lexis:crude')
+
+    def test_filter(self):
+        """Tag filters combine with AND for tags and OR for nottags"""
+
+        glosses = Gloss.objects.all()
+        self.assertEqual(set(tag_index.filter(glosses, tags=['phonology:alternating'])), set([self.a, self.b]))
+        self.assertEqual(list(tag_index.filter(glosses, tags=['phonology:alternating', 'lexis:crude'])), [self.b])
+        self.assertEqual(list(tag_index.filter(glosses, tags=['phonology:alternating'], nottags=['lexis:crude'])), [self.a])
+        self.assertEqual(set(tag_index.filter(glosses, nottags=['lexis:crude', 'phonology:alternating'])), set([self.c]))
+        self.assertEqual(list(tag_index.filter(glosses, tags=['no:such-tag'])), [])
+
+    def test_update(self):
+        """The index follows tagging and untagging"""
+
+        Tag.objects.add_tag(self.c, 'lexis:crude')
+        self.assertEqual(tag_index.gloss_ids('lexis:crude'), sorted([self.b.pk, self.c.pk]))
+        Tag.objects.update_tags(self.b, '')
+        self.assertEqual(tag_index.gloss_ids('lexis:crude'), [self.c.pk])
+        self.assertEqual(tag_index.counts(), {'phonology:alternating': 1, 'lexis:crude': 1})
+
+    def test_bitset_ids(self):
+
+        self.assertEqual(bitset_ids(0), [])
+        self.assertEqual(bitset_ids((1 << 3) | (1 << 40) | (1 << 100)), [3, 40, 100])
+
+
+class PhonologyIndexTests(TestCase):
+
+    def setUp(self):
+
+        phonology_index.invalidate()
+        self.a = Gloss.objects.create(idgloss='ONE', domhndsh='1.1', locprim=2, initial_palm_orientation='Up')
+        self.b = Gloss.objects.create(idgloss='TWO', domhndsh='1.1', locprim=3)
+        self.c = Gloss.objects.create(idgloss='THREE', domhndsh='2.1', locprim=2)
+
+    def ids(self, filters):
+        return sorted(phonology_index.filter(Gloss.objects.all(), filters).values_list('idgloss', flat=True))
+
+    def test_filter(self):
+        """Phonology filters combine with AND, values given as strings"""
+
+        self.assertEqual(self.ids({'domhndsh': '1.1'}), ['ONE', 'TWO'])
+        self.assertEqual(self.ids({'domhndsh': '1.1', 'locprim': '2'}), ['ONE'])
+        self.assertEqual(self.ids({'initial_palm_orientation': 'Up', 'locprim': '3'}), [])
+
+    def test_update(self):
+        """Saving a gloss moves its bits to the new values"""
+
+        self.assertEqual(self.ids({'locprim': '2'}), ['ONE', 'THREE'])
+        self.b.locprim = '2'
+        self.b.save()
+        self.c.delete()
+        self.assertEqual(self.ids({'locprim': '2'}), ['ONE', 'TWO'])
+        self.assertEqual(self.ids({'locprim': '3'}), [])
+
+
+class ImportTests(TestCase):
+
+    def test_indexes_first(self):
+        """The wsgi module and some commands import the indexes before the
+        models, that has to work in a fresh interpreter"""
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.Popen([sys.executable, '-c', 'import signbank.dictionary.indexes'], env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+
+
+class FacetTests(TestCase):
+
+    def setUp(self):
+
+        phonology_index.invalidate()
+        tag_index.invalidate()
+        language = Language.objects.create(name='BSL', description='British Sign Language')
+        self.dialect = Dialect.objects.create(language=language, name='London', description='London')
+        self.a = Gloss.objects.create(idgloss='ONE', domhndsh='1.1', inWeb=True)
+        self.b = Gloss.objects.create(idgloss='TWO', domhndsh='1.1')
+        Gloss.objects.create(idgloss='THREE', domhndsh='2.1', inWeb=True)
+        Region.objects.create(gloss=self.a, dialect=self.dialect, frequency='Most')
+        Tag.objects.add_tag(self.b, 'lexis:crude')
+
+    def test_counts(self):
+        """Facets count the current results and are shown in the search form"""
+
+        get = QueryDict('domhndsh=1.1&page=2')
+        counts = facet_counts(phonology_index.filter(Gloss.objects.all(), {'domhndsh': '1.1'}), get)
+        self.assertEqual(counts['domhndsh'], {'1.1': 2, '2.1': 0})
+        self.assertEqual(counts['inWeb'], {'yes': 1, 'no': 1})
+        self.assertEqual(counts['dialect'], {unicode(self.dialect.pk): 1})
+        self.assertEqual(counts['tags'], {'lexis:crude': 1})
+
+        form = GlossSearchForm(get)
+        form.add_facet_counts(counts)
+        self.assertIn(('1.1', u'Point (2)'), form.fields['domhndsh'].widget.choices)
+        self.assertIn(('lexis:crude', u'lexis:crude (1)'), form.fields['tags'].widget.choices)
+
+        # a change to the glosses invalidates the cached counts
+        Region.objects.create(gloss=self.b, dialect=self.dialect, frequency='Some')
+        counts = facet_counts(phonology_index.filter(Gloss.objects.all(), {'domhndsh': '1.1'}), get)
+        self.assertEqual(counts['dialect'], {unicode(self.dialect.pk): 2})
+
+
+class NeighbourTests(TestCase):
+
+    def setUp(self):
+
+        phonology_index.invalidate()
+        self.sign = Gloss.objects.create(idgloss='SIGN', domhndsh='5.1', locprim=2, final_loc=4)
+        Gloss.objects.create(idgloss='SAME', domhndsh='5.1', locprim=2, final_loc=4)
+        Gloss.objects.create(idgloss='FAMILY', domhndsh='5.3', locprim=2, final_loc=4)
+        Gloss.objects.create(idgloss='PLACE', domhndsh='1.1', locprim=2)
+        Gloss.objects.create(idgloss='OTHER', domhndsh='1.1', locprim=9)
+
+    def test_neighbours(self):
+        """Similar signs are ranked by weighted phonology matches"""
+
+        found = [(Gloss.objects.get(pk=pk).idgloss, score) for pk, score in neighbours(self.sign.pk)]
+        self.assertEqual(found, [('SAME', 10), ('FAMILY', 8), ('PLACE', 3)])
+        self.assertEqual(len(neighbours(self.sign.pk, 1)), 1)
+
+        # an edit to a gloss is seen straight away
+        other = Gloss.objects.get(idgloss='OTHER')
+        other.locprim = 2
+        other.final_loc = 4
+        other.save()
+        found = [(Gloss.objects.get(pk=pk).idgloss, score) for pk, score in neighbours(self.sign.pk)]
+        self.assertEqual(found, [('SAME', 10), ('FAMILY', 8), ('OTHER', 6), ('PLACE', 3)])
+
+
+class MinimalPairTests(TestCase):
+
+    def test_find(self):
+        """Glosses differing in one field are pairs, in two fields they are not"""
+
+        fields = ('domhndsh', 'locprim', 'final_loc')
+        rows = [(1, '1.1', '2', '4'),
+                (2, '5.1', '2', '4'),
+                (3, '5.1', '9', '4'),
+                (4, '5.1', '9', '5'),
+                (5, None, '2', '4')]
+        self.assertEqual(sorted(find_minimal_pairs(rows, fields)),
+                         [(1, 2, 'domhndsh'), (2, 3, 'locprim'), (3, 4, 'final_loc')])
+
+    def test_update(self):
+        """The pairs are stored for the report"""
+
+        a = Gloss.objects.create(idgloss='ONE', domhndsh='1.1', locprim=2, final_loc=4, inWeb=True)
+        b = Gloss.objects.create(idgloss='TWO', domhndsh='1.1', locprim=2, final_loc=5)
+        self.assertEqual(update_minimal_pairs(), 1)
+        pair = MinimalPair.objects.get()
+        self.assertEqual((pair.source, pair.target, pair.parameter), (a, b, 'final_loc'))
+
+
+class DuplicateTests(TestCase):
+
+    def test_name_key(self):
+        """Case, punctuation and a trailing number are ignored"""
+
+        self.assertEqual(name_key('HOUSE'), name_key('house2'))
+        self.assertEqual(name_key('HOUSE'), name_key('House (3)'))
+        self.assertNotEqual(name_key('HOUSE'), name_key('HORSE'))
+
+    def test_find(self):
+        """Only glosses sharing a block are paired, related glosses are left out"""
+
+        phonology = ('1.1', '2', '4')
+        glosses = {1: ('house', frozenset(['house', 'home']), phonology),
+                   2: ('house', frozenset(['house']), None),
+                   3: ('dog', frozenset(['dog']), phonology),
+                   4: ('doggy', frozenset(['dog']), phonology),
+                   5: ('mouse', frozenset(), None)}
+        found = find_duplicates(glosses)
+        self.assertEqual([(a, b, reasons) for a, b, s, reasons in found],
+                         [(3, 4, 'keywords,phonology'), (1, 2, 'name')])
+        self.assertEqual([pair[:2] for pair in find_duplicates(glosses, [(4, 3)])], [(1, 2)])
+
+    def test_update(self):
+        """The pairs are stored for the report, keywords are grouped by search key"""
+
+        a = Gloss.objects.create(idgloss='HOUSE')
+        b = Gloss.objects.create(idgloss='house2')
+        for i, (gloss, text) in enumerate([(a, 'house'), (b, 'House.')]):
+            Translation.objects.create(gloss=gloss, translation=Keyword.objects.create(text=text), index=i)
+        self.assertEqual(update_duplicates(), 1)
+        pair = DuplicateGloss.objects.get()
+        self.assertEqual((pair.source, pair.target, pair.reasons), (a, b, 'name,keywords'))
+        self.assertEqual(duplicate_keywords(), [['House.', 'house']])
+
+
+class DictionaryOrderTests(TestCase):
+
+    def setUp(self):
+
+        # the index may hold glosses from rolled back test transactions
+        dictionary_order.invalidate()
+        self.glosses = [Gloss.objects.create(idgloss=name, sn=sn, inWeb=inWeb)
+                        for name, sn, inWeb in [('A', 10, True), ('B', 20, False), ('C', 30, True)]]
+        Gloss.objects.create(idgloss='UNNUMBERED')
+
+    def test_navigation(self):
+        """Position, total and neighbours for staff and public"""
+
+        (a, b, c) = self.glosses
+        self.assertEqual(dictionary_order.position(c, staff=True), (3, 4))
+        self.assertEqual(dictionary_order.position(c), (2, 2))
+        self.assertEqual(b.navigation(True), {'prev': a, 'next': c})
+        self.assertEqual(a.navigation(False), {'prev': None, 'next': c})
+
+    def test_update(self):
+        """Changes to sn and inWeb are applied to the index"""
+
+        (a, b, c) = self.glosses
+        dictionary_order.get()
+        b.inWeb = True
+        b.sn = 5
+        b.save()
+        self.assertEqual(dictionary_order.position(a), (2, 3))
+        self.assertEqual(a.navigation(False), {'prev': b, 'next': c})
+        c.delete()
+        self.assertEqual(a.navigation(False), {'prev': b, 'next': None})
+        self.assertEqual(dictionary_order.total(True), 3)
+
+
+class GlossCompletionTests(TestCase):
+
+    def setUp(self):
+
+        # the index may hold glosses from rolled back test transactions
+        gloss_completions.invalidate()
+        self.glosses = [Gloss.objects.create(idgloss=name, annotation_idgloss=annotation, sn=sn)
+                        for name, annotation, sn in [('BANK', '', 12), ('BANKER', 'BANK-PERSON', 5),
+                                                     ('AB', 'BA', 1), ('CAT', '', 122)]]
+
+    def complete(self, prefix, limit=20):
+        return [values[1] for values in gloss_completions.complete(prefix, limit)]
+
+    def test_complete(self):
+        """Exact matches come first, then names and then sign numbers, up to the limit"""
+
+        self.assertEqual(self.complete('ba'), ['AB', 'BANK', 'BANKER'])
+        self.assertEqual(self.complete('Bank'), ['BANK', 'BANKER'])
+        self.assertEqual(self.complete('12'), ['BANK', 'CAT'])
+        self.assertEqual(self.complete('b', 2), ['AB', 'BANK'])
+        self.assertEqual(self.complete('1'), ['AB', 'BANK', 'CAT'])
+        self.assertEqual(self.complete(''), [])
+
+    def test_update(self):
+        """Changes to the names and sign number are applied to the index"""
+
+        gloss_completions.get()
+        cat = self.glosses[3]
+        cat.idgloss = 'BANKCAT'
+        cat.sn = 7
+        cat.save()
+        self.assertEqual(self.complete('bankc'), ['BANKCAT'])
+        self.assertEqual(self.complete('7'), ['BANKCAT'])
+        cat.delete()
+        self.assertEqual(self.complete('bankc'), [])
+
+    def test_view(self):
+        """The response can be revalidated with its ETag"""
+
+        user = User.objects.create_user('staff', password='pw')
+        user.user_permissions.add(Permission.objects.get(codename='search_gloss'))
+        self.client.login(username='staff', password='pw')
+
+        response = self.client.get('/dictionary/ajax/gloss/bank')
+        self.assertEqual([g['idgloss'] for g in json.loads(response.content)], ['BANK', 'BANKER'])
+        self.assertTrue('max-age' in response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/dictionary/ajax/gloss/bank', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/dictionary/ajax/gloss/ban')['ETag'], etag)
+
+        self.glosses[0].save()
+        self.assertEqual(self.client.get('/dictionary/ajax/gloss/bank', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.glosses[0].sn = 13
+        self.glosses[0].save()
+        self.assertEqual(self.client.get('/dictionary/ajax/gloss/bank', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+
+        self.gloss = Gloss.objects.create(idgloss='HOUSE', sn=1, inWeb=True)
+        Translation.objects.create(gloss=self.gloss, translation=Keyword.objects.create(text='house'), index=1)
+
+    def test_cache(self):
+        """Pages are served from the cache until something they show changes"""
+
+        first = self.client.get('/dictionary/words/house-1.html')
+
+        # bulk_create sends no signals so the cached page is still served
+        Definition.objects.bulk_create([Definition(gloss=self.gloss, role='general', count=1, text='A place to live')])
+        second = self.client.get('/dictionary/words/house-1.html')
+        self.assertEqual(first.content, second.content)
+
+        Definition.objects.create(gloss=self.gloss, role='general', count=2, text='A home')
+        third = self.client.get('/dictionary/words/house-1.html')
+        self.assertIn('A place to live', third.content)
+        self.assertIn('A home', third.content)
+
+    def test_logged_in(self):
+        """Logged in users get their own page, not a cached one"""
+
+        self.client.get('/dictionary/words/house-1.html')
+        for name in ('Alice', 'Bob'):
+            User.objects.create_user(name.lower(), password='pw', first_name=name)
+            self.client.login(username=name.lower(), password='pw')
+            response = self.client.get('/dictionary/words/house-1.html')
+            self.assertIn(name, response.content)
+        self.assertNotIn('Alice', response.content)
+
+
+class RegionalBundleTests(TestCase):
+
+    def setUp(self):
+
+        self.gloss = Gloss.objects.create(idgloss='BREAD', regional_template='/regions/bread/')
+        language = Language.objects.create(name='BSL', description='British Sign Language')
+        self.north = Dialect.objects.create(language=language, name='North East', description='North East England')
+        self.london = Dialect.objects.create(language=language, name='London', description='London')
+        Region.objects.create(gloss=self.gloss, dialect=self.north, frequency='Most', traditional=True)
+
+    def test_bundle(self):
+        """The bundle is cached until the regions of the gloss or a page change"""
+
+        bundle = regional_bundle(self.gloss)
+        self.assertEqual([r.dialect.name for r in bundle['regions']], ['North East'])
+        self.assertEqual(bundle['images'], ['images/maps/BSL.png', 'images/maps/BSL/NorthEast-traditional.png'])
+        self.assertEqual(bundle['template'], None)
+
+        # just the generation
+        with self.assertNumQueries(1):
+            regional_bundle(self.gloss)
+
+        Region.objects.create(gloss=self.gloss, dialect=self.london, frequency='Some')
+        Page.objects.create(url='/regions/bread/', title='Bread', content='<p>Bread</p>', publish=False)
+
+        bundle = regional_bundle(self.gloss)
+        self.assertEqual([r.dialect.name for r in bundle['regions']], ['London', 'North East'])
+        self.assertEqual(bundle['images'], ['images/maps/BSL.png', 'images/maps/BSL/London.png',
+                                            'images/maps/BSL/NorthEast-traditional.png'])
+        self.assertEqual(bundle['template'], '<p>Bread</p>')
+
+    def test_other_process(self):
+        """A region change is seen by a process with its own copy of the bundle"""
+
+        regional_bundle(self.gloss)
+        # without the signals, as another process would see it
+        Region.objects.bulk_create([Region(gloss=self.gloss, dialect=self.london, frequency='Some')])
+        Generation.objects.filter(key__startswith='dictionary:regional').update(value=F('value') + 1)
+        self.assertEqual(len(regional_bundle(self.gloss)['regions']), 2)
+
+    def test_composite_name(self):
+        """Composite maps are named by the sorted dialect ids and traditional flags
+        and change when a dialect is renamed"""
+
+        regions = list(Region.objects.filter(gloss=self.gloss).select_related('dialect__language'))
+        regions.append(Region(gloss=self.gloss, dialect=self.london, frequency='Some'))
+        name = composite_name(regions)
+        self.assertTrue(name.startswith('images/maps/composite/%dt-%d-' % (self.north.pk, self.london.pk)), name)
+        self.assertEqual(composite_name(regions), name)
+
+        self.london.name = 'Londinium'
+        self.assertNotEqual(composite_name(regions), name)
+
+    @unittest.skipIf(Image is None, "PIL is not installed")
+    def test_composite_size(self):
+        """An overlay that is not the size of the base map is left out"""
+
+        maps = os.path.join('media', 'images', 'maps')
+        Image.new('RGBA', (20, 10), (255, 0, 0, 255)).save(os.path.join(maps, 'Test.png'))
+        self.addCleanup(os.unlink, os.path.join(maps, 'Test.png'))
+        os.mkdir(os.path.join(maps, 'Test'))
+        self.addCleanup(shutil.rmtree, os.path.join(maps, 'Test'))
+        Image.new('RGBA', (30, 30), (0, 0, 255, 255)).save(os.path.join(maps, 'Test', 'Bad.png'))
+
+        language = Language.objects.create(name='Test', description='Test')
+        dialect = Dialect.objects.create(language=language, name='Bad', description='Bad')
+        regions = [Region.objects.create(gloss=self.gloss, dialect=dialect, frequency='Some')]
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with self.settings(MEDIA_ROOT=media):
+            path = composite_map(regions)
+            self.assertNotEqual(path, None)
+            self.assertEqual(Image.open(os.path.join(media, path)).size, (20, 10))
+
+
+class FeatureSearchTests(TestCase):
+
+    def setUp(self):
+
+        for i in range(12):
+            Gloss.objects.create(idgloss='SIGN-%02d' % i, inWeb=True, domhndsh='1.1', locprim='2')
+        Gloss.objects.create(idgloss='OTHER', inWeb=True, domhndsh='2.1', locprim='2')
+
+    def test_pages(self):
+        """Seeking with the page cursors gives the same pages as offsets"""
+
+        glosses = feature_queryset(False, handshape='1.1')
+        result = result_page(glosses, 'test', 1)
+        self.assertEqual(result['count'], 12)
+        self.assertEqual(result['gloss'].idgloss, 'SIGN-00')
+        self.assertEqual(result['page_range'][-2:], [('...', None), (12, Gloss.objects.get(idgloss='SIGN-11').pk)])
+
+        (number, cursor) = result['page_range'][4]
+        result = result_page(glosses, 'test', number, cursor)
+        self.assertEqual((result['number'], result['gloss'].idgloss), (5, 'SIGN-04'))
+        self.assertEqual([p for p, c in result['page_range']], [1, 2, 3, 4, 5, 6, 7, 8, 9, '...', 12])
+        for p, c in result['page_range']:
+            if c is not None:
+                self.assertEqual(Gloss.objects.get(pk=c).idgloss, 'SIGN-%02d' % (p - 1))
+
+        # without a cursor the page is found by offset
+        self.assertEqual(result_page(glosses, 'test', 7)['gloss'].idgloss, 'SIGN-06')
+
+
+class SearchKeyTests(TestCase):
+
+    def test_normalise(self):
+        """Search keys are lower case with accents and punctuation removed"""
+
+        self.assertEqual(normalise_search_key(u'Café'), u'cafe')
+        self.assertEqual(normalise_search_key(u"  O'Clock,  early "), u'oclock early')
+        self.assertEqual(normalise_search_key(None), u'')
+
+    def test_gloss_keys(self):
+        """Gloss search keys are set on save"""
+
+        gloss = Gloss.objects.create(idgloss=u'NAÏVE-2', annotation_idgloss=u'Naïve')
+        self.assertEqual(gloss.idgloss_search, u'naive2')
+        self.assertEqual(gloss.annotation_idgloss_search, u'naive')
+
+
+class DefinitionSearchTests(TestCase):
+
+    def setUp(self):
+
+        self.bank = Gloss.objects.create(idgloss='BANK')
+        self.river = Gloss.objects.create(idgloss='RIVER')
+        self.defn = Definition.objects.create(gloss=self.bank, role='general', count=1,
+                                              text='A place to keep money. Money, money, money.')
+        Definition.objects.create(gloss=self.river, role='note', count=1,
+                                  text='The bank of a river, not money.')
+
+    def test_search(self):
+        """Glosses are found by the words in their definitions and ranked"""
+
+        self.assertEqual(search_definitions('money'), {self.bank.pk: 4, self.river.pk: 1})
+        self.assertEqual(search_definitions('riv bank'), {self.river.pk: 2})
+        self.assertEqual(search_definitions('money', role='note'), {self.river.pk: 1})
+        self.assertEqual(search_definitions('money', published=False), {})
+
+    def test_short_words(self):
+        """Words shorter than MIN_PREFIX_LENGTH match only the same term"""
+
+        self.assertEqual(search_definitions('a'), {self.bank.pk: 1, self.river.pk: 1})
+        self.assertEqual(search_definitions('mo'), {})
+        self.assertEqual(search_definitions('mon'), {self.bank.pk: 4, self.river.pk: 1})
+
+    def test_order(self):
+        """Glosses are ordered by relevance and joins in the queryset don't change it"""
+
+        Region.objects.create(gloss=self.river, dialect=Dialect.objects.create(language=Language.objects.create(name='BSL'),
+                                                                               name='London'))
+        Region.objects.create(gloss=self.river, dialect=Dialect.objects.create(language=Language.objects.get(),
+                                                                               name='North'))
+        qs = Gloss.objects.filter(dialect__language__name='BSL') | Gloss.objects.filter(idgloss='BANK')
+        ranked = order_by_relevance(qs, matching_terms('money'))
+        self.assertEqual([(g.idgloss, g.relevance) for g in ranked], [('BANK', 4), ('RIVER', 1)])
+
+    def test_update(self):
+        """The index follows changes to definitions"""
+
+        self.defn.text = 'A financial institution'
+        self.defn.save()
+        self.assertEqual(search_definitions('money').keys(), [self.river.pk])
+        self.assertEqual(search_definitions('financial').keys(), [self.bank.pk])
+
+    def test_snippet(self):
+
+        self.assertEqual(highlight_snippet('The bank of a river, not money.', 'riv'),
+                         'The bank of a <strong>river</strong>, not money.')
+        self.assertEqual(highlight_snippet('The bank', 'money'), None)
+
+
+class CSVExportTests(TestCase):
+
+    def setUp(self):
+
+        user = User.objects.create_user('exporter', password='pw')
+        for codename in ('search_gloss', 'export_csv', 'view_advanced_properties'):
+            user.user_permissions.add(Permission.objects.get(codename=codename))
+        self.client.login(username='exporter', password='pw')
+
+        self.bank = Gloss.objects.create(idgloss='BANK')
+        self.river = Gloss.objects.create(idgloss='RIVER')
+        for i, text in enumerate(['bank', 'money']):
+            Translation.objects.create(gloss=self.bank, translation=Keyword.objects.create(text=text), index=i)
+        Tag.objects.add_tag(self.bank, 'lexis:crude')
+        Definition.objects.create(gloss=self.bank, role='general', count=1, text='A place to keep money')
+        Definition.objects.create(gloss=self.bank, role='note', count=1, text='Also the side of a river')
+        Definition.objects.create(gloss=self.river, role='general', count=1, text='Flowing water, no money, not money')
+
+    def export(self, query=''):
+        response = self.client.get('/dictionary/list/?format=CSV' + query)
+        self.assertTrue(response.streaming)
+        rows = [line.split(',') for line in ''.join(response.streaming_content).splitlines()]
+        # the id gloss of each row after the header
+        column = rows[0].index('ID Gloss')
+        return rows[0], [row[column] for row in rows[1:]], rows[1:]
+
+    def test_export(self):
+        """Each gloss is a row with its keywords, tags and notes, with note
+        columns for the gloss with the most notes"""
+
+        header, glosses, rows = self.export()
+        self.assertEqual(header.count('Note Text'), 2)
+        self.assertEqual(glosses, ['BANK', 'RIVER'])
+        self.assertTrue('"bank' in rows[0] and ' money"' in rows[0] and 'lexis:crude' in rows[0])
+        self.assertEqual(rows[0][-4:], ['2', 'Published', 'Note', 'Also the side of a river'])
+
+    def test_search(self):
+        """The export follows the search, in order of relevance"""
+
+        self.assertEqual(self.export('&defsearch=money')[1], ['RIVER', 'BANK'])
+        self.assertEqual(self.export('&search=riv')[1], ['RIVER'])
+
+    def test_punctuation_only(self):
+        """A search that normalises to nothing matches nothing"""
+
+        self.assertEqual(self.export('&search=!!!')[1], [])
+        self.assertEqual(self.export('&keyword=%3F')[1], [])
+        self.assertEqual(self.export('&keyword=Bank!')[1], ['BANK'])
+        self.assertEqual(list(feature_queryset(True, term='?')), [])
+
+
+ECV_LANGUAGES = {'CV_ID': 'test', 'include_phonology_and_frequencies': False,
+                 'languages': [{'id': 'eng', 'description': 'Glosses', 'annotation_idgloss_fieldname': 'annotation_idgloss',
+                                'attributes': {'LANG_ID': 'eng', 'LANG_LABEL': 'English (eng)'}}]}
+
+
+class ECVTests(TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(ECV_FILE=os.path.join(self.directory, 'test.ecv'), ECV_SETTINGS=ECV_LANGUAGES)
+        self.settings.enable()
+
+        self.bank = Gloss.objects.create(idgloss='BANK', annotation_idgloss=u'BANKé')
+        Gloss.objects.create(idgloss='HIDDEN', annotation_idgloss='HIDDEN', excludeFromEcv=True)
+        for i, text in enumerate(['bank', 'money']):
+            Translation.objects.create(gloss=self.bank, translation=Keyword.objects.create(text=text), index=i)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def test_build(self):
+        """The file is written when the glosses change and not otherwise"""
+
+        self.assertTrue(build_ecv())
+        entries = ElementTree.parse(os.path.join(self.directory, 'test.ecv')).findall('.//CVE_VALUE')
+        self.assertEqual([(e.text, e.get('DESCRIPTION')) for e in entries], [(u'BANK\xe9', 'bank, money')])
+
+        self.assertFalse(build_ecv())
+        self.assertTrue(build_ecv(force=True))
+
+        Translation.objects.filter(index=1).delete()
+        self.assertTrue(build_ecv())
+        self.assertEqual(sorted(os.listdir(self.directory)), ['test.ecv', 'test.ecv.sha1'])
+
+
+class PackageTests(TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(SIGNBANK_PACKAGES_FOLDER=self.directory + '/', PACKAGE_BUILD_IN_BACKGROUND=False)
+        self.settings.enable()
+
+        self.bank = Gloss.objects.create(idgloss='BANK', annotation_idgloss='BANK')
+        Translation.objects.create(gloss=self.bank, translation=Keyword.objects.create(text='money'), index=0)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def download(self, query='', etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/dictionary/package/' + query, **headers)
+
+    def test_snapshot(self):
+        """The snapshot is served with an ETag until the data changes"""
+
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(packages.snapshot_glosses(packages.current_snapshot())[self.bank.pk]['Translations'], 'money')
+
+        self.assertEqual(self.download(etag=etag).status_code, 304)
+        self.assertEqual(self.download(etag='"other"').status_code, 200)
+
+        # saving without a change gives a new generation but the same content
+        self.bank.save()
+        self.assertEqual(self.download(etag=etag).status_code, 304)
+
+        self.bank.annotation_idgloss = 'BANK-MONEY'
+        self.bank.save()
+        self.assertEqual(self.download(etag=etag).status_code, 200)
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith('.zip')]), 2)
+
+    def test_patch(self):
+        """A patch has the glosses changed since the timestamp and the deleted ones"""
+
+        river = Gloss.objects.create(idgloss='RIVER')
+        gone = Gloss.objects.create(idgloss='GONE')
+        earlier = datetime.datetime(2020, 1, 1, tzinfo=timezone.utc)
+        GlossChange.objects.update(time=earlier)
+
+        user = User.objects.create_superuser('editor', 'editor@example.com', 'pw')
+        self.client.login(username='editor', password='pw')
+        self.client.post('/dictionary/update/gloss/%d' % river.pk, {'id': 'keywords', 'value': 'water, stream'})
+        gone_id = gone.pk
+        gone.delete()
+        self.assertEqual(list(GlossChange.objects.filter(time__gt=earlier).order_by('pk').values_list('gloss_id', 'change')),
+                         [(river.pk, 'keywords'), (river.pk, 'keywords'), (gone_id, 'deleted')])
+
+        since = int(time.time()) - 60
+        archive = ZipFile(StringIO(self.download('?since_timestamp=%d' % since).content))
+        glosses = json.loads(archive.read('glosses.json'))
+        self.assertEqual(glosses.keys(), [str(river.pk)])
+        self.assertEqual(glosses[str(river.pk)]['Translations'], 'water, stream')
+        self.assertEqual(json.loads(archive.read('deleted.json')), [gone_id])
+
+        # before the start of the log all glosses are sent
+        archive = ZipFile(StringIO(self.download('?since_timestamp=1000').content))
+        self.assertEqual(sorted(json.loads(archive.read('glosses.json')).keys()), sorted([str(self.bank.pk), str(river.pk)]))
+
+    def test_log(self):
+        """Saving a gloss or anything that makes it up is logged against the gloss"""
+
+        river = Gloss.objects.create(idgloss='RIVER')
+        GlossChange.objects.all().delete()
+
+        def changes():
+            logged = list(GlossChange.objects.order_by('pk').values_list('gloss_id', 'change'))
+            GlossChange.objects.all().delete()
+            return logged
+
+        river.save()
+        self.assertEqual(changes(), [(river.pk, 'updated')])
+
+        Region.objects.create(gloss=river, dialect=Dialect.objects.create(language=Language.objects.create(name='BSL'),
+                                                                          name='London'))
+        Definition.objects.create(gloss=river, role='general', count=1, text='Flowing water')
+        Relation.objects.create(source=river, target=self.bank, role='antonym')
+        Tag.objects.add_tag(river, 'semantic:water')
+        self.assertEqual(changes(), [(river.pk, 'region'), (river.pk, 'definition'), (river.pk, 'relation'),
+                                     (river.pk, 'tags')])
+
+        # a keyword change is a change to every gloss with it
+        keyword = Keyword.objects.get(text='money')
+        Translation.objects.create(gloss=river, translation=keyword, index=1)
+        changes()
+        keyword.save()
+        self.assertEqual(sorted(changes()), sorted([(river.pk, 'keywords'), (self.bank.pk, 'keywords')]))
+
+    def test_since(self):
+        """A patch has its own ETag"""
+
+        etag = self.download()['ETag']
+        response = self.download('?since_timestamp=1000')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.download('?since_timestamp=1000', response['ETag']).status_code, 304)
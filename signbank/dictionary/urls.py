@@ -3,9 +3,10 @@ from django.contrib.auth.decorators import login_required, permission_required
 
 from signbank.dictionary.models import *
 from signbank.dictionary.forms import *
-from signbank.dictionary.views import feature_search
+from signbank.dictionary.views import feature_search, missing_video_view
 
-from signbank.dictionary.adminviews import GlossListView, GlossDetailView
+from signbank.dictionary.adminviews import GlossListView, GlossDetailView, gloss_neighbours_json, minimal_pairs_view, duplicates_view, \
+    gloss_ajax_complete
 
 
 urlpatterns = patterns('',
@@ -40,9 +41,10 @@ urlpatterns = patterns('',
 
     url(r'^ajax/keyword/(?P<prefix>.*)$', 'signbank.dictionary.views.keyword_value_list'),
     url(r'^ajax/tags/$', 'signbank.dictionary.tagviews.taglist_json'),
-    url(r'^ajax/gloss/(?P<prefix>.*)$', 'signbank.dictionary.adminviews.gloss_ajax_complete', name='gloss_complete'),
+    url(r'^ajax/gloss/(?P<prefix>.*)$', permission_required('dictionary.search_gloss')(gloss_ajax_complete), name='gloss_complete'),
+    url(r'^ajax/neighbours/(?P<glossid>\d+)$', permission_required('dictionary.search_gloss')(gloss_neighbours_json), name='gloss_neighbours'),
 
-    url(r'^missingvideo.html$', 'signbank.dictionary.views.missing_video_view'),
+    url(r'^missingvideo.html$', permission_required('dictionary.search_gloss')(missing_video_view)),
     
     url(r'package/$', 'signbank.dictionary.views.package'),
     url(r'info/$', 'signbank.dictionary.views.info'),
@@ -50,5 +52,7 @@ urlpatterns = patterns('',
     # Admin views
     url(r'^list/$', permission_required('dictionary.search_gloss')(GlossListView.as_view()), name='admin_gloss_list'),
     url(r'^gloss/(?P<pk>\d+)', permission_required('dictionary.search_gloss')(GlossDetailView.as_view()), name='admin_gloss_view'),
+    url(r'^minimalpairs/$', permission_required('dictionary.search_gloss')(minimal_pairs_view), name='minimal_pairs'),
+    url(r'^duplicates/$', permission_required('dictionary.search_gloss')(duplicates_view), name='duplicates'),
 
 )
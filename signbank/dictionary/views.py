@@ -1,4 +1,4 @@
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotModified
 from django.template import Context, RequestContext, loader
 from django.http import Http404
 from django.shortcuts import render_to_response, get_object_or_404
@@ -11,20 +11,28 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils.safestring import mark_safe
 
 from django.utils.encoding import smart_unicode
+from django.utils.http import parse_etags, quote_etag
 
 import os
 import re
 import json
 import time
+from StringIO import StringIO
 from wsgiref.util import FileWrapper
 
 from signbank.dictionary.models import *
 from signbank.dictionary.forms import *
 from signbank.feedback.models import *
 from signbank.pages.models import *
+from signbank.dictionary.pagecache import cache_public_page
+from signbank.dictionary.regional import regional_bundle
+from signbank.dictionary.featuresearch import feature_queryset, result_page
+from signbank.dictionary.indexes import keyword_index, keyword_trigram_index, tag_index, dictionary_order
+from signbank.dictionary import packages
 import signbank.tools
 
 from signbank.video.forms import VideoUploadForGlossForm
+from signbank.video import manifest
 from signbank.log import debug
 
 def login_required_config(f):
@@ -52,32 +60,6 @@ def index(request):
 
 
 
-def map_image_for_regions(regions):
-    """Get the right map images for this region set
-    """
-
-    # Add a map for every unique language and dialect we have
-    # regional information on
-    # This may look odd if there is more than one language
-    images = []
-    for region in regions.all():
-        language_name = region.dialect.language.name.replace(" ", "")
-        dialect_name = region.dialect.name.replace(" ", "")
-        dialect_extension = ""
-        if region.traditional:
-            dialect_extension = "-traditional"
-
-        language_filename = "images/maps/" + language_name + ".png"
-        dialect_filename = "images/maps/" + language_name + "/" + dialect_name + dialect_extension + ".png"
-
-        if language_filename not in images:
-            images.append(language_filename)
-        if dialect_filename not in images:
-            images.append(dialect_filename)
-
-    return images
-
-
 @login_required_config
 def word_and_regional_view(request, keyword, n, viewname):
     """
@@ -100,24 +82,13 @@ def word_and_regional_view(request, keyword, n, viewname):
     # and all the keywords associated with this sign
     allkwds = trans.gloss.translation_set.all()
 
-    videourl = trans.gloss.get_video_url()
-    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, videourl)):
-        videourl = None
+    videourl = trans.gloss.get_existing_video_url()
 
     trans.homophones = trans.gloss.relation_sources.filter(role='homophone')
 
     # work out the number of this gloss and the total number
     gloss = trans.gloss
-    if gloss.sn != None:
-        if request.user.has_perm('dictionary.search_gloss'):
-            glosscount = Gloss.objects.count()
-            glossposn = Gloss.objects.filter(sn__lt=gloss.sn).count()+1
-        else:
-            glosscount = Gloss.objects.filter(inWeb__exact=True).count()
-            glossposn = Gloss.objects.filter(inWeb__exact=True, sn__lt=gloss.sn).count()+1
-    else:
-        glosscount = 0
-        glossposn = 0
+    (glossposn, glosscount) = dictionary_order.position(gloss, request.user.has_perm('dictionary.search_gloss'))
 
     # navigation gives us the next and previous signs
     nav = gloss.navigation(request.user.has_perm('dictionary.search_gloss'))
@@ -132,12 +103,12 @@ def word_and_regional_view(request, keyword, n, viewname):
         update_form = None
         video_form = None
 
-    # Regional list (sorted by dialect name) and regional template contents if this gloss has one
-    regions = sorted(gloss.region_set.all(), key=lambda n: n.dialect.name)
-    try:
-        page = Page.objects.get(url__exact=gloss.regional_template)
-        regional_template_content = mark_safe(page.content)
-    except:
+    # Regional list (sorted by dialect name), map images and regional template contents if this gloss has one
+    bundle = regional_bundle(gloss)
+    regions = bundle['regions']
+    if bundle['template'] is not None:
+        regional_template_content = mark_safe(bundle['template'])
+    else:
         regional_template_content = None
 
     # If we asked for a regional view but there is no regional information available redirect to non regional view
@@ -154,7 +125,8 @@ def word_and_regional_view(request, keyword, n, viewname):
                                'total': total,
                                'matches': range(1, total+1),
                                'navigation': nav,
-                               'dialect_image': map_image_for_regions(gloss.region_set),
+                               'dialect_image': bundle['images'],
+                               'dialect_composite': bundle['composite'],
                                'regions': regions,
                                'regional_template_content': regional_template_content,
                                # lastmatch is a construction of the url for this word
@@ -176,12 +148,14 @@ def word_and_regional_view(request, keyword, n, viewname):
                                context_instance=RequestContext(request))
 
 @login_required_config
+@cache_public_page('keyword', 'keyword')
 def word(request, keyword, n):
     """View of a single keyword that may have more than one sign"""
 
     return word_and_regional_view(request, keyword, n, "words")
 
 @login_required_config
+@cache_public_page('keyword', 'keyword')
 def regional(request, keyword, n):
     """View of a single keyword that may have more than one sign alongside regional information"""
 
@@ -212,8 +186,10 @@ def quiz(request):
       gloss = Gloss.objects.filter(idgloss=idgloss)[0]
       wrong_answers = q[1]
       commonest_region = q[2]
+      bundle = regional_bundle(gloss)
+      regions = bundle['ordered']
       if commonest_region:
-        commonest_region = gloss.region_set.order_by('-frequency').first().dialect.description
+        commonest_region = max(regions, key=lambda r: r.frequency).dialect.description
 
       quiz.append({
         'video_num': gloss.pk,
@@ -222,9 +198,9 @@ def quiz(request):
         'regions_and_frequencies': [[str(x.dialect.description),
                                       str(x.frequency),
                                       str(x.traditional).lower()]
-                                      for x in gloss.region_set.all()],
-        'region_list': [str(x.dialect.description) for x in gloss.region_set.all()],
-        'region_images': map_image_for_regions(gloss.region_set),
+                                      for x in regions],
+        'region_list': [str(x.dialect.description) for x in regions],
+        'region_images': bundle['images'],
         'wrong_answers': wrong_answers,
         'commonest_region': commonest_region,
       })
@@ -238,6 +214,7 @@ def quiz(request):
                               context_instance=RequestContext(request))
 
 @login_required_config
+@cache_public_page('idgloss', 'idgloss')
 def gloss(request, idgloss):
     """View of a gloss - mimics the word view, really for admin use
        when we want to preview a particular gloss"""
@@ -268,20 +245,9 @@ def gloss(request, idgloss):
     else:
         trans = allkwds[0]
 
-    videourl = gloss.get_video_url()
-    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, videourl)):
-        videourl = None
+    videourl = gloss.get_existing_video_url()
 
-    if gloss.sn != None:
-        if request.user.has_perm('dictionary.search_gloss'):
-            glosscount = Gloss.objects.count()
-            glossposn = Gloss.objects.filter(sn__lt=gloss.sn).count()+1
-        else:
-            glosscount = Gloss.objects.filter(inWeb__exact=True).count()
-            glossposn = Gloss.objects.filter(inWeb__exact=True, sn__lt=gloss.sn).count()+1
-    else:
-        glosscount = 0
-        glossposn = 0
+    (glossposn, glosscount) = dictionary_order.position(gloss, request.user.has_perm('dictionary.search_gloss'))
 
     # navigation gives us the next and previous signs
     nav = gloss.navigation(request.user.has_perm('dictionary.search_gloss'))
@@ -307,19 +273,20 @@ def gloss(request, idgloss):
     else:
         lastmatch = False
 
-    # Regional list (sorted by dialect name) and regional template contents if this gloss has one
-    regions = sorted(gloss.region_set.all(), key=lambda n: n.dialect.name)
-    try:
-        page = Page.objects.get(url__exact=gloss.regional_template)
-        regional_template_content = mark_safe(page.content)
-    except:
+    # Regional list (sorted by dialect name), map images and regional template contents if this gloss has one
+    bundle = regional_bundle(gloss)
+    regions = bundle['regions']
+    if bundle['template'] is not None:
+        regional_template_content = mark_safe(bundle['template'])
+    else:
         regional_template_content = None
 
     return render_to_response("dictionary/word.html",
                               {'translation': trans,
                                'definitions': gloss.definitions(),
                                'allkwds': allkwds,
-                               'dialect_image': map_image_for_regions(gloss.region_set),
+                               'dialect_image': bundle['images'],
+                               'dialect_composite': bundle['composite'],
                                'regions': regions,
                                'regional_template_content': regional_template_content,
                                'lastmatch': lastmatch,
@@ -348,8 +315,11 @@ def feature_search(request):
     form = UserSignSearchForm(request.GET.copy())
 
     term = ''
-    glosses = []
+    handshape = ''
+    location = ''
+    glosses = Gloss.objects.none()
     query_valid = False
+    staff = request.user.has_perm('dictionary.search_gloss')
 
     if form.is_valid():
         # need to transcode the query to our encoding
@@ -366,73 +336,34 @@ def feature_search(request):
 
             try:
                 term = smart_unicode(term)
+                glosses = feature_queryset(staff, term, handshape, location)
             except:
                 # if the encoding didn't work this is
                 # a strange unicode or other string
                 # and it won't match anything in the dictionary
-                glosses = []
-
-            if request.user.has_perm('dictionary.search_gloss'):
-                # staff get to see all the glosses
-                glosses = Gloss.objects.filter(translation__isnull=False).distinct()
-            else:
-                # regular users see either everything that's published
-                glosses = Gloss.objects.filter(inWeb__exact=True).distinct()
-
-            if term != '':
-                glosses = glosses.filter(translation__translation__text__istartswith=term)
-
-            if location != '' and location != "-1":
-                glosses = glosses.filter(locprim__exact=location)
-
-            if handshape != '' and handshape != "notset":
-                glosses = glosses.filter(domhndsh__exact=handshape)
-
-
-    paginator = Paginator(glosses, 1)
-    if request.GET.has_key('page'):
-
-        page = request.GET['page']
-        try:
-            result_page = paginator.page(page)
-        except PageNotAnInteger:
-            result_page = paginator.page(1)
-        except EmptyPage:
-            result_page = paginator.page(paginator.num_pages)
-
-    else:
-        result_page = paginator.page(1)
-
+                glosses = Gloss.objects.none()
 
-    span = 4
-    page = result_page.number
+    # page links carry the id of the gloss they show so that we can seek
+    # to it rather than counting through the results
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        number = 1
+    try:
+        cursor = int(request.GET['from'])
+    except (KeyError, ValueError):
+        cursor = None
 
-    first_page = page - span
-    if first_page <= 1:
-      first_page = 1
-      page_range_pre = []
+    if query_valid:
+        signature = u"|".join([str(staff), term, handshape, location])
+        result = result_page(glosses, signature, number, cursor)
     else:
-      page_range_pre = [1]
-      if first_page > 2:
-        page_range_pre += ['...']
-
-    last_page = page + span
-    if last_page >= paginator.num_pages:
-      last_page = paginator.num_pages
-      page_range_post = []
-    else:
-      page_range_post = [paginator.num_pages]
-      if last_page < paginator.num_pages - 1:
-        page_range_post = ['...'] + page_range_post
-
-    page_range = page_range_pre + range(first_page, last_page + 1) + page_range_post
+        result = {'gloss': None, 'number': 1, 'count': 0, 'page_range': []}
 
-
-    if len(result_page.object_list) > 0:
-        gloss = result_page.object_list.first()
-        keyword, index = gloss.get_keyword_and_index(request)
+    gloss = result['gloss']
+    if gloss is not None:
+        keyword, index = gloss.get_keyword_and_index(staff)
     else:
-        gloss = None
         keyword = ''
         index = 0
 
@@ -442,10 +373,9 @@ def feature_search(request):
                                'handshape': handshape,
                                'location': location,
                                'form': form,
-                               'glosscount' : len(glosses),
-                               'paginator' : paginator,
-                               'page' : result_page,
-                               'page_range': page_range,
+                               'glosscount' : result['count'],
+                               'page_number': result['number'],
+                               'page_range': result['page_range'],
                                'gloss': gloss,
                                'keyword': keyword,
                                'index': index,
@@ -460,6 +390,7 @@ def search(request):
     """Handle keyword search form submission"""
 
     form = UserSignSearchForm(request.GET.copy())
+    suggestions = []
 
     if form.is_valid() and len(form.cleaned_data['query']) > 0:
         # need to transcode the query to our encoding
@@ -477,48 +408,34 @@ def search(request):
             # and it won't match anything in the dictionary
             words = []
 
-        if request.user.has_perm('dictionary.search_gloss'):
-            # staff get to see all the words that have at least one translation
-            words = Keyword.objects.filter(text__istartswith=term, translation__isnull=False).distinct()
-        else:
-            # regular users see either everything that's published
-            words = Keyword.objects.filter(text__istartswith=term,
-                                            translation__gloss__inWeb__exact=True).distinct()
-
-        try:
-            crudetag = Tag.objects.get(name='lexis:crude')
-        except:
-            crudetag = None
-
-        if safe and crudetag != None:
-
-            crude = TaggedItem.objects.get_by_model(Gloss, crudetag)
-            # remove crude words from result
-
-            result = []
-            for w in words:
-                # remove word if all glosses for any translation are tagged crude
-                trans = w.translation_set.all()
-                glosses = [t.gloss for t in trans]
-
-                if not all([g in crude for g in glosses]):
-                    result.append(w)
-
-            words = result
-
+        # staff get to see all the words that have at least one translation,
+        # regular users see either everything that's published or, with
+        # safe search, everything that's published and not crude
+        staff = request.user.has_perm('dictionary.search_gloss')
+        words = keyword_index.search(term, staff=staff, safe=safe)
 
         if not category in ['all', '']:
 
-            tag = Tag.objects.get(name=category)
+            # the prefix index doesn't know about categories so we ask the
+            # database for keywords of glosses in the tag index, using the
+            # same visibility flags as the prefix index
+            tagged = tag_index.gloss_ids(category)
+
+            key = normalise_search_key(term)
+            words = Keyword.objects.filter(text_search__startswith=key, translation__gloss__in=tagged)
+            if not key:
+                # nothing but punctuation, don't match everything
+                words = words.none()
+            if not staff:
+                if safe:
+                    words = words.filter(translation__is_public_safe=True)
+                else:
+                    words = words.filter(translation__is_public=True)
+            words = words.distinct().order_by('text_search')
 
-            result = []
-            for w in words:
-                trans = w.translation_set.all()
-                glosses = [t.gloss for t in trans]
-                for g in glosses:
-                    if tag in g.tags:
-                        result.append(w)
-            words = result
+        # if nothing matched, offer keywords with a similar spelling
+        if len(words) == 0:
+            suggestions = keyword_trigram_index.suggest(term, staff=staff, safe=safe)
 
 
     else:
@@ -552,6 +469,7 @@ def search(request):
                                'paginator' : paginator,
                                'wordcount' : len(words),
                                'page' : result_page,
+                               'suggestions': suggestions,
                                'ANON_SAFE_SEARCH': settings.ANON_SAFE_SEARCH,
                                'ANON_TAG_SEARCH': settings.ANON_TAG_SEARCH,
                                'language': settings.LANGUAGE_NAME,
@@ -565,71 +483,73 @@ from django.core import serializers
 
 def keyword_value_list(request, prefix=None):
     """View to generate a list of possible values for
-    a keyword given a prefix."""
+    a keyword given a prefix, at most KEYWORD_COMPLETE_LIMIT
+    are returned."""
 
+    if prefix is None:
+        prefix = ''
 
-    kwds = Keyword.objects.filter(text__startswith=prefix)
+    kwds = keyword_index.search(prefix,
+                                staff=request.user.has_perm('dictionary.search_gloss'),
+                                limit=settings.KEYWORD_COMPLETE_LIMIT)
     kwds_list = [k.text for k in kwds]
     return HttpResponse("\n".join(kwds_list), content_type='text/plain')
 
 
-def missing_video_list():
-    """A list of signs that don't have an
-    associated video file"""
-
-    glosses = Gloss.objects.filter(inWeb__exact=True)
-    for gloss in glosses:
-        if not gloss.has_video():
-            yield gloss
-
 def missing_video_view(request):
-    """A view for the above list"""
+    """A paginated list of published signs that don't have a video,
+    with the video rows whose file is gone and files not used by any
+    video as found by the last update_media_manifest or
+    missing_video_report run"""
 
-    glosses = missing_video_list()
+    paginator = Paginator(manifest.missing_videos(), 100)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
 
     return render_to_response("dictionary/missingvideo.html",
-                              {'glosses': glosses})
+                              {'paginator': paginator,
+                               'page': page,
+                               'reconciled': manifest.last_reconciliation()},
+                              context_instance=RequestContext(request))
 
 @login_required_config
 def package(request):
-    # Don't support small videos or since_timestamp for gloss changes (only video and images) at the moment
+    """The package of gloss data for the mobile apps, served from the
+    current snapshot.  With since_timestamp it is a patch with just the
+    glosses changed since then, the ids of deleted glosses and the videos
+    and images updated since then."""
 
-    first_part_of_file_name = 'signbank_pa'
-
-    timestamp_part_of_file_name = str(int(time.time()))
+    current = packages.snapshot()
 
     if 'since_timestamp' in request.GET:
-        first_part_of_file_name += 'tch'
         since_timestamp = int(request.GET['since_timestamp'])
-        timestamp_part_of_file_name = request.GET['since_timestamp']+'-'+timestamp_part_of_file_name
+        etag = "%s-%d-%d" % (current['etag'], since_timestamp, packages.last_change())
     else:
-        first_part_of_file_name += 'ckage'
-        since_timestamp = 0
-
-    glosses = signbank.tools.get_gloss_data()
-
-    video_and_image_folder = settings.MEDIA_ROOT + "/" + settings.GLOSS_VIDEO_DIRECTORY + "/"
-
-    archive_file_name = '.'.join([first_part_of_file_name,timestamp_part_of_file_name,'zip'])
-    archive_file_path = settings.SIGNBANK_PACKAGES_FOLDER + archive_file_name
-
-    video_urls = {}
-    image_urls = {}
-    for gloss_id in glosses.keys():
-        details = glosses[gloss_id]
-        if "VideoUpdated" in details and details["VideoUpdated"] > since_timestamp:
-            video_urls[gloss_id] = details["VideoLink"]
-        if "ThumnailUpdated" in details and details["ThumnailUpdated"] > since_timestamp:
-            image_urls[gloss_id] = details["ThumbnailLink"]
-
-    collected_data = {'video_urls':video_urls,
-                      'image_urls':image_urls,
-                      'glosses':glosses}
-
-    signbank.tools.create_zip_with_json_files(collected_data,archive_file_path)
+        since_timestamp = None
+        etag = current['etag']
+
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = quote_etag(etag)
+        return response
+
+    if since_timestamp is None:
+        archive_file_name = 'signbank_package.%d.zip' % current['built']
+        response = HttpResponse(FileWrapper(open(current['file'], 'rb')), content_type='application/zip')
+        response['Content-Length'] = os.path.getsize(current['file'])
+    else:
+        archive_file_name = 'signbank_patch.%d-%d.zip' % (since_timestamp, current['built'])
+        collected_data = packages.patch_data(current, since_timestamp)
+        archive = StringIO()
+        signbank.tools.create_zip_with_json_files(collected_data, archive)
+        response = HttpResponse(archive.getvalue(), content_type='application/zip')
 
-    response = HttpResponse(FileWrapper(open(archive_file_path,'rb')), content_type='application/zip')
     response['Content-Disposition'] = 'attachment; filename='+archive_file_name
+    response['ETag'] = quote_etag(etag)
     return response
 
 def info(request):
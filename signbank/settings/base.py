@@ -53,6 +53,9 @@ MEDIA_MOBILE_URL = MEDIA_URL
 
 SIGNBANK_PACKAGES_FOLDER = WRITABLE_FOLDER+'packages/'
 
+# the last missing video report, written by update_media_manifest and missing_video_report
+MISSING_VIDEO_REPORT_FILE = WRITABLE_FOLDER+'missing_video_report.json'
+
 ECV_FILE = os.path.join(MEDIA_ROOT, 'bsl.ecv')
 ECV_SETTINGS = {
     'CV_ID': '',
@@ -238,6 +241,17 @@ ANON_SAFE_SEARCH = False
 ANON_TAG_SEARCH = False
 
 
+# maximum number of keywords returned by the keyword autocomplete view
+KEYWORD_COMPLETE_LIMIT = 20
+
+# how long (seconds) rendered public word and gloss pages are cached,
+# pages are also invalidated whenever the data they show changes
+PAGE_CACHE_TIMEOUT = 60*60*24
+
+# rebuild the package snapshot for the mobile apps in a background thread
+# when the data changes, serving the previous snapshot meanwhile
+PACKAGE_BUILD_IN_BACKGROUND = True
+
 # do we display the previous/next links to signs, requires gloss.sn to be used consistently
 SIGN_NAVIGATION = True
 
@@ -280,6 +294,9 @@ ATTACHMENT_LOCATION = 'attachments'
 # within MEDIA_ROOT we store newly uploaded videos in this directory
 GLOSS_VIDEO_DIRECTORY = "video"
 
+# within MEDIA_ROOT we store the composited regional maps in this directory
+REGION_MAP_DIRECTORY = "images/maps/composite"
+
 # which fields from the Gloss model should be included in the quick update form on the sign view
 QUICK_UPDATE_GLOSS_FIELDS = ['language', 'dialect']
 
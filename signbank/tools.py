@@ -14,12 +14,26 @@ from django.utils.dateformat import format
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 
-def get_gloss_data():
+def get_gloss_data(gloss_ids=None):
+    """The API data of every gloss, or of those with ids in gloss_ids"""
+
+    from signbank.video import manifest
+
+    glosses = Gloss.objects.all().select_related('display_video')
+    translations = Translation.objects.all()
+    if gloss_ids is not None:
+        glosses = glosses.filter(pk__in=list(gloss_ids))
+        translations = translations.filter(gloss__in=list(gloss_ids))
+    media = manifest.lookup_all()
+
+    # the keywords of the glosses in one query, in index order
+    keywords = {}
+    for gloss_id, text in translations.values_list('gloss', 'translation__text'):
+        keywords.setdefault(gloss_id, []).append(text)
 
-    glosses = Gloss.objects.all()
     gloss_data = {}
-    for gloss in glosses:
-        gloss_data[gloss.pk] = gloss.get_fields_dict()
+    for gloss in glosses.iterator():
+        gloss_data[gloss.pk] = gloss.get_fields_dict(media, keywords.get(gloss.pk, []))
 
     return gloss_data
 
@@ -4,6 +4,7 @@ from django.core.exceptions import ImproperlyConfigured
 from django.core.management.base import BaseCommand, CommandError  
 from django.conf import settings
 from signbank.video.models import GlossVideo
+from signbank.dictionary.models import Gloss, update_display_videos
 import os
 
 class Command(BaseCommand):
@@ -58,6 +59,11 @@ def import_existing_gloss_videos(path):
                     print 'skipping ', videofile
     
     transaction.commit_unless_managed()
+
+    # the rows were inserted directly so no signals were sent
+    glosses = list(Gloss.objects.values_list('pk', flat=True))
+    for i in range(0, len(glosses), 500):
+        update_display_videos(glosses[i:i+500])
     
     
     
@@ -0,0 +1,26 @@
+"""Report signs without videos and video files out of step with the database"""
+
+from django.core.management.base import BaseCommand, CommandError
+from signbank.video import manifest
+import json
+
+
+class Command(BaseCommand):
+
+    help = 'print a JSON report of published signs without a video, videos whose file is missing and unused video files'
+    args = ''
+
+    def handle(self, *args, **options):
+
+        # rescan so that the report reflects the filesystem right now
+        (missing_files, unreferenced) = manifest.reconcile(rescan=True)
+
+        report = {
+            'missing_video': [{'id': g.pk, 'idgloss': g.idgloss, 'sn': g.sn}
+                              for g in manifest.missing_videos()],
+            'missing_file': [{'id': v.pk, 'gloss': v.gloss_id, 'path': v.videofile.name, 'version': v.version}
+                             for v in missing_files],
+            'unreferenced_file': unreferenced,
+        }
+
+        print json.dumps(report, indent=4)
@@ -0,0 +1,21 @@
+"""Rebuild the manifest of gloss video files from the media directory"""
+
+from django.core.management.base import BaseCommand, CommandError
+from signbank.video import manifest
+
+
+class Command(BaseCommand):
+
+    help = 'scan GLOSS_VIDEO_DIRECTORY, update the media manifest and the missing video report'
+    args = ''
+
+    def handle(self, *args, **options):
+
+        (added, updated, missing) = manifest.scan()
+        print "Files added:", added
+        print "Files updated:", updated
+        print "Files no longer present:", missing
+
+        (missing_files, unreferenced) = manifest.reconcile()
+        print "Videos whose file is missing:", len(missing_files)
+        print "Files not used by any video:", len(unreferenced)
@@ -0,0 +1,241 @@
+"""A manifest of the gloss video files on disk.
+
+Checking whether a video or its poster image exists used to mean a
+filesystem stat on every page view, slow when the media directory is on
+a network mount.  The MediaFile table records the size and mtime of each
+video file and whether its poster image exists.  It is updated whenever a
+GlossVideo is saved, reverted or deleted and can be rebuilt from a walk of
+GLOSS_VIDEO_DIRECTORY with the update_media_manifest command (eg. after
+copying videos into place by hand).  That command and missing_video_report
+also compare the manifest with the GlossVideo table and write the result
+to MISSING_VIDEO_REPORT_FILE for the missing video page.
+
+Paths are relative to MEDIA_ROOT, as in GlossVideo.videofile.name.  A path
+that is not in the manifest yet is checked on disk once and recorded.  A
+file recorded as missing may turn up later (eg. a sync from another
+server), so those entries are checked again at most every RECHECK_MISSING
+seconds.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.utils.encoding import force_bytes
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from signbank.video.models import MediaFile
+
+RECHECK_MISSING = 5*60
+
+
+def poster_name(path):
+    """The poster image of a video is the same path with a .jpg extension"""
+
+    return os.path.splitext(path)[0] + ".jpg"
+
+
+def stat_file(path):
+    """Return the manifest fields for a path from the filesystem"""
+
+    fields = {'exists': False, 'size': None, 'mtime': None, 'poster': False, 'poster_mtime': None}
+    try:
+        st = os.stat(os.path.join(settings.MEDIA_ROOT, path))
+        fields.update(exists=True, size=st.st_size, mtime=st.st_mtime)
+    except OSError:
+        pass
+    try:
+        st = os.stat(os.path.join(settings.MEDIA_ROOT, poster_name(path)))
+        fields.update(poster=True, poster_mtime=st.st_mtime)
+    except OSError:
+        pass
+    return fields
+
+
+def add(path, fields):
+    """Add the manifest entry for path and return it, two requests can
+    both find a new path missing so if the other one added it first its
+    entry is updated instead"""
+
+    try:
+        with transaction.atomic():
+            return MediaFile.objects.create(path=path, **fields)
+    except IntegrityError:
+        MediaFile.objects.filter(path=path).update(**fields)
+        return MediaFile.objects.get(path=path)
+
+
+def record(path):
+    """Check path on disk and update its manifest entry"""
+
+    fields = stat_file(path)
+    if MediaFile.objects.filter(path=path).update(**fields) == 0:
+        add(path, fields)
+
+
+def recheck_key(path):
+    return 'video:manifest-recheck:%s' % hashlib.md5(force_bytes(path)).hexdigest()
+
+
+def lookup(paths):
+    """Return a dictionary of path to MediaFile for paths, checking
+    the disk for any not yet in the manifest and for those recorded as
+    missing that haven't been checked in the last RECHECK_MISSING seconds"""
+
+    found = dict([(m.path, m) for m in MediaFile.objects.filter(path__in=list(paths))])
+    for path in paths:
+        entry = found.get(path)
+        if entry is None:
+            found[path] = add(path, stat_file(path))
+        elif not entry.exists and cache.add(recheck_key(path), True, RECHECK_MISSING):
+            fields = stat_file(path)
+            if fields['exists']:
+                MediaFile.objects.filter(pk=entry.pk).update(**fields)
+                found[path] = MediaFile(pk=entry.pk, path=path, **fields)
+    return found
+
+
+def lookup_all():
+    """Return a dictionary of path to MediaFile for the whole manifest"""
+
+    return dict([(m.path, m) for m in MediaFile.objects.all()])
+
+
+def exists(path):
+    """Return True if the video file at path exists"""
+
+    return lookup([path])[path].exists
+
+
+def walk():
+    """Generate (path, fields) for each video file under GLOSS_VIDEO_DIRECTORY,
+    fields as for stat_file"""
+
+    root = os.path.join(settings.MEDIA_ROOT, settings.GLOSS_VIDEO_DIRECTORY)
+    for dirpath, dirnames, filenames in os.walk(root):
+        # poster mtimes from the same directory listing
+        posters = dict()
+        for name in filenames:
+            if name.endswith('.jpg'):
+                try:
+                    posters[name] = os.stat(os.path.join(dirpath, name)).st_mtime
+                except OSError:
+                    pass
+
+        for name in filenames:
+            if name.endswith('.jpg'):
+                continue
+            full = os.path.join(dirpath, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            poster = poster_name(name)
+            path = os.path.relpath(full, settings.MEDIA_ROOT)
+            yield (path, {'exists': True, 'size': st.st_size, 'mtime': st.st_mtime,
+                          'poster': poster in posters, 'poster_mtime': posters.get(poster)})
+
+
+def scan():
+    """Rebuild the manifest from the filesystem, returns a tuple
+    (added, updated, missing) of counts"""
+
+    current = lookup_all()
+    seen = set()
+    added = updated = 0
+    new = []
+    for path, fields in walk():
+        seen.add(path)
+        entry = current.get(path)
+        if entry is None:
+            new.append(MediaFile(path=path, **fields))
+            added += 1
+        elif any([getattr(entry, k) != v for k, v in fields.items()]):
+            MediaFile.objects.filter(pk=entry.pk).update(**fields)
+            updated += 1
+    MediaFile.objects.bulk_create(new)
+
+    # anything else in the manifest is no longer on disk
+    gone = [entry.pk for path, entry in current.items() if path not in seen and entry.exists]
+    for i in range(0, len(gone), 500):
+        MediaFile.objects.filter(pk__in=gone[i:i+500]).update(exists=False, size=None, mtime=None,
+                                                              poster=False, poster_mtime=None)
+    return (added, updated, len(gone))
+
+
+def missing_videos():
+    """Return a queryset of the published glosses that have no video, neither
+    a version 0 GlossVideo of their own (checked with a single anti-join)
+    nor one borrowed from a sense 1 homophone"""
+
+    from signbank.dictionary.models import Gloss
+    from signbank.video.models import GlossVideo
+
+    current = GlossVideo.objects.filter(version__exact=0).values('gloss')
+    return Gloss.objects.filter(inWeb__exact=True, display_video__isnull=True).exclude(pk__in=current).order_by('idgloss')
+
+
+def reconcile(rescan=False):
+    """Compare the GlossVideo table with the files in the manifest, if
+    rescan is True the manifest is first rebuilt from the filesystem.
+
+    Returns a tuple (missing_files, unreferenced) where missing_files is
+    a list of GlossVideo rows whose file is not on disk and unreferenced
+    a sorted list of paths of video files that no GlossVideo refers to.
+    The result is also written to MISSING_VIDEO_REPORT_FILE for
+    last_reconciliation()."""
+
+    from signbank.video.models import GlossVideo
+
+    if rescan:
+        scan()
+
+    manifest = dict(MediaFile.objects.values_list('path', 'exists'))
+    videos = list(GlossVideo.objects.all().select_related('gloss').order_by('videofile'))
+    referenced = set([v.videofile.name for v in videos])
+
+    # files not in the manifest yet are checked on disk
+    for path in referenced:
+        if path not in manifest:
+            manifest[path] = lookup([path])[path].exists
+
+    on_disk = set([path for path, present in manifest.items() if present])
+    missing_files = [v for v in videos if v.videofile.name not in on_disk]
+    unreferenced = sorted(on_disk - referenced)
+
+    report = {'time': int(time.time()),
+              'missing_files': [{'id': v.pk, 'idgloss': v.gloss.idgloss if v.gloss else None,
+                                 'path': v.videofile.name, 'version': v.version} for v in missing_files],
+              'unreferenced': unreferenced}
+
+    # written under a temporary name and renamed into place so that the
+    # page never reads a half written report
+    folder = os.path.dirname(settings.MISSING_VIDEO_REPORT_FILE)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    (fd, tmp) = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(report, f)
+    os.rename(tmp, settings.MISSING_VIDEO_REPORT_FILE)
+
+    return (missing_files, unreferenced)
+
+
+def last_reconciliation():
+    """The result of the last reconcile() for the missing video page, a
+    dictionary with the time it was run, missing_files (a list of
+    dictionaries with the id, idgloss, path and version of each video) and
+    unreferenced, or None if there hasn't been one"""
+
+    try:
+        with open(settings.MISSING_VIDEO_REPORT_FILE) as f:
+            report = json.load(f)
+    except (IOError, ValueError):
+        return None
+    report['time'] = datetime.datetime.fromtimestamp(report['time'])
+    return report
@@ -9,7 +9,10 @@ import sys, os, time, shutil
 from convertvideo import extract_median_frame, convert_video, ffmpeg
 
 from django.core.files.storage import FileSystemStorage
-from signbank.dictionary.models import Gloss
+from django.db.models.signals import post_save, post_delete
+from signbank.dictionary.models import Gloss, update_display_videos, log_gloss_change
+from signbank.dictionary.pagecache import invalidate_gloss_pages
+from signbank.dictionary import facets, packages
 
 
 class VideoPosterMixin:
@@ -28,6 +31,17 @@ class VideoPosterMixin:
         #self.ensure_mp4()
 
 
+    def has_poster(self, poster_path):
+        """Return True if the poster image exists, subclasses
+        may override this to avoid the filesystem check"""
+
+        return os.path.exists(poster_path)
+
+    def poster_created(self):
+        """Called after a poster image has been generated"""
+
+        pass
+
     def poster_path(self, create=True, overwrite=False):
         """Return the path of the poster image for this
         video, if create=True, create the image if needed
@@ -36,10 +50,11 @@ class VideoPosterMixin:
         vidpath, ext = os.path.splitext(self.videofile.path)
         poster_path = vidpath + ".jpg"
 
-        if overwrite or (not os.path.exists(poster_path)):
+        if overwrite or (not self.has_poster(poster_path)):
             if create:
                 # need to create the image
                 extract_median_frame(self.videofile.path, poster_path)
+                self.poster_created()
             else:
                 return None
 
@@ -49,7 +64,8 @@ class VideoPosterMixin:
         """Return the URL of the poster image for this video"""
 
         # generate the poster image if needed
-        path = self.poster_path(create)
+        if create:
+            path = self.poster_path(create)
 
         # splitext works on urls too!
         vidurl, ext = os.path.splitext(self.videofile.url)
@@ -179,6 +195,7 @@ class GlossVideo(models.Model, VideoPosterMixin):
 
         # now do the renaming
 
+        oldname = self.videofile.name
         os.rename(os.path.join(storage.location, self.videofile.name), os.path.join(storage.location, newname))
         # also remove the post image if present, it will be regenerated
         poster = self.poster_path(create=False)
@@ -186,7 +203,79 @@ class GlossVideo(models.Model, VideoPosterMixin):
             os.unlink(poster)
         self.videofile.name = newname
         self.save()
+        manifest.record(oldname)
+
+
+    def file_info(self):
+        """Return the MediaFile manifest entry for the video file"""
+
+        return manifest.lookup([self.videofile.name])[self.videofile.name]
 
+    def has_poster(self, poster_path):
+        return self.file_info().poster
+
+    def poster_created(self):
+        manifest.record(self.videofile.name)
 
     def __unicode__(self):
         return self.videofile.name
+
+
+class MediaFile(models.Model):
+    """A gloss video file as last seen on disk, with its poster image.
+    These rows are a manifest of the media directory so that views don't
+    need to check the (possibly network mounted) filesystem, they are
+    maintained by signbank.video.manifest"""
+
+    # path relative to MEDIA_ROOT, the same as GlossVideo.videofile.name
+    path = models.CharField(max_length=255, unique=True)
+    exists = models.BooleanField(default=False)
+    size = models.BigIntegerField(null=True)
+    mtime = models.FloatField(null=True)
+    poster = models.BooleanField(default=False)
+    poster_mtime = models.FloatField(null=True)
+
+    def __unicode__(self):
+        return self.path
+
+
+def update_manifest(sender, instance, **kwargs):
+    """Record the current state of a video file in the manifest"""
+
+    manifest.record(instance.videofile.name)
+
+
+def update_gloss_display_video(sender, instance, **kwargs):
+    """A new, reverted or deleted video changes the video shown for its gloss"""
+
+    if instance.gloss_id is not None:
+        update_display_videos([instance.gloss_id])
+
+
+def log_video_change(sender, instance, **kwargs):
+    """A new, reverted or deleted video is a change to its gloss"""
+
+    if instance.gloss_id is not None:
+        log_gloss_change(instance.gloss_id, 'video')
+
+
+import manifest
+
+post_save.connect(update_manifest, sender=GlossVideo, dispatch_uid='manifest_save_GlossVideo')
+post_delete.connect(update_manifest, sender=GlossVideo, dispatch_uid='manifest_delete_GlossVideo')
+post_save.connect(update_gloss_display_video, sender=GlossVideo, dispatch_uid='display_video_save_GlossVideo')
+post_delete.connect(update_gloss_display_video, sender=GlossVideo, dispatch_uid='display_video_delete_GlossVideo')
+post_save.connect(log_video_change, sender=GlossVideo, dispatch_uid='gloss_change_save_GlossVideo')
+post_delete.connect(log_video_change, sender=GlossVideo, dispatch_uid='gloss_change_delete_GlossVideo')
+
+# a new or replaced video changes the public pages of the gloss
+post_save.connect(invalidate_gloss_pages, sender=GlossVideo, dispatch_uid='page_cache_save_GlossVideo')
+post_delete.connect(invalidate_gloss_pages, sender=GlossVideo, dispatch_uid='page_cache_delete_GlossVideo')
+
+# and the has video facet counts of the gloss list
+post_save.connect(facets.membership_index.invalidate, sender=GlossVideo, dispatch_uid='membership_index_save_GlossVideo')
+post_delete.connect(facets.membership_index.invalidate, sender=GlossVideo, dispatch_uid='membership_index_delete_GlossVideo')
+
+# and the package snapshot for the mobile apps
+post_save.connect(packages.invalidate, sender=GlossVideo, dispatch_uid='package_save_GlossVideo')
+post_delete.connect(packages.invalidate, sender=GlossVideo, dispatch_uid='package_delete_GlossVideo')
@@ -1,8 +1,14 @@
 from django.utils import unittest
+from django.test import TestCase
 from django.core.files import File
 from django.conf import settings
-from models import Video, GlossVideo
-import os, shutil
+from django.contrib.auth.models import User, Permission
+from django.test.utils import override_settings
+from django.core.cache import cache
+from models import Video, GlossVideo, MediaFile
+from signbank.dictionary.models import Gloss, Relation, resolve_videos
+import manifest
+import os, shutil, tempfile
 
 class VideoTests(unittest.TestCase):
 
@@ -54,6 +60,121 @@ class VideoTests(unittest.TestCase):
         
         # do it again should give the same result, but won't have created the file
         poster2 = vid.poster_path()
-        self.assertEqual(poster, poster2) 
+        self.assertEqual(poster, poster2)
 
-        
\ No newline at end of file
+    def test_manifest(self):
+        """The media manifest follows gloss video files"""
+
+        gloss = Gloss.objects.create(idgloss='MANIFEST', sn=12345)
+        vid = GlossVideo.objects.create(videofile=self.videofile, gloss=gloss)
+        self.addCleanup(vid.delete_files)
+
+        info = MediaFile.objects.get(path=vid.videofile.name)
+        self.assertTrue(info.exists)
+        self.assertFalse(info.poster)
+        self.assertEqual(info.size, os.path.getsize(self.vidfilename))
+        gloss = Gloss.objects.get(pk=gloss.pk)
+        self.assertEqual(gloss.get_existing_video_url(), vid.get_absolute_url())
+
+        # a poster copied into place is found by a scan
+        poster = manifest.poster_name(vid.videofile.path)
+        shutil.copy(self.vidfilename, poster)
+        manifest.scan()
+        self.assertTrue(vid.file_info().poster)
+        self.assertEqual(vid.poster_path(create=False), poster)
+
+        vid.delete_files()
+        manifest.record(vid.videofile.name)
+        self.assertFalse(manifest.exists(vid.videofile.name))
+        self.assertEqual(gloss.get_existing_video_url(), None)
+
+
+class DisplayVideoTests(TestCase):
+
+    def setUp(self):
+
+        self.videofile = File(open("signbank/video/testmedia/video.mp4"), "54321.mp4")
+        self.root = Gloss.objects.create(idgloss='ROOT', sense=1)
+        self.sense2 = Gloss.objects.create(idgloss='ROOT-2', sense=2)
+        Relation.objects.create(source=self.sense2, target=self.root, role='homophone')
+
+    def test_display_video(self):
+        """Senses > 1 show the video of their sense 1 homophone"""
+
+        vid = GlossVideo.objects.create(videofile=self.videofile, gloss=self.root)
+        self.addCleanup(vid.delete_files)
+
+        self.assertEqual(Gloss.objects.get(pk=self.root.pk).get_video(), vid)
+        self.assertEqual(Gloss.objects.get(pk=self.sense2.pk).get_video(), vid)
+
+        glosses = list(Gloss.objects.all())
+        with self.assertNumQueries(2):
+            videos = resolve_videos(glosses)
+        self.assertEqual(videos, {self.root.pk: vid, self.sense2.pk: vid})
+
+        # replacing the video moves the old one to version 1
+        vid.reversion()
+        self.assertEqual(Gloss.objects.get(pk=self.sense2.pk).get_video(), None)
+
+    @override_settings(MISSING_VIDEO_REPORT_FILE=os.path.join(tempfile.gettempdir(), 'signbank_test_missing_video.json'))
+    def test_report(self):
+        """Missing videos and files are reported"""
+
+        self.addCleanup(os.unlink, settings.MISSING_VIDEO_REPORT_FILE)
+
+        missing = Gloss.objects.create(idgloss='MISSING', inWeb=True)
+        vid = GlossVideo.objects.create(videofile=self.videofile, gloss=self.root)
+        self.addCleanup(vid.delete_files)
+
+        Gloss.objects.filter(pk__in=[self.root.pk, self.sense2.pk]).update(inWeb=True)
+        self.assertEqual(list(manifest.missing_videos()), [missing])
+
+        vid.delete_files()
+        (missing_files, unreferenced) = manifest.reconcile(rescan=True)
+        self.assertEqual(missing_files, [vid])
+        self.assertNotIn(vid.videofile.name, unreferenced)
+
+        # the page shows the last report without checking the files itself
+        self.assertEqual(manifest.last_reconciliation()['missing_files'],
+                         [{'id': vid.pk, 'idgloss': 'ROOT', 'path': vid.videofile.name, 'version': 0}])
+        self.assertEqual(self.client.get('/dictionary/missingvideo.html').status_code, 302)
+        user = User.objects.create_user('staff', password='pw')
+        user.user_permissions.add(Permission.objects.get(codename='search_gloss'))
+        self.client.login(username='staff', password='pw')
+        response = self.client.get('/dictionary/missingvideo.html')
+        self.assertContains(response, vid.videofile.name)
+
+
+class ManifestTests(TestCase):
+
+    def setUp(self):
+
+        self.path = os.path.join(settings.GLOSS_VIDEO_DIRECTORY, 'manifest', 'missing.mp4')
+        self.full = os.path.join(settings.MEDIA_ROOT, self.path)
+        self.addCleanup(cache.delete, manifest.recheck_key(self.path))
+
+    def test_added_concurrently(self):
+        """A path added by another request first is updated, not an error"""
+
+        MediaFile.objects.create(path=self.path, exists=True, size=1)
+        entry = manifest.add(self.path, manifest.stat_file(self.path))
+        self.assertFalse(entry.exists)
+        self.assertEqual(MediaFile.objects.filter(path=self.path).count(), 1)
+
+    def test_recheck_missing(self):
+        """A file recorded as missing is found when it turns up"""
+
+        self.assertFalse(manifest.exists(self.path))
+
+        os.makedirs(os.path.dirname(self.full))
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.full))
+        shutil.copy("signbank/video/testmedia/video.mp4", self.full)
+
+        self.assertTrue(manifest.exists(self.path))
+        self.assertTrue(MediaFile.objects.get(path=self.path).exists)
+
+        # checked at most every RECHECK_MISSING seconds
+        os.unlink(self.full)
+        manifest.record(self.path)
+        shutil.copy("signbank/video/testmedia/video.mp4", self.full)
+        self.assertFalse(manifest.exists(self.path))
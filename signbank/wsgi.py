@@ -29,6 +29,10 @@ else:
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# build the in-memory search indexes before the first request arrives
+from signbank.dictionary.indexes import warm_indexes
+warm_indexes()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)